@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+METRIC_KINDS = ('hits', 'misses')
+
+
+def response_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def new_cache_version():
+    return uuid.uuid4().hex
+
+
+def user_cache_version(user_id):
+    """
+    Current version of a user's cached responses, replacing it invalidates all of them at once.
+    Versions are random, a version culled from the cache is replaced by a new one instead of
+    restarting a counter that older responses were stored under.
+    """
+    return response_cache().get_or_set(f'response_version:{user_id}', new_cache_version, timeout=None)
+
+
+def invalidate_user_responses(user_id):
+    """
+    Invalidate the cached responses of a user. Model signals call it for saves and deletes,
+    writes through update(), bulk_create() or bulk_update() have to call it themselves.
+    """
+    if user_id is None:
+        return
+    response_cache().set(f'response_version:{user_id}', new_cache_version(), timeout=None)
+
+
+# Hit and miss counts of this process not yet added to the shared counters, keyed by (view name, kind)
+unflushed_metrics = Counter()
+metrics_lock = threading.Lock()
+last_metrics_flush = time.monotonic()
+
+
+def record_metric(view_name, kind):
+    """
+    Count a hit or miss in process memory, the counts are added to the shared counters in the
+    response cache every RESPONSE_CACHE_METRICS_FLUSH_INTERVAL seconds instead of on every request.
+    """
+    with metrics_lock:
+        unflushed_metrics[(view_name, kind)] += 1
+        if time.monotonic() - last_metrics_flush < settings.RESPONSE_CACHE_METRICS_FLUSH_INTERVAL:
+            return
+    flush_metrics()
+
+
+def flush_metrics():
+    """
+    Add the counts of this process to the shared counters, one cache update per view and kind.
+    """
+    global last_metrics_flush
+    with metrics_lock:
+        counts = dict(unflushed_metrics)
+        unflushed_metrics.clear()
+        last_metrics_flush = time.monotonic()
+
+    cache = response_cache()
+    for (view_name, kind), count in counts.items():
+        key = f'response_metric:{view_name}:{kind}'
+        try:
+            if not cache.add(key, count, timeout=None):
+                cache.incr(key, count)
+        except Exception as e:
+            logger.warning(f"Failed to store the response cache metric {key}: {e}")
+
+
+def cache_metrics(view_names):
+    """
+    Hits, misses and hit rate of the cached views since the counters were created. Counts of other
+    processes are included once they flushed them, at most RESPONSE_CACHE_METRICS_FLUSH_INTERVAL seconds late.
+    """
+    flush_metrics()
+    cache = response_cache()
+    metrics = {}
+    for view_name in view_names:
+        counts = {kind: cache.get(f'response_metric:{view_name}:{kind}', 0) for kind in METRIC_KINDS}
+        total = counts['hits'] + counts['misses']
+        metrics[view_name] = {**counts, 'hit_rate': counts['hits'] / total if total else None}
+    return metrics
+
+
+# Names of the views wrapped with cache_response_per_user, used for the metrics
+CACHED_VIEWS = []
+
+
+def cache_response_per_user(view):
+    """
+    Cache the successful responses of a GET view per user and query string. Entries are keyed with the
+    user's cache version, which is replaced whenever data shown by these views changes.
+    Apply below @api_view and @permission_classes.
+    """
+    view_name = view.__name__
+    CACHED_VIEWS.append(view_name)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return view(request, *args, **kwargs)
+
+        query = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = f'response:{view_name}:{request.user.id}:{user_cache_version(request.user.id)}:{query}'
+        cache = response_cache()
+
+        data = cache.get(key)
+        if data is not None:
+            record_metric(view_name, 'hits')
+            return Response(data)
+
+        record_metric(view_name, 'misses')
+        response = view(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    return wrapper
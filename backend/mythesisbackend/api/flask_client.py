@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying, the service is restarting or overloaded. Other errors concern the
+# image itself (422) or a bug (500), they are neither retried nor counted by the circuit breaker
+RETRY_STATUS_CODES = (502, 503, 504)
+
+
+class FlaskServiceError(Exception):
+    pass
+
+
+class CircuitOpenError(FlaskServiceError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to the Flask service after failure_threshold consecutive failures.
+    Once reset_timeout seconds have passed a single trial request is let through, its outcome
+    closes the circuit again or keeps it open for another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        with self.lock:
+            return self.opened_at is not None and (self.trial_running or time.monotonic() - self.opened_at < self.reset_timeout)
+
+    def allow_request(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_running or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def abort_request(self):
+        """
+        A request ended without an outcome (e.g. it was cancelled), the next one becomes the trial request.
+        """
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_running:
+                    logger.warning(f"Flask service failed {self.failures} times in a row, pausing requests for {self.reset_timeout}s")
+                self.opened_at = time.monotonic()
+                self.trial_running = False
+
+
+circuit_breaker = CircuitBreaker(settings.FLASK_CIRCUIT_FAILURE_THRESHOLD, settings.FLASK_CIRCUIT_RESET_TIMEOUT)
+
+
+def create_client(max_connections):
+    """
+    Pooled AsyncClient for the Flask service, keeping up to max_connections connections alive.
+    """
+    return httpx.AsyncClient(
+        base_url=settings.FLASK_SERVICE_URL,
+        timeout=httpx.Timeout(settings.FLASK_REQUEST_TIMEOUT, connect=settings.FLASK_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+    )
+
+
+async def post_image(client, image_name, image_content, data):
+    """
+    Send an image to the /process_images endpoint and return the decoded JSON response.
+
+    Connection errors, timeouts and 502, 503 and 504 responses are retried up to FLASK_MAX_RETRIES times with
+    exponential backoff and full jitter, so retries of many in-flight images do not arrive at once.
+    Raises CircuitOpenError without sending anything while the circuit breaker is open and
+    FlaskServiceError if the image could not be processed.
+    """
+    error = None
+    for attempt in range(settings.FLASK_MAX_RETRIES + 1):
+        if attempt > 0:
+            await asyncio.sleep(random.uniform(0, settings.FLASK_RETRY_BACKOFF * 2 ** (attempt - 1)))
+        if not circuit_breaker.allow_request():
+            raise CircuitOpenError("The Flask service is unavailable")
+
+        try:
+            response = await client.post('/process_images', files={'image': (image_name, image_content, 'image/png')}, data=data)
+        except httpx.TransportError as e:
+            error = e
+        except asyncio.CancelledError:
+            circuit_breaker.abort_request()
+            raise
+        else:
+            if response.status_code == 200:
+                circuit_breaker.record_success()
+                return response.json()
+            if response.status_code not in RETRY_STATUS_CODES:
+                # The service is up but could not process this image, retrying will not help
+                circuit_breaker.record_success()
+                raise FlaskServiceError(f"Flask service returned {response.status_code}: {response.text}")
+            error = FlaskServiceError(f"Flask service returned {response.status_code}")
+
+        circuit_breaker.record_failure()
+        logger.warning(f"Request for {image_name} failed (attempt {attempt + 1}): {error}")
+
+    raise FlaskServiceError(f"Giving up on {image_name} after {settings.FLASK_MAX_RETRIES + 1} attempts: {error}")
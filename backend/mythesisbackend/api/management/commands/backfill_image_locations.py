@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from api.caching import invalidate_user_responses
+from api.models import FieldImage, UAVFlight
+from api.utils import get_image_metadata, gps_point, parse_altitude
+
+
+class Command(BaseCommand):
+    help = 'Populate FieldImage.location and altitude from the GPS strings of existing images, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of images updated per query.')
+        parser.add_argument('--reread-exif', action='store_true',
+                            help='Read the altitude again from the EXIF data of the stored files, older ingests dropped the denominator of the rational value.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        reread_exif = options['reread_exif']
+        images = FieldImage.objects.exclude(gps_latitude__isnull=True).order_by('id')
+        if not reread_exif:
+            images = images.filter(Q(location__isnull=True) | Q(altitude__isnull=True))
+
+        last_id, updated, skipped = 0, 0, 0
+        uav_flight_ids = set()
+        while True:
+            # Keyset pagination keeps every batch query cheap, also for images that cannot be parsed
+            batch = list(images.filter(id__gt=last_id).only('id', 'uav_flight_id', 'image', 'gps_latitude', 'gps_longitude', 'gps_altitude', 'location', 'altitude')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            changed = []
+            for field_image in batch:
+                if reread_exif:
+                    field_image.gps_altitude, field_image.altitude = self.read_exif_altitude(field_image)
+                field_image.location = field_image.location or gps_point(field_image.gps_latitude, field_image.gps_longitude)
+                field_image.altitude = field_image.altitude if field_image.altitude is not None else parse_altitude(field_image.gps_altitude)
+                if field_image.location is None and field_image.altitude is None:
+                    skipped += 1
+                else:
+                    changed.append(field_image)
+                    uav_flight_ids.add(field_image.uav_flight_id)
+
+            FieldImage.objects.bulk_update(changed, ['location', 'altitude', 'gps_altitude'] if reread_exif else ['location', 'altitude'])
+            updated += len(changed)
+            self.stdout.write(f'Updated {updated} images ({skipped} without usable GPS data)')
+
+        # bulk_update sends no post_save
+        for owner_id in set(UAVFlight.objects.filter(id__in=uav_flight_ids).values_list('owner_id', flat=True)):
+            invalidate_user_responses(owner_id)
+        self.stdout.write(self.style.SUCCESS(f'Backfill finished: {updated} images updated, {skipped} skipped'))
+
+    def read_exif_altitude(self, field_image):
+        try:
+            with field_image.image.open('rb') as image_file:
+                gps_altitude = get_image_metadata(image_file)['gps_altitude']
+        except (OSError, ValueError) as e:
+            self.stderr.write(f'Could not read FieldImage {field_image.id}: {e}')
+            return field_image.gps_altitude, field_image.altitude
+        return gps_altitude, parse_altitude(gps_altitude)
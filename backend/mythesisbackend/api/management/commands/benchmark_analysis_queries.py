@@ -0,0 +1,122 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+from api.models import AnalysisJob, FieldImage, ProcessingResult, UAVFlight, User
+
+BENCHMARK_USERNAME = 'benchmark_user'
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a synthetic dataset and report query plans and timings of the hot analysis queries, '
+        'once with the indexes and constraints of AnalysisJob and ProcessingResult and once without them. '
+        'The indexes are dropped inside a rolled back transaction, which locks the tables: only run this on a development database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, default=20, help='Number of synthetic UAV flights.')
+        parser.add_argument('--images-per-flight', type=int, default=500, help='Number of images per flight.')
+        parser.add_argument('--processed-fraction', type=float, default=0.8, help='Fraction of the images with a completed analysis.')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs per query.')
+        parser.add_argument('--show-plans', action='store_true', help='Print the EXPLAIN ANALYZE output of every query.')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic data instead of deleting it at the end.')
+
+    def handle(self, *args, **options):
+        user = self.seed(options['flights'], options['images_per_flight'], options['processed_fraction'])
+        queries = self.hot_queries(user)
+        try:
+            self.stdout.write(self.style.MIGRATE_HEADING('With indexes'))
+            with_indexes = self.run_queries(queries, options['repeat'], options['show_plans'])
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Without indexes'))
+            with transaction.atomic():
+                self.drop_indexes()
+                without_indexes = self.run_queries(queries, options['repeat'], options['show_plans'])
+                transaction.set_rollback(True)
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Summary (median ms)'))
+            for name in queries:
+                self.stdout.write(f'{name:<40} without: {without_indexes[name]:>9.2f}  with: {with_indexes[name]:>9.2f}')
+        finally:
+            if not options['keep']:
+                user.delete()
+
+    def seed(self, num_flights, images_per_flight, processed_fraction):
+        User.objects.filter(username=BENCHMARK_USERNAME).delete()
+        user = User.objects.create_user(username=BENCHMARK_USERNAME, password=None, email='benchmark@example.com')
+        flights = UAVFlight.objects.bulk_create([UAVFlight(owner=user, flight_date=timezone.now()) for _ in range(num_flights)])
+
+        processed_count = int(images_per_flight * processed_fraction)
+        for flight in flights:
+            images = FieldImage.objects.bulk_create([
+                FieldImage(uav_flight=flight, image=f'field_images/benchmark_{flight.id}_{i}.jpg') for i in range(images_per_flight)
+            ], batch_size=1000)
+            processed, pending = images[:processed_count], images[processed_count:]
+            ProcessingResult.objects.bulk_create([
+                ProcessingResult(image=image, generated_image=f'generated_images/benchmark_{image.id}.png',
+                                 result_data={'background': 80.0, 'sorghum': 15.0, 'weeds': 5.0, 'total_pixels': 1000000})
+                for image in processed
+            ], batch_size=1000)
+            AnalysisJob.objects.bulk_create(
+                [AnalysisJob(owner=user, uav_flight=flight, field_image=image, status='completed') for image in processed] +
+                [AnalysisJob(owner=user, uav_flight=flight, field_image=image, status='pending') for image in pending],
+                batch_size=1000
+            )
+
+        # Fresh statistics so the planner sees the real table sizes
+        with connection.cursor() as cursor:
+            for model in (FieldImage, ProcessingResult, AnalysisJob):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+
+        self.stdout.write(f'Seeded {num_flights} flights with {images_per_flight} images each')
+        return user
+
+    def hot_queries(self, user):
+        uav_flight = UAVFlight.objects.filter(owner=user).first()
+        images = FieldImage.objects.filter(uav_flight=uav_flight)
+        return {
+            # start_analysis: images without a result and without an active or completed job
+            'start_analysis unprocessed images': lambda: images.exclude(
+                Exists(ProcessingResult.objects.filter(image=OuterRef('pk')))
+            ).exclude(
+                Exists(AnalysisJob.objects.filter(field_image=OuterRef('pk'), status__in=['pending', 'processing', 'completed']))
+            ).values('id'),
+            'generated images of a flight': lambda: ProcessingResult.objects.filter(
+                image__uav_flight=uav_flight, generated_image__isnull=False
+            ).select_related('image').order_by('id'),
+            'flights with completed analysis': lambda: UAVFlight.objects.filter(
+                images__in=FieldImage.objects.filter(Exists(ProcessingResult.objects.filter(image=OuterRef('pk'), generated_image__isnull=False))),
+                owner=user
+            ).distinct(),
+            'pending jobs of a flight': lambda: AnalysisJob.objects.filter(uav_flight=uav_flight, status='pending').order_by('id').values('id'),
+            'analysis status per flight': lambda: AnalysisJob.objects.filter(owner=user).values('uav_flight').annotate(
+                total=Count('id'), pending=Count('id', filter=Q(status='pending'))
+            ).order_by('uav_flight'),
+            'latest result per image': lambda: ProcessingResult.objects.filter(image__uav_flight=uav_flight).exclude(
+                Exists(ProcessingResult.objects.filter(image=OuterRef('image'), date_processed__gt=OuterRef('date_processed')))
+            ).values('id'),
+        }
+
+    def run_queries(self, queries, repeat, show_plans):
+        medians = {}
+        for name, build_query in queries.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(build_query())
+                timings.append((time.perf_counter() - start) * 1000)
+            medians[name] = sorted(timings)[len(timings) // 2]
+            self.stdout.write(f'{name:<40} median {medians[name]:.2f} ms')
+            if show_plans:
+                self.stdout.write(build_query().explain(analyze=True))
+        return medians
+
+    def drop_indexes(self):
+        with connection.schema_editor() as schema_editor:
+            for model in (AnalysisJob, ProcessingResult):
+                for index in model._meta.indexes:
+                    schema_editor.remove_index(model, index)
+                for constraint in model._meta.constraints:
+                    schema_editor.remove_constraint(model, constraint)
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django_q.models import Schedule
+from api.views.views_analysis import reap_analysis_jobs
+
+
+class Command(BaseCommand):
+    help = 'Re-queue or fail the analysis jobs whose worker lease expired, or schedule this to run periodically in the qcluster.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schedule', action='store_true', help='Register a django-q schedule running the reaper every ANALYSIS_REAPER_INTERVAL minutes instead.')
+
+    def handle(self, *args, **options):
+        if options['schedule']:
+            Schedule.objects.update_or_create(
+                name='reap_analysis_jobs',
+                defaults={
+                    'func': 'api.views.views_analysis.reap_analysis_jobs',
+                    'schedule_type': Schedule.MINUTES,
+                    'minutes': settings.ANALYSIS_REAPER_INTERVAL,
+                    'repeats': -1,
+                },
+            )
+            self.stdout.write(self.style.SUCCESS(f'Scheduled the reaper every {settings.ANALYSIS_REAPER_INTERVAL} minutes'))
+            return
+
+        requeued, failed = reap_analysis_jobs()
+        self.stdout.write(self.style.SUCCESS(f'Re-queued {requeued} and failed {failed} analysis jobs with expired leases'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.summaries import rebuild_flight_summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute FlightAnalysisSummary rows from the analysis jobs and results to repair drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uav-flight-id', type=int, nargs='*', help='Only rebuild the summaries of these flights.')
+
+    def handle(self, *args, **options):
+        count = rebuild_flight_summaries(options['uav_flight_id'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} flight analysis summaries'))
@@ -0,0 +1,142 @@
+# Generated by Django 4.2.6 on 2026-10-19 17:19
+
+from django.conf import settings
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(max_length=255, unique=True)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('first_name', models.CharField(max_length=255)),
+                ('last_name', models.CharField(max_length=255)),
+                ('role', models.CharField(choices=[('farmer', 'Farmer'), ('admin', 'Admin')], default='farmer', max_length=10)),
+                ('is_active', models.BooleanField(default=True)),
+                ('is_staff', models.BooleanField(default=False)),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now)),
+                ('groups', models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='customuser_groups', related_query_name='customuser', to='auth.group', verbose_name='groups')),
+                ('user_permissions', models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='customuser_user_permissions', related_query_name='customuser', to='auth.permission', verbose_name='user permissions')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Field',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('location', django.contrib.gis.db.models.fields.PolygonField(srid=4326)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('owner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FieldImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.ImageField(upload_to='field_images/')),
+                ('resized_image', models.ImageField(blank=True, null=True, upload_to='resized_field_images/')),
+                ('upload_date', models.DateTimeField(default=django.utils.timezone.now)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('gps_latitude', models.CharField(blank=True, max_length=100, null=True)),
+                ('gps_longitude', models.CharField(blank=True, max_length=100, null=True)),
+                ('gps_altitude', models.CharField(blank=True, max_length=100, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FieldSeasonAssociation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_associated', models.DateTimeField(default=django.utils.timezone.now)),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.field')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UAVFlight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flight_date', models.DateTimeField()),
+                ('description', models.TextField(blank=True, null=True)),
+                ('owner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UAVFlightFieldSeasonAssociation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field_season', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.fieldseasonassociation')),
+                ('uav_flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.uavflight')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Season',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('description', models.TextField(blank=True, null=True)),
+                ('owner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProcessingResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('result_data', models.JSONField(blank=True, default=dict, null=True)),
+                ('date_processed', models.DateTimeField(default=django.utils.timezone.now)),
+                ('generated_image', models.ImageField(blank=True, null=True, upload_to='generated_images/')),
+                ('image', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='api.fieldimage')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='fieldseasonassociation',
+            name='season',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.season'),
+        ),
+        migrations.AddField(
+            model_name='fieldseasonassociation',
+            name='uav_flights',
+            field=models.ManyToManyField(blank=True, through='api.UAVFlightFieldSeasonAssociation', to='api.uavflight'),
+        ),
+        migrations.AddField(
+            model_name='fieldimage',
+            name='uav_flight',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='images', to='api.uavflight'),
+        ),
+        migrations.AddField(
+            model_name='field',
+            name='seasons',
+            field=models.ManyToManyField(null=True, through='api.FieldSeasonAssociation', to='api.season'),
+        ),
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('field_image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.fieldimage')),
+                ('owner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('uav_flight', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='api.uavflight')),
+            ],
+        ),
+    ]
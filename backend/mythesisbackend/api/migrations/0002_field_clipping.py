@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-19 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='clip_to_field',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='field',
+            name='ground_elevation',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-19 17:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_field_clipping'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uavflight',
+            name='ingest_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='completed', max_length=10),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.6 on 2026-10-19 17:24
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_links(apps, schema_editor):
+    """
+    Keep the oldest link of every flight and field season pair, so the unique constraint can be added.
+    """
+    UAVFlightFieldSeasonAssociation = apps.get_model('api', 'UAVFlightFieldSeasonAssociation')
+    duplicates = UAVFlightFieldSeasonAssociation.objects.values('uav_flight_id', 'field_season_id').annotate(count=Count('id')).filter(count__gt=1)
+    for row in duplicates:
+        ids = list(UAVFlightFieldSeasonAssociation.objects.filter(
+            uav_flight_id=row['uav_flight_id'], field_season_id=row['field_season_id']
+        ).order_by('id').values_list('id', flat=True))
+        UAVFlightFieldSeasonAssociation.objects.filter(id__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_fieldimage_location_altitude'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_links, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='uavflightfieldseasonassociation',
+            constraint=models.UniqueConstraint(fields=('uav_flight', 'field_season'), name='unique_uav_flight_field_season'),
+        ),
+    ]
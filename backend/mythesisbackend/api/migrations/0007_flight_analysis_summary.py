@@ -0,0 +1,35 @@
+# Generated by Django 4.2.6 on 2026-10-19 17:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_unique_uav_flight_field_season'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightAnalysisSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pending_jobs', models.IntegerField(default=0)),
+                ('processing_jobs', models.IntegerField(default=0)),
+                ('completed_jobs', models.IntegerField(default=0)),
+                ('failed_jobs', models.IntegerField(default=0)),
+                ('processed_images', models.IntegerField(default=0)),
+                ('weight_sum', models.FloatField(default=0)),
+                ('background_sum', models.FloatField(default=0)),
+                ('background_weighted_sum', models.FloatField(default=0)),
+                ('sorghum_sum', models.FloatField(default=0)),
+                ('sorghum_weighted_sum', models.FloatField(default=0)),
+                ('weeds_sum', models.FloatField(default=0)),
+                ('weeds_weighted_sum', models.FloatField(default=0)),
+                ('last_processed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('uav_flight', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='analysis_summary', to='api.uavflight')),
+            ],
+        ),
+    ]
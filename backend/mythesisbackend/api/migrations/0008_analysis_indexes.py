@@ -0,0 +1,51 @@
+# Generated by Django 4.2.6 on 2026-10-19 17:26
+
+from django.db import migrations, models
+from django.db.models import Case, Count, IntegerField, Value, When
+from django.utils import timezone
+
+
+def fail_duplicate_active_jobs(apps, schema_editor):
+    """
+    Keep one pending or processing job per image, so the unique constraint can be added. A processing job
+    is kept before a pending one, otherwise the oldest. The others are failed and can be started again.
+    """
+    AnalysisJob = apps.get_model('api', 'AnalysisJob')
+    active = AnalysisJob.objects.filter(field_image__isnull=False, status__in=['pending', 'processing'])
+    duplicates = active.values('field_image_id').annotate(count=Count('id')).filter(count__gt=1)
+    for row in duplicates:
+        ids = list(active.filter(field_image_id=row['field_image_id']).annotate(
+            processing_first=Case(When(status='processing', then=Value(0)), default=Value(1), output_field=IntegerField())
+        ).order_by('processing_first', 'id').values_list('id', flat=True))
+        AnalysisJob.objects.filter(id__in=ids[1:]).update(status='failed', updated_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_flight_analysis_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='analysisjob',
+            index=models.Index(fields=['field_image', 'status'], name='analysisjob_image_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='analysisjob',
+            index=models.Index(fields=['uav_flight', 'status'], name='analysisjob_flight_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='processingresult',
+            index=models.Index(fields=['image', '-date_processed'], name='result_image_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='processingresult',
+            index=models.Index(condition=models.Q(('generated_image__isnull', False)), fields=['image'], name='result_generated_image_idx'),
+        ),
+        migrations.RunPython(fail_duplicate_active_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='analysisjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'processing'])), fields=('field_image',), name='unique_active_job_per_image'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.6 on 2026-10-19 17:29
+
+from django.db import migrations, models
+
+
+def mark_finished_jobs_notified(apps, schema_editor):
+    """
+    The owners of jobs that finished before notified existed have already been sent their email.
+    """
+    AnalysisJob = apps.get_model('api', 'AnalysisJob')
+    AnalysisJob.objects.filter(status__in=['completed', 'failed']).update(notified=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_analysis_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisjob',
+            name='notified',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_finished_jobs_notified, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Bulk'), (10, 'Single image')], default=0),
+        ),
+        migrations.AddField(
+            model_name='analysisjob',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='analysisjob',
+            index=models.Index(fields=['owner', 'status'], name='analysisjob_owner_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='analysisjob',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['-priority', 'id'], name='analysisjob_queue_idx'),
+        ),
+    ]
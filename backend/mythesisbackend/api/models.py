@@ -81,6 +81,9 @@ class Field(models.Model):
     name = models.CharField(max_length=255)
     location = models.PolygonField()
     description = models.TextField(blank=True, null=True)
+    # Height of the field above mean sea level in meters, EXIF GPS altitudes are relative to sea level
+    # and need it to give the flight height above the field
+    ground_elevation = models.FloatField(blank=True, null=True)
     seasons = models.ManyToManyField(Season, through='FieldSeasonAssociation', null=True)
     
 # FieldSeasonAssociation Model:
@@ -99,9 +102,19 @@ class FieldSeasonAssociation(models.Model):
 # Each flight can have multiple images associated with it, captured during the flight.
 # The model stores information about the flight such as date, time, and any relevant description.
 class UAVFlight(models.Model):
+    INGEST_STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed')
+    )
     owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
     flight_date = models.DateTimeField()
     description = models.TextField(blank=True, null=True)
+    # Progress of the EXIF extraction and thumbnail generation of the uploaded images
+    ingest_status = models.CharField(max_length=10, choices=INGEST_STATUS_CHOICES, default='completed')
+    # Last change of ingest_status, the reaper fails ingests that stopped making progress
+    ingest_updated_at = models.DateTimeField(default=timezone.now)
 
     
 # FieldImage Model:
@@ -118,6 +131,11 @@ class FieldImage(models.Model):
     gps_latitude = models.CharField(max_length=100, blank=True, null=True)
     gps_longitude = models.CharField(max_length=100, blank=True, null=True)
     gps_altitude = models.CharField(max_length=100, blank=True, null=True)
+    # Typed copies of the GPS data for spatial queries, location has a GiST index
+    location = models.PointField(srid=4326, blank=True, null=True)
+    altitude = models.FloatField(blank=True, null=True)
+    # SHA-256 of the original image, used to skip uploading the same image twice
+    content_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
 
 # UAVFlightFieldSeasonAssociation
 # This model associates UAV flights with a specific field during a particular season.
@@ -126,6 +144,11 @@ class UAVFlightFieldSeasonAssociation(models.Model):
     uav_flight = models.ForeignKey('UAVFlight', on_delete=models.CASCADE)
     field_season = models.ForeignKey('FieldSeasonAssociation', on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['uav_flight', 'field_season'], name='unique_uav_flight_field_season'),
+        ]
+
 
 # ProcessingResult Model:
 # Represents the outcome of processing a field image (e.g., detecting weeds using deep learning).
@@ -137,6 +160,13 @@ class ProcessingResult(models.Model):
     date_processed = models.DateTimeField(default=timezone.now)
     generated_image = models.ImageField(upload_to='generated_images/', blank=True, null=True)  # For storing the analyzed image
 
+    class Meta:
+        indexes = [
+            # Latest result per image
+            models.Index(fields=['image', '-date_processed'], name='result_image_latest_idx'),
+            models.Index(fields=['image'], condition=models.Q(generated_image__isnull=False), name='result_generated_image_idx'),
+        ]
+
 
 class AnalysisJob(models.Model):
     STATUS_CHOICES = (
@@ -145,10 +175,93 @@ class AnalysisJob(models.Model):
         ('completed', 'Completed'),
         ('failed', 'Failed')
     )
+    # Higher priorities are handed to the workers first, single images are re-analysed before whole flights
+    PRIORITY_BULK = 0
+    PRIORITY_SINGLE_IMAGE = 10
+    PRIORITY_CHOICES = (
+        (PRIORITY_BULK, 'Bulk'),
+        (PRIORITY_SINGLE_IMAGE, 'Single image')
+    )
     #TODO remove null=True when ready to migrate before production
     owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set when a worker claims the job, the time since created_at is the job's wait time
+    started_at = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES, default=PRIORITY_BULK)
+    # Set once the owner has been notified about the flight analysis the job was part of
+    notified = models.BooleanField(default=False)
+    # Lease of the worker processing the job, renewed while it runs. Jobs whose lease expired are
+    # put back into the queue or failed by the reaper
+    lease_token = models.CharField(max_length=32, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
     uav_flight = models.ForeignKey(UAVFlight, on_delete=models.CASCADE, null=True)
-    field_image = models.ForeignKey(FieldImage, on_delete=models.CASCADE, null=True, blank=True)
\ No newline at end of file
+    field_image = models.ForeignKey(FieldImage, on_delete=models.CASCADE, null=True, blank=True)
+    # Restrict the analysis to the pixels inside the polygons of the fields the flight is linked to
+    clip_to_field = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['field_image', 'status'], name='analysisjob_image_status_idx'),
+            models.Index(fields=['uav_flight', 'status'], name='analysisjob_flight_status_idx'),
+            models.Index(fields=['owner', 'status'], name='analysisjob_owner_status_idx'),
+            # Queue of the scheduler
+            models.Index(fields=['-priority', 'id'], condition=models.Q(status='pending'), name='analysisjob_queue_idx'),
+            models.Index(fields=['lease_expires_at'], condition=models.Q(status='processing'), name='analysisjob_lease_idx'),
+        ]
+        constraints = [
+            # At most one pending or processing job per image, also under concurrent requests
+            models.UniqueConstraint(fields=['field_image'], condition=models.Q(status__in=['pending', 'processing']), name='unique_active_job_per_image'),
+        ]
+
+
+# FlightAnalysisSummary Model:
+# Per-flight analysis figures maintained incrementally while jobs run, so dashboards read one row per flight.
+# Class ratios are stored as sums (plain and weighted by analysed pixels) and averaged when serialized.
+# The rebuild_flight_summaries command recomputes the rows from the jobs and results.
+class FlightAnalysisSummary(models.Model):
+    uav_flight = models.OneToOneField(UAVFlight, related_name='analysis_summary', on_delete=models.CASCADE)
+    pending_jobs = models.IntegerField(default=0)
+    processing_jobs = models.IntegerField(default=0)
+    completed_jobs = models.IntegerField(default=0)
+    failed_jobs = models.IntegerField(default=0)
+    processed_images = models.IntegerField(default=0)
+    weight_sum = models.FloatField(default=0)
+    background_sum = models.FloatField(default=0)
+    background_weighted_sum = models.FloatField(default=0)
+    sorghum_sum = models.FloatField(default=0)
+    sorghum_weighted_sum = models.FloatField(default=0)
+    weeds_sum = models.FloatField(default=0)
+    weeds_weighted_sum = models.FloatField(default=0)
+    last_processed_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+# UploadSession Model:
+# Represents a resumable upload of the images of a new UAV flight.
+# The client registers the files, sends them in chunks and finalizes the session,
+# which creates the UAVFlight and its FieldImages and starts the ingest.
+class UploadSession(models.Model):
+    STATUS_CHOICES = (
+        ('open', 'Open'),
+        ('finalized', 'Finalized'),
+    )
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    flight_date = models.DateTimeField()
+    description = models.TextField(blank=True, null=True)
+    uav_flight = models.ForeignKey(UAVFlight, on_delete=models.SET_NULL, null=True, blank=True)
+
+
+# UploadedFile Model:
+# A single file of an upload session and how many of its bytes have been received.
+# Files whose content the user has uploaded before point to the existing FieldImage instead.
+class UploadedFile(models.Model):
+    session = models.ForeignKey(UploadSession, related_name='files', on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    content_hash = models.CharField(max_length=64, blank=True, null=True)
+    duplicate_of = models.ForeignKey(FieldImage, on_delete=models.SET_NULL, null=True, blank=True)
@@ -0,0 +1,40 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class IdCursorPagination(CursorPagination):
+    """
+    Cursor pagination ordered by primary key, stable while new rows are being added.
+    """
+    ordering = 'id'
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+
+def requested_fields(request):
+    """
+    Field names requested with ?fields=id,name,... or None when all fields are wanted.
+    """
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+def paginated_response(request, queryset, serializer_class, **serializer_kwargs):
+    """
+    Serialize a queryset, paginated only when the client asks for it with ?cursor= or ?page_size=,
+    so existing clients keep receiving a plain list. Honours the ?fields= sparse fieldset.
+    """
+    fields = requested_fields(request)
+    if fields is not None:
+        serializer_kwargs['fields'] = fields
+
+    if 'cursor' not in request.query_params and 'page_size' not in request.query_params:
+        return Response(serializer_class(queryset, many=True, **serializer_kwargs).data)
+
+    paginator = IdCursorPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(serializer_class(page, many=True, **serializer_kwargs).data)
@@ -0,0 +1,157 @@
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Max, Min, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from .models import AnalysisJob
+from .summaries import record_job_status_change
+
+
+def running_jobs_per_owner():
+    return dict(
+        AnalysisJob.objects.filter(status='processing').values('owner').annotate(running=Count('id')).values_list('owner', 'running')
+    )
+
+
+def next_job_candidates(limit):
+    """
+    Pending jobs in the order they should be started: by priority, then round-robin across owners,
+    so every owner's oldest job comes before anyone's second one. Owners already running
+    ANALYSIS_MAX_JOBS_PER_USER jobs are skipped, the others get at most their remaining slots.
+    Returns a list of (job id, owner id, UAV flight id) tuples.
+    """
+    max_jobs_per_user = settings.ANALYSIS_MAX_JOBS_PER_USER
+    running = running_jobs_per_owner()
+    saturated_owners = [owner_id for owner_id, count in running.items() if count >= max_jobs_per_user]
+
+    candidates = AnalysisJob.objects.filter(status='pending')
+    if saturated_owners:
+        candidates = candidates.exclude(owner_id__in=[owner_id for owner_id in saturated_owners if owner_id is not None])
+        if None in saturated_owners:
+            candidates = candidates.exclude(owner__isnull=True)
+    candidates = candidates.annotate(
+        owner_rank=Window(RowNumber(), partition_by=[F('owner')], order_by=[F('priority').desc(), F('id').asc()])
+    ).filter(owner_rank__lte=max_jobs_per_user).order_by('-priority', 'owner_rank', 'id').values_list('id', 'owner_id', 'uav_flight_id')
+
+    selected, taken = [], {}
+    for job_id, owner_id, uav_flight_id in candidates[:limit * max_jobs_per_user]:
+        if running.get(owner_id, 0) + taken.get(owner_id, 0) >= max_jobs_per_user:
+            continue
+        taken[owner_id] = taken.get(owner_id, 0) + 1
+        selected.append((job_id, owner_id, uav_flight_id))
+        if len(selected) == limit:
+            break
+    return selected
+
+
+def lease_expiry():
+    return timezone.now() + timedelta(seconds=settings.ANALYSIS_LEASE_SECONDS)
+
+
+def record_status_changes(uav_flight_ids, old_status, new_status):
+    """
+    Record the status change of one job per entry of uav_flight_ids in the flight summaries, with one update per flight.
+    """
+    for uav_flight_id, count in Counter(uav_flight_id for uav_flight_id in uav_flight_ids if uav_flight_id is not None).items():
+        record_job_status_change(uav_flight_id, old_status, new_status, count=count)
+
+
+def claim_next_jobs(limit, lease_token):
+    """
+    Claim up to limit pending jobs under lease_token, see next_job_candidates for the order.
+    Every job is claimed with a conditional update, jobs claimed by a concurrent worker in the
+    meantime are skipped. Returns the ids of the claimed jobs.
+    """
+    claimed, claimed_flights = [], []
+    for job_id, _, uav_flight_id in next_job_candidates(limit):
+        now = timezone.now()
+        if AnalysisJob.objects.filter(id=job_id, status='pending').update(
+            status='processing', started_at=now, updated_at=now,
+            lease_token=lease_token, lease_expires_at=lease_expiry(), attempts=F('attempts') + 1,
+        ):
+            claimed.append(job_id)
+            claimed_flights.append(uav_flight_id)
+    record_status_changes(claimed_flights, 'pending', 'processing')
+    return claimed
+
+
+def renew_leases(job_ids, lease_token):
+    """
+    Heartbeat of a worker, extends the leases it still holds on job_ids. Returns the number of renewed leases.
+    """
+    if not job_ids:
+        return 0
+    return AnalysisJob.objects.filter(id__in=job_ids, status='processing', lease_token=lease_token).update(lease_expires_at=lease_expiry())
+
+
+def release_job(job_id, lease_token):
+    """
+    Put a claimed job back into the queue without counting the attempt, e.g. when the Flask service is unavailable.
+    """
+    if AnalysisJob.objects.filter(id=job_id, status='processing', lease_token=lease_token).update(
+        status='pending', started_at=None, updated_at=timezone.now(),
+        lease_token='', lease_expires_at=None, attempts=F('attempts') - 1,
+    ):
+        record_status_changes(AnalysisJob.objects.filter(id=job_id).values_list('uav_flight_id', flat=True), 'processing', 'pending')
+
+
+def reap_expired_jobs():
+    """
+    Recover the jobs of workers that died or hung: processing jobs whose lease expired go back into the
+    queue, or are failed once they used up ANALYSIS_MAX_ATTEMPTS. Jobs claimed before leases existed
+    count as expired once they have not been updated for a lease period.
+    The status changes are recorded in the flight summaries.
+    Returns the ids of the re-queued jobs and the (id, uav_flight_id) of the failed ones.
+    """
+    now = timezone.now()
+    expired = AnalysisJob.objects.filter(status='processing').filter(
+        Q(lease_expires_at__lt=now) | Q(lease_expires_at__isnull=True, updated_at__lt=now - timedelta(seconds=settings.ANALYSIS_LEASE_SECONDS))
+    )
+
+    requeued, failed, requeued_flights = [], [], []
+    for job_id, uav_flight_id, attempts in expired.values_list('id', 'uav_flight_id', 'attempts'):
+        # Conditional on the job still being expired, its worker may have renewed the lease in the meantime
+        still_expired = AnalysisJob.objects.filter(
+            Q(lease_expires_at__lt=now) | Q(lease_expires_at__isnull=True), id=job_id, status='processing'
+        )
+        if attempts < settings.ANALYSIS_MAX_ATTEMPTS:
+            if still_expired.update(status='pending', started_at=None, updated_at=now, lease_token='', lease_expires_at=None):
+                requeued.append(job_id)
+                requeued_flights.append(uav_flight_id)
+        elif still_expired.update(status='failed', updated_at=now, lease_token='', lease_expires_at=None):
+            failed.append((job_id, uav_flight_id))
+
+    record_status_changes(requeued_flights, 'processing', 'pending')
+    record_status_changes([uav_flight_id for _, uav_flight_id in failed], 'processing', 'failed')
+    return requeued, failed
+
+
+def queue_metrics(since):
+    """
+    Queue depth and wait times of the analysis jobs per owner. Wait times are in seconds
+    and cover the jobs started after since.
+    """
+    wait_time = ExpressionWrapper(F('started_at') - F('created_at'), output_field=DurationField())
+    started = Q(started_at__gte=since)
+    now = timezone.now()
+
+    rows = AnalysisJob.objects.values('owner', 'owner__username').annotate(
+        pending=Count('id', filter=Q(status='pending')),
+        processing=Count('id', filter=Q(status='processing')),
+        started=Count('id', filter=started),
+        oldest_pending=Min('created_at', filter=Q(status='pending')),
+        average_wait=Avg(wait_time, filter=started),
+        max_wait=Max(wait_time, filter=started),
+    ).filter(Q(pending__gt=0) | Q(processing__gt=0) | Q(started__gt=0)).order_by('-pending', 'owner')
+
+    return [{
+        'owner': row['owner'],
+        'username': row['owner__username'],
+        'pending': row['pending'],
+        'processing': row['processing'],
+        'started': row['started'],
+        'oldest_pending_wait': (now - row['oldest_pending']).total_seconds() if row['oldest_pending'] else None,
+        'average_wait': row['average_wait'].total_seconds() if row['average_wait'] is not None else None,
+        'max_wait': row['max_wait'].total_seconds() if row['max_wait'] is not None else None,
+    } for row in rows]
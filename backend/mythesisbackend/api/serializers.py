@@ -1,6 +1,7 @@
 from rest_framework import serializers
-from .models import UAVFlight, UAVFlightFieldSeasonAssociation, User, Season, Field, FieldSeasonAssociation, FieldImage, ProcessingResult, AnalysisJob
+from .models import UAVFlight, UAVFlightFieldSeasonAssociation, User, Season, Field, FieldSeasonAssociation, FieldImage, ProcessingResult, AnalysisJob, UploadSession, UploadedFile, FlightAnalysisSummary
 from django.contrib.auth import authenticate
+from .summaries import RESULT_CLASSES
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import get_user_model
 from django.contrib.auth import authenticate
@@ -8,6 +9,18 @@ from rest_framework import serializers
 
 User = get_user_model()
 
+class SparseFieldsetMixin:
+    """
+    Lets callers restrict the serialized fields with a fields=[...] keyword argument,
+    used by the list endpoints for the fields= query parameter.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     class Meta:
@@ -78,32 +91,52 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 # Season Serializer
-class SeasonSerializer(serializers.ModelSerializer):
+class SeasonSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Season
         fields = ('id', 'owner', 'name', 'start_date', 'end_date', 'description')
 
 
 # Field Serializer
-class FieldSerializer(serializers.ModelSerializer):
+class FieldSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Field
-        fields = ('id', 'owner', 'name', 'location', 'description')
+        fields = ('id', 'owner', 'name', 'location', 'description', 'ground_elevation')
 
 
 # FieldImage Serializer
-class FieldImageSerializer(serializers.ModelSerializer):
+class FieldImageSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = FieldImage
-        fields = ('id', 'uav_flight', 'image', 'resized_image', 'upload_date', 'description', 'gps_latitude', 'gps_longitude', 'gps_altitude')
+        fields = ('id', 'uav_flight', 'image', 'resized_image', 'upload_date', 'description', 'gps_latitude', 'gps_longitude', 'gps_altitude', 'location', 'altitude')
+        read_only_fields = ('location', 'altitude')
 
 
-class UAVFlightSerializer(serializers.ModelSerializer):
+class UAVFlightSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     images = FieldImageSerializer(many=True, read_only=True)
 
     class Meta:
         model = UAVFlight
-        fields = ('id', 'owner', 'flight_date', 'description', 'images')
+        fields = ('id', 'owner', 'flight_date', 'description', 'ingest_status', 'images')
+        read_only_fields = ('ingest_status',)
+
+class UAVFlightSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Lightweight flight representation for list views, expects the queryset to be annotated
+    with image_count and first_thumbnail (see views_flights.annotate_image_summary).
+    """
+    image_count = serializers.IntegerField(read_only=True)
+    first_thumbnail = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UAVFlight
+        fields = ('id', 'owner', 'flight_date', 'description', 'ingest_status', 'image_count', 'first_thumbnail')
+
+    def get_first_thumbnail(self, obj):
+        if not obj.first_thumbnail:
+            return None
+        # Relative like the image URLs of the other serializers, the frontend prefixes the API host
+        return FieldImage._meta.get_field('resized_image').storage.url(obj.first_thumbnail)
 
 class UAVFlightFieldSeasonAssociationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -118,7 +151,15 @@ class FieldSeasonAssociationSerializer(serializers.ModelSerializer):
         fields = ('id', 'field', 'season', 'date_associated', 'uav_flights')
         
 
-class ProcessingResultSerializer(serializers.ModelSerializer):
+class FieldSeasonAssociationSummarySerializer(serializers.ModelSerializer):
+    uav_flights = UAVFlightSummarySerializer(many=True, read_only=True)
+
+    class Meta:
+        model = FieldSeasonAssociation
+        fields = ('id', 'field', 'season', 'date_associated', 'uav_flights')
+
+
+class ProcessingResultSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     image_details = serializers.SerializerMethodField()
 
     class Meta:
@@ -132,10 +173,49 @@ class ProcessingResultSerializer(serializers.ModelSerializer):
 
 
 
+class FlightAnalysisSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    flight_date = serializers.DateTimeField(source='uav_flight.flight_date', read_only=True)
+    class_ratios = serializers.SerializerMethodField()
+
+    class Meta:
+        model = FlightAnalysisSummary
+        fields = ('id', 'uav_flight', 'flight_date', 'pending_jobs', 'processing_jobs', 'completed_jobs', 'failed_jobs',
+                  'processed_images', 'class_ratios', 'last_processed_at', 'updated_at')
+
+    def get_class_ratios(self, obj):
+        # Mean and pixel-weighted mean percentage of every class over the processed images
+        ratios = {}
+        for name in RESULT_CLASSES:
+            mean = getattr(obj, f'{name}_sum') / obj.processed_images if obj.processed_images else None
+            weighted_mean = getattr(obj, f'{name}_weighted_sum') / obj.weight_sum if obj.weight_sum else mean
+            ratios[name] = {'mean': mean, 'weighted_mean': weighted_mean}
+        return ratios
+
+
+class UploadedFileSerializer(serializers.ModelSerializer):
+    complete = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadedFile
+        fields = ('id', 'name', 'size', 'received_bytes', 'content_hash', 'duplicate_of', 'complete')
+
+    def get_complete(self, obj):
+        return obj.duplicate_of_id is not None or obj.received_bytes == obj.size
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    files = UploadedFileSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'owner', 'created_at', 'status', 'flight_date', 'description', 'uav_flight', 'files')
+        read_only_fields = ('owner', 'status', 'uav_flight')
+
+
 class AnalysisJobSerializer(serializers.ModelSerializer):
     class Meta:
         model = AnalysisJob
-        fields = ['id', 'owner', 'created_at', 'status', 'uav_flight', 'field_image']
+        fields = ['id', 'owner', 'created_at', 'started_at', 'status', 'priority', 'uav_flight', 'field_image', 'clip_to_field']
 
         # Ensure that 'field_image' is optional and can be null
         extra_kwargs = {
@@ -0,0 +1,41 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .caching import invalidate_user_responses
+from .models import Field, FieldSeasonAssociation, ProcessingResult, Season, UAVFlight, UAVFlightFieldSeasonAssociation
+from .weed_tiles import invalidate_weed_tiles
+
+
+@receiver([post_save, post_delete], sender=ProcessingResult)
+def invalidate_weed_tiles_for_result(sender, instance, **kwargs):
+    """
+    A new or removed analysis result changes the weed overlay of every season its flight is linked to.
+    """
+    if instance.image_id is None:
+        return
+    uav_flight_id = instance.image.uav_flight_id
+    season_ids = FieldSeasonAssociation.objects.filter(uav_flights=uav_flight_id).values_list('season_id', flat=True).distinct()
+    for season_id in season_ids:
+        invalidate_weed_tiles(season_id, uav_flight_id)
+
+
+@receiver([post_save, post_delete], sender=UAVFlightFieldSeasonAssociation)
+def invalidate_weed_tiles_for_link(sender, instance, **kwargs):
+    invalidate_weed_tiles(instance.field_season.season_id, instance.uav_flight_id)
+
+
+@receiver([post_save, post_delete], sender=Field)
+@receiver([post_save, post_delete], sender=Season)
+@receiver([post_save, post_delete], sender=UAVFlight)
+def invalidate_cached_responses_of_owner(sender, instance, **kwargs):
+    invalidate_user_responses(instance.owner_id)
+
+
+@receiver([post_save, post_delete], sender=FieldSeasonAssociation)
+def invalidate_cached_responses_for_association(sender, instance, **kwargs):
+    invalidate_user_responses(Season.objects.filter(id=instance.season_id).values_list('owner_id', flat=True).first())
+
+
+@receiver([post_save, post_delete], sender=ProcessingResult)
+def invalidate_cached_responses_for_result(sender, instance, **kwargs):
+    if instance.image_id is not None:
+        invalidate_user_responses(UAVFlight.objects.filter(images=instance.image_id).values_list('owner_id', flat=True).first())
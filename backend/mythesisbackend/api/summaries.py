@@ -0,0 +1,147 @@
+from django.db.models import Count, DateTimeField, Exists, F, FloatField, Max, Min, OuterRef, Q, Sum, Value
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast, Greatest
+from django.utils import timezone
+from .caching import invalidate_user_responses
+from .models import AnalysisJob, FlightAnalysisSummary, ProcessingResult, UAVFlight
+
+# Class percentages stored in ProcessingResult.result_data by the Flask service
+RESULT_CLASSES = ('background', 'sorghum', 'weeds')
+
+JOB_STATUS_FIELDS = {
+    'pending': 'pending_jobs',
+    'processing': 'processing_jobs',
+    'completed': 'completed_jobs',
+    'failed': 'failed_jobs',
+}
+
+
+def latest_results(results):
+    """
+    Restrict a ProcessingResult queryset to the latest result of every image.
+    """
+    return results.exclude(
+        Exists(ProcessingResult.objects.filter(image=OuterRef('image'), date_processed__gt=OuterRef('date_processed')))
+    )
+
+
+def result_statistics_aggregates():
+    """
+    Aliases reading the class percentages and pixel counts from result_data as numbers, and the
+    aggregates summing them (image_count, weight_sum, <class>_sum, <class>_weighted_sum, <class>_min, <class>_max).
+    """
+    aliases = {f'{name}_value': Cast(KeyTextTransform(name, 'result_data'), FloatField()) for name in RESULT_CLASSES}
+    aliases['pixel_weight'] = Cast(KeyTextTransform('total_pixels', 'result_data'), FloatField())
+    aggregates = {'image_count': Count('id'), 'weight_sum': Sum('pixel_weight')}
+    for name in RESULT_CLASSES:
+        aggregates[f'{name}_sum'] = Sum(f'{name}_value')
+        aggregates[f'{name}_weighted_sum'] = Sum(F(f'{name}_value') * F('pixel_weight'))
+        aggregates[f'{name}_min'] = Min(f'{name}_value')
+        aggregates[f'{name}_max'] = Max(f'{name}_value')
+    return aliases, aggregates
+
+
+def apply_summary_deltas(uav_flight_id, deltas, last_processed_at=None):
+    """
+    Add deltas to the counters of a flight's summary with a single UPDATE, so concurrent workers never lose increments.
+    """
+    FlightAnalysisSummary.objects.get_or_create(uav_flight_id=uav_flight_id)
+    updates = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if last_processed_at is not None:
+        # GREATEST ignores NULL in PostgreSQL, so the first result sets the timestamp
+        updates['last_processed_at'] = Greatest('last_processed_at', Value(last_processed_at, output_field=DateTimeField()))
+    if updates:
+        updates['updated_at'] = timezone.now()
+        FlightAnalysisSummary.objects.filter(uav_flight_id=uav_flight_id).update(**updates)
+        # update() sends no post_save
+        invalidate_user_responses(UAVFlight.objects.filter(id=uav_flight_id).values_list('owner_id', flat=True).first())
+
+
+def record_job_status_change(uav_flight_id, old_status=None, new_status=None, count=1):
+    """
+    Move count jobs of a flight from old_status to new_status (either may be None for created or removed jobs).
+    """
+    deltas = {}
+    if old_status is not None:
+        deltas[JOB_STATUS_FIELDS[old_status]] = -count
+    if new_status is not None:
+        deltas[JOB_STATUS_FIELDS[new_status]] = deltas.get(JOB_STATUS_FIELDS[new_status], 0) + count
+    apply_summary_deltas(uav_flight_id, deltas)
+
+
+def result_sums(processing_result):
+    """
+    The summary sums (processed_images, weight_sum, <class>_sum, <class>_weighted_sum) of a single ProcessingResult.
+    """
+    result_data = processing_result.result_data or {}
+    try:
+        weight = float(result_data.get('total_pixels') or 0)
+        values = {name: float(result_data.get(name) or 0) for name in RESULT_CLASSES}
+    except (TypeError, ValueError):
+        weight, values = 0.0, {name: 0.0 for name in RESULT_CLASSES}
+
+    sums = {'processed_images': 1, 'weight_sum': weight}
+    for name, value in values.items():
+        sums[f'{name}_sum'] = value
+        sums[f'{name}_weighted_sum'] = value * weight
+    return sums
+
+
+def record_processing_result(uav_flight_id, processing_result):
+    """
+    Add the class percentages of a new ProcessingResult to its flight's summary. The summary only counts
+    the latest result of every image, the result it replaces for a re-analysed image is subtracted.
+    """
+    previous = None
+    if processing_result.image_id is not None:
+        previous = ProcessingResult.objects.filter(image_id=processing_result.image_id).exclude(id=processing_result.id).order_by('-date_processed', '-id').first()
+    if previous is not None and previous.date_processed > processing_result.date_processed:
+        # Not the latest result of its image, the summary is unchanged
+        return
+
+    deltas = result_sums(processing_result)
+    if previous is not None:
+        for field, value in result_sums(previous).items():
+            deltas[field] -= value
+    apply_summary_deltas(uav_flight_id, deltas, last_processed_at=processing_result.date_processed)
+
+
+def rebuild_flight_summaries(uav_flight_ids=None):
+    """
+    Recompute the summaries of the given flights (all flights with jobs or results by default)
+    from the analysis jobs and the latest result of every image. Returns the number of summaries written.
+    """
+    jobs = AnalysisJob.objects.filter(uav_flight__isnull=False)
+    results = latest_results(ProcessingResult.objects.filter(image__uav_flight__isnull=False))
+    if uav_flight_ids is not None:
+        jobs = jobs.filter(uav_flight_id__in=uav_flight_ids)
+        results = results.filter(image__uav_flight_id__in=uav_flight_ids)
+
+    job_counts = {
+        row['uav_flight']: row for row in jobs.values('uav_flight').annotate(
+            **{field: Count('id', filter=Q(status=job_status)) for job_status, field in JOB_STATUS_FIELDS.items()}
+        ).order_by()
+    }
+    aliases, aggregates = result_statistics_aggregates()
+    result_sums = {
+        row['flight']: row for row in results.alias(**aliases).values(flight=F('image__uav_flight_id')).annotate(
+            last_processed_at=Max('date_processed'), **aggregates
+        ).order_by()
+    }
+
+    flight_ids = set(job_counts) | set(result_sums)
+    if uav_flight_ids is not None:
+        # Flights without any jobs are reset as well
+        flight_ids |= set(UAVFlight.objects.filter(id__in=uav_flight_ids).values_list('id', flat=True))
+    for uav_flight_id in flight_ids:
+        counts = job_counts.get(uav_flight_id, {})
+        sums = result_sums.get(uav_flight_id, {})
+        defaults = {field: counts.get(field, 0) for field in JOB_STATUS_FIELDS.values()}
+        defaults['processed_images'] = sums.get('image_count', 0)
+        defaults['weight_sum'] = sums.get('weight_sum') or 0
+        for name in RESULT_CLASSES:
+            defaults[f'{name}_sum'] = sums.get(f'{name}_sum') or 0
+            defaults[f'{name}_weighted_sum'] = sums.get(f'{name}_weighted_sum') or 0
+        defaults['last_processed_at'] = sums.get('last_processed_at')
+        FlightAnalysisSummary.objects.update_or_create(uav_flight_id=uav_flight_id, defaults=defaults)
+    return len(flight_ids)
@@ -1,7 +1,36 @@
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
-from .models import User, Field
+from django.contrib.gis.geos import Point, Polygon
+from django.db import connection
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .models import User, Field, UAVFlight, FieldImage, ProcessingResult, AnalysisJob, Season, FieldSeasonAssociation, UAVFlightFieldSeasonAssociation, UploadSession, UploadedFile, FlightAnalysisSummary
+from .scheduling import claim_next_jobs, reap_expired_jobs, release_job
+from .summaries import rebuild_flight_summaries, record_job_status_change, record_processing_result
+from .caching import invalidate_user_responses, response_cache
+from .views.views_analysis import finish_analysis_job, get_field_clip_data
+from .views.views_flights import create_flight_links, update_ingest_status
+from .flask_client import CircuitBreaker, CircuitOpenError, FlaskServiceError, post_image
+from .views.views_uploads import upload_part_path
+from .tiling import generate_pyramid
+from .weed_tiles import footprint_cells, image_footprints, is_weed_tile_fresh, weed_tile_path, weed_tiles_stamp_path
+from PIL import Image
+from io import BytesIO
+import time
+from unittest import mock
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import httpx
+import requests
+import load_test
+from datetime import timedelta
 
 class FieldTests(APITestCase):
 
@@ -42,6 +71,19 @@ class FieldTests(APITestCase):
         self.client.logout()
 
 
+    def test_list_fields_sparse_fieldset_and_pagination(self):
+        self.test_add_field()
+        self.client.force_authenticate(user=self.user)
+
+        url = reverse('my_fields')
+        response = self.client.get(url, {'fields': 'id,name', 'page_size': 10})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name'})
+        self.client.logout()
+
+
     def test_unauthorized_field_creation(self):
         url = reverse('add_field')
         response = self.client.post(url, self.field_data, format='json')
@@ -109,3 +151,764 @@ class FieldTests(APITestCase):
         self.assertEqual(Field.objects.count(), 1)
         self.client.logout()
 
+
+class GeneratedImagesTests(APITestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass', role='farmer', email='testuser@gmail.com')
+        self.client.force_authenticate(user=self.user)
+
+    def create_flight_with_results(self, num_images):
+        uav_flight = UAVFlight.objects.create(owner=self.user, flight_date=timezone.now())
+        images = FieldImage.objects.bulk_create([
+            FieldImage(uav_flight=uav_flight, image=f'field_images/image_{i}.jpg') for i in range(num_images)
+        ])
+        ProcessingResult.objects.bulk_create([
+            ProcessingResult(image=image, generated_image=f'generated_images/image_{image.id}.png') for image in images
+        ])
+        return uav_flight
+
+    def count_queries(self, uav_flight):
+        url = reverse('get_generated_images_for_uav_flight')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'uav_flight_id': uav_flight.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries), response
+
+    def test_generated_images_query_count_is_constant(self):
+        small_queries, small_response = self.count_queries(self.create_flight_with_results(1))
+        large_queries, large_response = self.count_queries(self.create_flight_with_results(500))
+
+        self.assertEqual(len(small_response.data), 1)
+        self.assertEqual(len(large_response.data), 500)
+        self.assertEqual(small_queries, large_queries)
+
+    def test_generated_images_pagination(self):
+        uav_flight = self.create_flight_with_results(5)
+        url = reverse('get_generated_images_for_uav_flight')
+
+        response = self.client.get(url, {'uav_flight_id': uav_flight.id, 'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+
+        # The details of the source image are part of every result
+        self.assertEqual(response.data['results'][0]['image_details']['uav_flight'], uav_flight.id)
+
+
+class AnalysisSchedulingTests(APITestCase):
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'farmer{i}', password='testpass', role='farmer', email=f'farmer{i}@gmail.com') for i in range(3)
+        ]
+
+    def create_jobs(self, user, num_images, priority=AnalysisJob.PRIORITY_BULK):
+        uav_flight = UAVFlight.objects.create(owner=user, flight_date=timezone.now())
+        images = FieldImage.objects.bulk_create([
+            FieldImage(uav_flight=uav_flight, image=f'field_images/image_{i}.jpg') for i in range(num_images)
+        ])
+        return [
+            AnalysisJob.objects.create(owner=user, uav_flight=uav_flight, field_image=image, priority=priority).id for image in images
+        ]
+
+    @override_settings(ANALYSIS_MAX_JOBS_PER_USER=2)
+    def test_claim_order_priority_and_fair_share(self):
+        bulk_jobs = self.create_jobs(self.users[0], 5)
+        single_image_jobs = self.create_jobs(self.users[1], 1, priority=AnalysisJob.PRIORITY_SINGLE_IMAGE)
+        other_bulk_jobs = self.create_jobs(self.users[2], 2)
+
+        # Single images first, then the owners take turns
+        self.assertEqual(claim_next_jobs(4, 'worker'), [single_image_jobs[0], bulk_jobs[0], other_bulk_jobs[0], bulk_jobs[1]])
+        # The first owner is at the limit until one of its jobs finishes
+        self.assertEqual(claim_next_jobs(4, 'worker'), [other_bulk_jobs[1]])
+        self.assertEqual(AnalysisJob.objects.filter(status='processing').count(), 5)
+
+    @override_settings(ANALYSIS_MAX_ATTEMPTS=2)
+    def test_reaper_recovers_jobs_with_expired_leases(self):
+        job_ids = self.create_jobs(self.users[0], 3)
+        claim_next_jobs(3, 'worker')
+        expired = timezone.now() - timedelta(seconds=1)
+        AnalysisJob.objects.filter(id=job_ids[0]).update(lease_expires_at=expired)
+        AnalysisJob.objects.filter(id=job_ids[1]).update(lease_expires_at=expired, attempts=2)
+
+        requeued, failed = reap_expired_jobs()
+
+        self.assertEqual(requeued, [job_ids[0]])
+        self.assertEqual([job_id for job_id, _ in failed], [job_ids[1]])
+        self.assertEqual(AnalysisJob.objects.get(id=job_ids[0]).status, 'pending')
+        self.assertEqual(AnalysisJob.objects.get(id=job_ids[1]).status, 'failed')
+        # The job whose lease is still valid is left to its worker
+        self.assertEqual(AnalysisJob.objects.get(id=job_ids[2]).status, 'processing')
+
+    @override_settings(ANALYSIS_MAX_ATTEMPTS=1)
+    def test_summary_follows_job_status_transitions(self):
+        job_ids = self.create_jobs(self.users[0], 3)
+        uav_flight_id = AnalysisJob.objects.get(id=job_ids[0]).uav_flight_id
+        # As recorded by start_analysis
+        record_job_status_change(uav_flight_id, new_status='pending', count=3)
+        summary = FlightAnalysisSummary.objects.get(uav_flight_id=uav_flight_id)
+
+        def job_counts():
+            summary.refresh_from_db()
+            return summary.pending_jobs, summary.processing_jobs, summary.completed_jobs, summary.failed_jobs
+
+        claim_next_jobs(3, 'worker')
+        self.assertEqual(job_counts(), (0, 3, 0, 0))
+
+        release_job(job_ids[0], 'worker')
+        self.assertEqual(job_counts(), (1, 2, 0, 0))
+
+        # No response from the Flask service, the job fails
+        finish_analysis_job(AnalysisJob.objects.select_related('field_image').get(id=job_ids[1]), None, 'worker')
+        self.assertEqual(job_counts(), (1, 1, 0, 1))
+
+        AnalysisJob.objects.filter(id=job_ids[2]).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        reap_expired_jobs()
+        self.assertEqual(job_counts(), (1, 0, 0, 2))
+
+
+class AnalysisStatusTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='statususer', password='testpass', role='farmer', email='statususer@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.uav_flight = UAVFlight.objects.create(owner=self.user, flight_date=timezone.now())
+        image = FieldImage.objects.create(uav_flight=self.uav_flight, image='field_images/status.jpg')
+        self.job = AnalysisJob.objects.create(owner=self.user, uav_flight=self.uav_flight, field_image=image)
+
+    def test_unchanged_progress_is_not_modified(self):
+        url = reverse('analysis_status')
+        response = self.client.get(url, {'uav_flight_id': self.uav_flight.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        response = self.client.get(url, {'uav_flight_id': self.uav_flight.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        AnalysisJob.objects.filter(id=self.job.id).update(status='completed')
+        response = self.client.get(url, {'uav_flight_id': self.uav_flight.id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_invalid_uav_flight_id(self):
+        for name in ('analysis_status', 'analysis_status_stream'):
+            response = self.client.get(reverse(name), {'uav_flight_id': 'abc'})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_streams_beyond_the_limit_are_rejected(self):
+        slots = threading.BoundedSemaphore(1)
+        with mock.patch('api.views.views_analysis.status_stream_slots', slots):
+            response = self.client.get(reverse('analysis_status_stream'), {'uav_flight_id': self.uav_flight.id})
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+            rejected = self.client.get(reverse('analysis_status_stream'), {'uav_flight_id': self.uav_flight.id})
+            self.assertEqual(rejected.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertIn('Retry-After', rejected)
+
+            # Closing the first stream gives its slot back
+            response.close()
+            self.assertTrue(slots.acquire(blocking=False))
+
+
+class FieldClipTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='clipuser', password='testpass', role='farmer', email='clipuser@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.season = Season.objects.create(name='Clip Season', owner=self.user, start_date=timezone.now().date(), end_date=timezone.now().date())
+        self.uav_flight = UAVFlight.objects.create(owner=self.user, flight_date=timezone.now())
+        self.image = FieldImage.objects.create(
+            uav_flight=self.uav_flight, image='field_images/clip.jpg', gps_latitude='0.5', gps_longitude='0.5',
+            location=Point(0.5, 0.5, srid=4326), altitude=350.0,
+        )
+
+    def link_field(self, x_min, ground_elevation):
+        field = Field.objects.create(
+            owner=self.user, name=f'Field {x_min}', ground_elevation=ground_elevation,
+            location=Polygon(((x_min, 0), (x_min + 1, 0), (x_min + 1, 1), (x_min, 1), (x_min, 0)), srid=4326),
+        )
+        field_season = FieldSeasonAssociation.objects.create(field=field, season=self.season)
+        UAVFlightFieldSeasonAssociation.objects.create(uav_flight=self.uav_flight, field_season=field_season)
+        return field
+
+    def test_clip_to_field_requires_the_ground_elevation(self):
+        self.link_field(0, ground_elevation=None)
+
+        response = self.client.post(reverse('analysis-job'), {'uav_flight_id': self.uav_flight.id, 'clip_to_field': 'true'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(AnalysisJob.objects.exists())
+
+    def test_footprint_height_above_the_field_below_the_image(self):
+        self.link_field(0, ground_elevation=300.0)
+        self.link_field(5, ground_elevation=100.0)
+
+        data = get_field_clip_data(self.image)
+        self.assertEqual(data['gps_altitude'], 50.0)
+
+    def test_footprint_height_above_the_mean_elevation_outside_the_fields(self):
+        self.link_field(5, ground_elevation=300.0)
+        self.link_field(10, ground_elevation=200.0)
+
+        data = get_field_clip_data(self.image)
+        self.assertEqual(data['gps_altitude'], 100.0)
+
+    def test_unknown_ground_elevation_analyses_the_full_image(self):
+        self.link_field(5, ground_elevation=None)
+        self.assertEqual(get_field_clip_data(self.image), {})
+
+
+class UploadSessionTests(APITestCase):
+
+    content = b'0123456789'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+        media_settings = override_settings(MEDIA_ROOT=self.media_root, UPLOAD_DIR=os.path.join(self.media_root, 'uploads'))
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.user = User.objects.create_user(username='uploaduser', password='testpass', role='farmer', email='uploaduser@gmail.com')
+        self.client.force_authenticate(user=self.user)
+
+    def create_session(self, sha256=None):
+        response = self.client.post(reverse('create_upload_session'), {
+            'flight_date': timezone.now().isoformat(),
+            'files': [{'name': 'image.jpg', 'size': len(self.content), 'sha256': sha256 or hashlib.sha256(self.content).hexdigest()}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id'], response.data['files'][0]
+
+    def upload_chunk(self, file_id, offset, chunk):
+        url = f"{reverse('upload_chunk')}?file_id={file_id}&offset={offset}"
+        return self.client.put(url, chunk, content_type='application/octet-stream')
+
+    def finalize(self, session_id):
+        with mock.patch('api.views.views_uploads.async_task'):
+            return self.client.post(reverse('finalize_upload_session'), {'session_id': session_id}, format='json')
+
+    def test_resume_after_an_offset_mismatch(self):
+        session_id, uploaded_file = self.create_session()
+
+        response = self.upload_chunk(uploaded_file['id'], 0, self.content[:4])
+        self.assertEqual(response.data['received_bytes'], 4)
+
+        # A retried chunk is rejected with the offset to continue from
+        response = self.upload_chunk(uploaded_file['id'], 0, self.content[:4])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['received_bytes'], 4)
+
+        response = self.client.get(reverse('get_upload_session'), {'session_id': session_id})
+        self.assertEqual(response.data['files'][0]['received_bytes'], 4)
+
+        response = self.upload_chunk(uploaded_file['id'], 4, self.content[4:])
+        self.assertTrue(response.data['complete'])
+
+        response = self.finalize(session_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        field_image = FieldImage.objects.get(uav_flight_id=response.data['id'])
+        self.assertEqual(field_image.content_hash, hashlib.sha256(self.content).hexdigest())
+        with field_image.image.open('rb') as image_file:
+            self.assertEqual(image_file.read(), self.content)
+
+    def test_hash_mismatch_resets_the_file(self):
+        session_id, uploaded_file = self.create_session(sha256=hashlib.sha256(b'other content').hexdigest())
+        self.upload_chunk(uploaded_file['id'], 0, self.content)
+
+        response = self.finalize(session_id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['corrupted_files'], [uploaded_file['id']])
+        self.assertEqual(UploadedFile.objects.get(id=uploaded_file['id']).received_bytes, 0)
+        self.assertFalse(UAVFlight.objects.exists())
+
+    def test_known_content_reuses_the_stored_image(self):
+        uav_flight = UAVFlight.objects.create(owner=self.user, flight_date=timezone.now())
+        original = FieldImage.objects.create(
+            uav_flight=uav_flight, image='field_images/known.jpg', resized_image='resized_field_images/known.jpg',
+            content_hash=hashlib.sha256(self.content).hexdigest(),
+        )
+
+        session_id, uploaded_file = self.create_session()
+        self.assertTrue(uploaded_file['complete'])
+        self.assertEqual(uploaded_file['duplicate_of'], original.id)
+
+        response = self.finalize(session_id)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        field_image = FieldImage.objects.get(uav_flight_id=response.data['id'])
+        self.assertEqual(field_image.image.name, original.image.name)
+        # Nothing is left to ingest
+        self.assertEqual(UAVFlight.objects.get(id=response.data['id']).ingest_status, 'completed')
+
+    def test_failed_finalize_keeps_the_uploaded_files(self):
+        session_id, uploaded_file = self.create_session()
+        self.upload_chunk(uploaded_file['id'], 0, self.content)
+
+        with mock.patch('api.views.views_uploads.FieldImage.objects.bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.finalize(session_id)
+
+        self.assertEqual(UploadSession.objects.get(id=session_id).status, 'open')
+        with open(upload_part_path(UploadedFile.objects.get(id=uploaded_file['id'])), 'rb') as part_file:
+            self.assertEqual(part_file.read(), self.content)
+        self.assertEqual(self.finalize(session_id).status_code, status.HTTP_201_CREATED)
+
+
+class ImageTileTests(APITestCase):
+
+    def setUp(self):
+        self.tile_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tile_root, True)
+        tile_settings = override_settings(TILE_ROOT=self.tile_root, IMAGE_TILE_FORMAT='PNG')
+        tile_settings.enable()
+        self.addCleanup(tile_settings.disable)
+
+        self.user = User.objects.create_user(username='tileuser', password='testpass', role='farmer', email='tileuser@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        uav_flight = UAVFlight.objects.create(owner=self.user, flight_date=timezone.now())
+        self.image = FieldImage.objects.create(uav_flight=uav_flight, image='field_images/tiles.jpg')
+        self.metadata_url = reverse('image_tile_metadata', args=['field-image', self.image.id])
+
+    def generate_pyramid(self, image=None):
+        image_file = BytesIO()
+        Image.new('RGB', (600, 300), (0, 128, 0)).save(image_file, format='PNG')
+        image_file.seek(0)
+        generate_pyramid('field-image', (image or self.image).id, image_file)
+
+    def get_tile(self, url):
+        response = self.client.get(url)
+        if response.streaming:
+            response.close()
+        return response
+
+    def signed_tile_url(self, z=0, x=0, y=0):
+        response = self.client.get(self.metadata_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['tile_url'].replace('{z}', str(z)).replace('{x}', str(x)).replace('{y}', str(y))
+
+    def test_missing_pyramid_is_built_once_in_the_background(self):
+        with mock.patch('api.views.views_tiles.async_task') as async_task:
+            response = self.client.get(self.metadata_url)
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertIn('Retry-After', response)
+
+            # Tiles answer 404 with Retry-After until the pyramid exists
+            response = self.get_tile(reverse('image_tile', args=['field-image', self.image.id, 0, 0, 0]))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertIn('Retry-After', response)
+
+            self.assertEqual(self.client.get(self.metadata_url).status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(async_task.call_count, 1)
+
+    def test_signed_tile_url(self):
+        self.generate_pyramid()
+        tile_url = self.signed_tile_url(z=2, x=2, y=1)
+        self.client.force_authenticate(user=None)
+
+        response = self.get_tile(tile_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('immutable', response['Cache-Control'])
+
+        self.assertEqual(self.get_tile(tile_url.replace('signature=', 'signature=x')).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.get_tile(reverse('image_tile', args=['field-image', self.image.id, 2, 2, 1])).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_signature_only_covers_its_image(self):
+        other_image = FieldImage.objects.create(uav_flight=self.image.uav_flight, image='field_images/other.jpg')
+        self.generate_pyramid()
+        self.generate_pyramid(other_image)
+        signature = self.signed_tile_url().split('signature=')[1]
+        self.client.force_authenticate(user=None)
+
+        url = reverse('image_tile', args=['field-image', other_image.id, 0, 0, 0]) + f'?signature={signature}'
+        self.assertEqual(self.get_tile(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_signature_expires_and_dies_with_the_image(self):
+        self.generate_pyramid()
+        tile_url = self.signed_tile_url()
+        self.client.force_authenticate(user=None)
+
+        expired = time.time() + settings.TILE_URL_MAX_AGE + settings.TILE_URL_ROTATION + 1
+        with mock.patch('django.core.signing.time.time', return_value=expired):
+            self.assertEqual(self.get_tile(tile_url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.image.delete()
+        self.assertEqual(self.get_tile(tile_url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+class WeedTileTests(APITestCase):
+
+    def setUp(self):
+        self.weed_tile_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.weed_tile_root, True)
+        tile_settings = override_settings(WEED_TILE_ROOT=self.weed_tile_root)
+        tile_settings.enable()
+        self.addCleanup(tile_settings.disable)
+
+        self.user = User.objects.create_user(username='weeduser', password='testpass', role='farmer', email='weeduser@gmail.com')
+        self.season = Season.objects.create(name='Weed Season', owner=self.user, start_date=timezone.now().date(), end_date=timezone.now().date())
+        field = Field.objects.create(
+            owner=self.user, name='Weed Field', ground_elevation=300.0,
+            location=Polygon(((8.0, 50.0), (8.01, 50.0), (8.01, 50.01), (8.0, 50.01), (8.0, 50.0)), srid=4326),
+        )
+        field_season = FieldSeasonAssociation.objects.create(field=field, season=self.season)
+        self.uav_flight = UAVFlight.objects.create(owner=self.user, flight_date=timezone.now())
+        UAVFlightFieldSeasonAssociation.objects.create(uav_flight=self.uav_flight, field_season=field_season)
+
+    def add_result(self, lat, lon, altitude, result_data):
+        image = FieldImage.objects.create(
+            uav_flight=self.uav_flight, image='field_images/weeds.jpg', gps_latitude=str(lat), gps_longitude=str(lon),
+            location=Point(lon, lat, srid=4326), altitude=altitude,
+        )
+        return ProcessingResult.objects.create(image=image, result_data=result_data)
+
+    def test_footprints_near_the_tile(self):
+        self.add_result(50.005, 8.005, 350.0, {'weeds': 12.0, 'tile_weed_density': [[10.0, 20.0]]})
+        # Far outside every tile around the field
+        self.add_result(50.5, 8.5, 350.0, {'weeds': 30.0})
+        # Below the ground elevation of the field, cannot be projected
+        self.add_result(50.005, 8.006, 250.0, {'weeds': 40.0})
+
+        footprints = image_footprints(self.season.id, self.uav_flight.id, (50.0, 8.0, 50.01, 8.01))
+        self.assertEqual(footprints, [{'lat': 50.005, 'lon': 8.005, 'height': 50.0, 'density_grid': [[10.0, 20.0]]}])
+        self.assertEqual(image_footprints(self.season.id, self.uav_flight.id, (-10.0, -10.0, -9.0, -9.0)), [])
+
+    def test_latest_result_of_every_image(self):
+        result = self.add_result(50.005, 8.005, 350.0, {'weeds': 12.0})
+        ProcessingResult.objects.create(image=result.image, result_data={'weeds': 5.0})
+
+        footprints = image_footprints(self.season.id, 0, (50.0, 8.0, 50.01, 8.01))
+        self.assertEqual([footprint['density_grid'] for footprint in footprints], [[[5.0]]])
+
+    @override_settings(UAV_CAMERA_HFOV=90.0)
+    def test_footprint_cells_split_the_image_footprint(self):
+        footprint = {'lat': 0.0, 'lon': 0.0, 'height': 50.0, 'density_grid': [[10.0, 20.0]]}
+
+        (west_cell, west_density), (east_cell, east_density) = footprint_cells(footprint)
+        # 50 m above ground with a 90 degree lens covers 100 m, the cells are 50 m wide
+        self.assertEqual((west_density, east_density), (10.0, 20.0))
+        self.assertAlmostEqual(west_cell[1], -50 / 111320.0)
+        self.assertAlmostEqual(west_cell[3], 0.0)
+        self.assertAlmostEqual(east_cell[3], 50 / 111320.0)
+        self.assertAlmostEqual(west_cell[2] - west_cell[0], 50 / 110540.0)
+
+    def test_new_results_make_cached_tiles_stale(self):
+        # Tiles rendered after the last invalidation, which happened when the flight was linked
+        tiles = [weed_tile_path(self.season.id, flight_key, 16, 0, 0) for flight_key in (self.uav_flight.id, 0)]
+        for flight_key, path in zip((self.uav_flight.id, 0), tiles):
+            os.utime(weed_tiles_stamp_path(self.season.id, flight_key), (time.time() - 120, time.time() - 120))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb'):
+                pass
+            os.utime(path, (time.time() - 60, time.time() - 60))
+        self.assertTrue(is_weed_tile_fresh(tiles[0], self.season.id, self.uav_flight.id))
+        self.assertTrue(is_weed_tile_fresh(tiles[1], self.season.id, 0))
+
+        self.add_result(50.005, 8.005, 350.0, {'weeds': 12.0})
+        self.assertFalse(is_weed_tile_fresh(tiles[0], self.season.id, self.uav_flight.id))
+        # The season-wide overlay includes the flight
+        self.assertFalse(is_weed_tile_fresh(tiles[1], self.season.id, 0))
+
+
+class SeasonAnalyticsTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='analyticsuser', password='testpass', role='farmer', email='analyticsuser@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.season = Season.objects.create(name='Analytics Season', owner=self.user, start_date=timezone.now().date(), end_date=timezone.now().date())
+        self.uav_flight = UAVFlight.objects.create(owner=self.user, flight_date=timezone.now())
+        # Field C overlaps field A, the flight is linked to all three
+        self.fields = {
+            name: self.link_field(name, x_min, y_max)
+            for name, x_min, y_max in (('A', 0, 1), ('B', 2, 1), ('C', 0, 2))
+        }
+        image_a = self.add_image(0.5, 0.5)
+        self.add_result(image_a, 50.0, timezone.now() - timedelta(days=1))
+        self.add_result(image_a, 10.0, timezone.now())
+        self.add_result(self.add_image(2.5, 0.5), 30.0, timezone.now())
+
+    def link_field(self, name, x_min, y_max):
+        field = Field.objects.create(
+            owner=self.user, name=name,
+            location=Polygon(((x_min, 0), (x_min + 1, 0), (x_min + 1, y_max), (x_min, y_max), (x_min, 0)), srid=4326),
+        )
+        field_season = FieldSeasonAssociation.objects.create(field=field, season=self.season)
+        UAVFlightFieldSeasonAssociation.objects.create(uav_flight=self.uav_flight, field_season=field_season)
+        return field
+
+    def add_image(self, lon, lat):
+        return FieldImage.objects.create(uav_flight=self.uav_flight, image='field_images/analytics.jpg', location=Point(lon, lat, srid=4326))
+
+    def add_result(self, image, weeds, date_processed):
+        ProcessingResult.objects.create(image=image, date_processed=date_processed, result_data={'weeds': weeds, 'sorghum': 50.0, 'background': 50.0 - weeds})
+
+    def get_analytics(self, **params):
+        response = self.client.get(reverse('season_analytics'), {'season_id': self.season.id, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_every_image_is_counted_once_with_its_latest_result(self):
+        data = self.get_analytics()
+
+        # Images count for the fields containing them, and once for the season
+        fields = {field['field_name']: field for field in data['fields']}
+        self.assertEqual({name: field['image_count'] for name, field in fields.items()}, {'A': 1, 'B': 1, 'C': 1})
+        self.assertEqual(fields['A']['classes']['weeds']['mean'], 10.0)
+        self.assertEqual(fields['B']['classes']['weeds']['mean'], 30.0)
+        self.assertEqual(data['season']['image_count'], 2)
+        self.assertEqual(data['season']['classes']['weeds']['mean'], 20.0)
+        self.assertEqual(data['season']['classes']['weeds']['max'], 30.0)
+
+    def test_restricted_to_one_field(self):
+        data = self.get_analytics(field_id=self.fields['B'].id)
+
+        self.assertEqual([field['field_name'] for field in data['fields']], ['B'])
+        self.assertEqual(data['season']['image_count'], 1)
+        self.assertEqual(len(data['fields'][0]['series']), 1)
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'season_id': 'abc'}, {'season_id': self.season.id, 'field_id': 'abc'}):
+            response = self.client.get(reverse('season_analytics'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FlightAnalysisSummaryTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='summaryuser', password='testpass', role='farmer', email='summaryuser@gmail.com')
+        self.client.force_authenticate(user=self.user)
+        self.uav_flight = UAVFlight.objects.create(owner=self.user, flight_date=timezone.now())
+        self.images = [FieldImage.objects.create(uav_flight=self.uav_flight, image='field_images/summary.jpg') for _ in range(2)]
+
+    def add_result(self, image, weeds, date_processed):
+        result = ProcessingResult.objects.create(image=image, result_data={'weeds': weeds, 'total_pixels': 100}, date_processed=date_processed)
+        record_processing_result(self.uav_flight.id, result)
+
+    def test_summary_counts_the_latest_result_of_every_image(self):
+        now = timezone.now()
+        self.add_result(self.images[0], 10, now - timedelta(minutes=2))
+        self.add_result(self.images[1], 20, now - timedelta(minutes=2))
+        # A re-analysis replaces the image's previous result
+        self.add_result(self.images[0], 30, now - timedelta(minutes=1))
+        # A result older than the latest one of its image changes nothing
+        self.add_result(self.images[0], 50, now - timedelta(minutes=3))
+
+        summary = FlightAnalysisSummary.objects.get(uav_flight=self.uav_flight)
+        self.assertEqual(summary.processed_images, 2)
+        self.assertEqual(summary.weight_sum, 200)
+        self.assertEqual(summary.weeds_sum, 50)
+        self.assertEqual(summary.weeds_weighted_sum, 5000)
+
+        # The incremental summary matches a rebuild from the latest results
+        rebuild_flight_summaries([self.uav_flight.id])
+        summary.refresh_from_db()
+        self.assertEqual((summary.processed_images, summary.weeds_sum), (2, 50))
+
+    def test_flight_analysis_summaries_reject_invalid_uav_flight_id(self):
+        response = self.client.get(reverse('flight_analysis_summaries'), {'uav_flight_id': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class StartAnalysisTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='startuser', password='testpass', role='farmer', email='startuser@gmail.com')
+        self.client.force_authenticate(user=self.user)
+
+    def test_concurrent_start_analysis_conflicts(self):
+        uav_flight = UAVFlight.objects.create(owner=self.user, flight_date=timezone.now())
+        image = FieldImage.objects.create(uav_flight=uav_flight, image='field_images/concurrent.jpg')
+        bulk_create = AnalysisJob.objects.bulk_create
+
+        def create_after_concurrent_request(jobs, *args, **kwargs):
+            # Another request created an active job for the image after this one checked for it
+            AnalysisJob.objects.create(owner=self.user, uav_flight=uav_flight, field_image=image, status='pending')
+            return bulk_create(jobs, *args, **kwargs)
+
+        with mock.patch('api.views.views_analysis.async_task') as async_task, \
+                mock.patch.object(AnalysisJob.objects, 'bulk_create', side_effect=create_after_concurrent_request):
+            response = self.client.post(reverse('analysis-job'), {'uav_flight_id': uav_flight.id}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(async_task.called)
+        self.assertFalse(AnalysisJob.objects.filter(field_image=image).exists())
+
+
+@override_settings(
+    RESPONSE_CACHE_ENABLED=True,
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'response-cache-tests'},
+    },
+)
+class ResponseCacheTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cacheuser', password='testpass', role='farmer', email='cacheuser@gmail.com')
+        self.field = Field.objects.create(name='Cached Field', location='POINT(5 5)', owner=self.user)
+        self.client.force_authenticate(user=self.user)
+        response_cache().clear()
+
+    def field_names(self):
+        response = self.client.get(reverse('my_fields'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [field['name'] for field in response.data]
+
+    def test_bulk_writes_are_served_from_the_cache_until_invalidated(self):
+        self.assertEqual(self.field_names(), ['Cached Field'])
+        # update() sends no post_save, the cached response is served
+        Field.objects.filter(id=self.field.id).update(name='Renamed Field')
+        self.assertEqual(self.field_names(), ['Cached Field'])
+
+        invalidate_user_responses(self.user.id)
+        self.assertEqual(self.field_names(), ['Renamed Field'])
+
+    def test_saves_invalidate_through_signals(self):
+        self.assertEqual(self.field_names(), ['Cached Field'])
+        self.field.name = 'Saved Field'
+        self.field.save()
+        self.assertEqual(self.field_names(), ['Saved Field'])
+
+    def test_culled_version_does_not_revive_older_responses(self):
+        self.assertEqual(self.field_names(), ['Cached Field'])
+        invalidate_user_responses(self.user.id)
+        Field.objects.filter(id=self.field.id).update(name='Renamed Field')
+        self.assertEqual(self.field_names(), ['Renamed Field'])
+
+        # Culling drops the version key while the responses stored under earlier versions stay
+        response_cache().delete(f'response_version:{self.user.id}')
+        Field.objects.filter(id=self.field.id).update(name='Culled Field')
+        self.assertEqual(self.field_names(), ['Culled Field'])
+
+    def test_bulk_write_helpers_invalidate(self):
+        season = Season.objects.create(name='Cached Season', owner=self.user, start_date=timezone.now().date(), end_date=timezone.now().date())
+        field_season = FieldSeasonAssociation.objects.create(field=self.field, season=season)
+        uav_flight = UAVFlight.objects.create(owner=self.user, flight_date=timezone.now())
+        writes = [
+            lambda: create_flight_links(self.user.id, [(uav_flight.id, field_season.id, season.id)]),
+            lambda: update_ingest_status(UAVFlight.objects.filter(id=uav_flight.id), 'completed'),
+        ]
+
+        for number, write in enumerate(writes):
+            self.field_names()
+            Field.objects.filter(id=self.field.id).update(name=f'Field {number}')
+            write()
+            self.assertEqual(self.field_names(), [f'Field {number}'])
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_opens_after_consecutive_failures_and_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allow_request())
+
+        # After the reset timeout a single trial request is allowed
+        breaker.opened_at -= 61
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+
+        breaker.opened_at -= 61
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow_request())
+
+
+@override_settings(FLASK_MAX_RETRIES=2, FLASK_RETRY_BACKOFF=0)
+class PostImageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60)
+        patcher = mock.patch('api.flask_client.circuit_breaker', self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, responses):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        async def send():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url='http://flask') as client:
+                return await post_image(client, 'image.png', b'png', {})
+
+        try:
+            return asyncio.run(send())
+        finally:
+            self.requests = requests
+
+    def test_retries_unavailable_service(self):
+        result = self.post([
+            httpx.Response(503),
+            httpx.ConnectError('refused'),
+            httpx.Response(200, json={'result_data': {}}),
+        ])
+        self.assertEqual(result, {'result_data': {}})
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(self.breaker.failures, 0)
+
+    def test_image_errors_are_neither_retried_nor_counted(self):
+        for status_code in (422, 500):
+            with self.assertRaises(FlaskServiceError):
+                self.post([httpx.Response(status_code, json={'error': 'bad image'})])
+            self.assertEqual(len(self.requests), 1)
+            self.assertEqual(self.breaker.failures, 0)
+
+    def test_gives_up_after_max_retries(self):
+        with self.assertRaises(FlaskServiceError):
+            self.post([httpx.Response(502)] * 3)
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(self.breaker.failures, 3)
+
+    def test_open_circuit_sends_nothing(self):
+        for _ in range(5):
+            self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            self.post([])
+        self.assertEqual(self.requests, [])
+
+
+class LoadTestTests(SimpleTestCase):
+
+    def test_percentile(self):
+        latencies = [float(value) for value in range(1, 101)]
+        self.assertEqual(load_test.percentile(latencies, 0.5), 51.0)
+        self.assertEqual(load_test.percentile(latencies, 0.99), 99.0)
+        self.assertEqual(load_test.percentile([3.0], 0.95), 3.0)
+        self.assertIsNone(load_test.percentile([], 0.5))
+
+    def test_run_level_counts_requests_and_errors(self):
+        responses = iter([mock.Mock(status_code=200), mock.Mock(status_code=500), requests.ConnectionError()] * 4)
+        lock = threading.Lock()
+
+        def get(url, timeout):
+            with lock:
+                response = next(responses)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        with mock.patch('load_test.requests.Session') as session_class:
+            session = session_class.return_value.__enter__.return_value
+            session.headers = {}
+            session.get.side_effect = get
+            result = load_test.run_level('http://backend/api/', 'token', ['my-fields/', 'list-seasons/'], concurrency=2, requests_per_client=6)
+
+        self.assertEqual(result['concurrency'], 2)
+        self.assertEqual(result['requests'], 12)
+        self.assertEqual(result['errors'], 8)
+        self.assertEqual(session.headers['Authorization'], 'Token token')
+        requested = {call.args[0] for call in session.get.call_args_list}
+        self.assertEqual(requested, {'http://backend/api/my-fields/', 'http://backend/api/list-seasons/'})
@@ -0,0 +1,115 @@
+import json
+import math
+import os
+import shutil
+import time
+import uuid
+from django.conf import settings
+from PIL import Image
+
+TILE_SIZE = 256
+
+# Tile pyramids are kept per image kind, photos are stored lossy and analysis masks lossless
+# so the class colours stay exact
+TILE_KINDS = {
+    'field-image': {'lossless': False, 'resample': Image.Resampling.LANCZOS},
+    'generated-image': {'lossless': True, 'resample': Image.Resampling.NEAREST},
+}
+
+
+def pyramid_dir(kind, object_id):
+    return os.path.join(settings.TILE_ROOT, kind, str(object_id))
+
+
+def tile_path(kind, object_id, z, x, y):
+    extension = settings.IMAGE_TILE_FORMAT.lower()
+    return os.path.join(pyramid_dir(kind, object_id), str(z), str(x), f'{y}.{extension}')
+
+
+def load_pyramid_metadata(kind, object_id):
+    """
+    Metadata of a generated pyramid (size, zoom levels, tile format) or None if it does not exist yet.
+    """
+    try:
+        with open(os.path.join(pyramid_dir(kind, object_id), 'metadata.json')) as metadata_file:
+            return json.load(metadata_file)
+    except FileNotFoundError:
+        return None
+
+
+def save_tile(tile, path, lossless):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if settings.IMAGE_TILE_FORMAT == 'WEBP':
+        tile.save(path, format='WEBP', lossless=lossless, quality=settings.IMAGE_TILE_QUALITY)
+    elif lossless:
+        tile.save(path, format='PNG')
+    else:
+        tile.convert('RGB').save(path, format='JPEG', quality=settings.IMAGE_TILE_QUALITY)
+
+
+def generate_pyramid(kind, object_id, image_file):
+    """
+    Cut an image into TILE_SIZE tiles at successive zoom levels.
+
+    Zoom level max_zoom is the full resolution, every lower level halves the image until it fits
+    into a single tile. Tiles are stored as <z>/<x>/<y> below pyramid_dir together with a
+    metadata.json. The pyramid is built in a temporary directory and moved into place at the end,
+    so concurrent generations of the same image never expose a partial pyramid.
+    """
+    options = TILE_KINDS[kind]
+    target_dir = pyramid_dir(kind, object_id)
+    temp_dir = f'{target_dir}.tmp-{uuid.uuid4().hex}'
+
+    with Image.open(image_file) as image:
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        width, height = image.size
+        max_zoom = max(0, math.ceil(math.log2(max(width, height) / TILE_SIZE)))
+
+        level = image
+        for z in range(max_zoom, -1, -1):
+            if z < max_zoom:
+                level = level.resize((max(1, math.ceil(level.width / 2)), max(1, math.ceil(level.height / 2))), options['resample'])
+            for x in range(math.ceil(level.width / TILE_SIZE)):
+                for y in range(math.ceil(level.height / TILE_SIZE)):
+                    tile = level.crop((x * TILE_SIZE, y * TILE_SIZE, min((x + 1) * TILE_SIZE, level.width), min((y + 1) * TILE_SIZE, level.height)))
+                    save_tile(tile, os.path.join(temp_dir, str(z), str(x), f'{y}.{settings.IMAGE_TILE_FORMAT.lower()}'), options['lossless'])
+
+    metadata = {'width': width, 'height': height, 'tile_size': TILE_SIZE, 'max_zoom': max_zoom, 'format': settings.IMAGE_TILE_FORMAT}
+    with open(os.path.join(temp_dir, 'metadata.json'), 'w') as metadata_file:
+        json.dump(metadata, metadata_file)
+
+    try:
+        os.rename(temp_dir, target_dir)
+    except OSError:
+        # Another worker finished the same pyramid first
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return metadata
+
+
+def claim_pyramid_build(kind, object_id):
+    """
+    Lock file marking that a pyramid is being generated, so concurrent tile requests enqueue a
+    single build. Returns False while another build holds the lock, locks older than
+    IMAGE_TILE_BUILD_TIMEOUT are left over from a killed worker and taken over.
+    """
+    lock_path = f'{pyramid_dir(kind, object_id)}.lock'
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        try:
+            if time.time() - os.path.getmtime(lock_path) < settings.IMAGE_TILE_BUILD_TIMEOUT:
+                return False
+            os.utime(lock_path)
+            return True
+        except FileNotFoundError:
+            # The build just finished
+            return False
+
+
+def release_pyramid_build(kind, object_id):
+    try:
+        os.remove(f'{pyramid_dir(kind, object_id)}.lock')
+    except FileNotFoundError:
+        pass
@@ -27,11 +27,32 @@ from .views.views_flights import (
     delete_uav_flight,
     get_uav_flights_by_owner,
     link_uav_flight_to_field_season,
+    auto_link_uav_flights_to_field_seasons,
     get_uav_flights_for_field_season,
     get_images_for_uav_flight,
+    get_images_in_area,
 )
 
-from .views.views_analysis import start_analysis, get_generated_images_for_uav_flight, uav_flights_with_completed_analysis
+from .views.views_analysis import (
+    start_analysis,
+    get_generated_images_for_uav_flight,
+    uav_flights_with_completed_analysis,
+    analysis_status,
+    analysis_status_stream,
+    season_analytics,
+    get_flight_analysis_summaries,
+    response_cache_metrics,
+    analysis_queue_metrics,
+)
+
+from .views.views_uploads import (
+    create_upload_session,
+    get_upload_session,
+    upload_chunk,
+    finalize_upload_session,
+)
+
+from .views.views_tiles import image_tile_metadata, image_tile, weed_tile_metadata, weed_tile
 
 from .views.views_mock_server import mock_ml_server
 
@@ -66,14 +87,34 @@ urlpatterns = [
     # UAV Flight-related URLs
     path('create-uav-flight/', create_uav_flight, name='create_uav_flight'),
     path('link-uav-flight-to-field-season/', link_uav_flight_to_field_season, name='link_uav_flight_to_field_season'),
+    path('auto-link-uav-flights/', auto_link_uav_flights_to_field_seasons, name='auto_link_uav_flights'),
     path('get-uav-flights-for-field-season/', get_uav_flights_for_field_season, name='get_uav_flights_for_field_season'),
     path('get-images-for-uav-flight/', get_images_for_uav_flight, name='get_images_for_uav_flight'),
+    path('get-images-in-area/', get_images_in_area, name='get_images_in_area'),
     path('get-uav-flights-by-owner/', get_uav_flights_by_owner, name='get_uav_flights_by_owner'),
     path('delete-uav-flight/', delete_uav_flight, name='delete_uav_flight'),
 
+    # Resumable upload URLs
+    path('create-upload-session/', create_upload_session, name='create_upload_session'),
+    path('get-upload-session/', get_upload_session, name='get_upload_session'),
+    path('upload-chunk/', upload_chunk, name='upload_chunk'),
+    path('finalize-upload-session/', finalize_upload_session, name='finalize_upload_session'),
+
     path('analysis-job/', start_analysis, name='analysis-job'),
     path('mock-ml-server/', mock_ml_server, name='mock-ml-server'),
     path('get-generated-images-for-uav-flight/', get_generated_images_for_uav_flight, name='get_generated_images_for_uav_flight'),
     path('uav-flights-with-completed-analysis/', uav_flights_with_completed_analysis, name='uav_flights_with_completed_analysis'),
+    path('analysis-status/', analysis_status, name='analysis_status'),
+    path('analysis-status/stream/', analysis_status_stream, name='analysis_status_stream'),
+    path('season-analytics/', season_analytics, name='season_analytics'),
+    path('flight-analysis-summaries/', get_flight_analysis_summaries, name='flight_analysis_summaries'),
+    path('response-cache-metrics/', response_cache_metrics, name='response_cache_metrics'),
+    path('analysis-queue-metrics/', analysis_queue_metrics, name='analysis_queue_metrics'),
+
+    # Image tile pyramid URLs
+    path('image-tiles/<str:kind>/<int:image_id>/', image_tile_metadata, name='image_tile_metadata'),
+    path('image-tiles/<str:kind>/<int:image_id>/<int:z>/<int:x>/<int:y>/', image_tile, name='image_tile'),
+    path('weed-tiles/<int:season_id>/<int:uav_flight_id>/', weed_tile_metadata, name='weed_tile_metadata'),
+    path('weed-tiles/<int:season_id>/<int:uav_flight_id>/<int:z>/<int:x>/<int:y>/', weed_tile, name='weed_tile'),
 ]
 
@@ -1,7 +1,9 @@
 from PIL import Image
 from io import BytesIO
 from django.core.files.base import ContentFile
+from django.contrib.gis.geos import Point
 import exifread
+import hashlib
 import re
 
 
@@ -56,14 +58,53 @@ def convert_gps_to_decimal(gps_coord, gps_ref):
         return None
 
 
+def gps_point(latitude, longitude):
+    """
+    PostGIS point (WGS84) from decimal latitude and longitude, given as numbers or strings.
+    Returns None if either coordinate is missing or not numeric.
+    """
+    try:
+        return Point(float(longitude), float(latitude), srid=4326)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_altitude(altitude):
+    try:
+        return float(altitude)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_exif_altitude(altitude_tag, altitude_ref_tag=None):
+    """
+    Altitude in meters from the exifread GPSAltitude tag, a rational such as 5123/10.
+    GPSAltitudeRef 1 marks altitudes below sea level. Returns None if the tag is missing or invalid.
+    """
+    try:
+        ratio = altitude_tag.values[0]
+        if ratio.den == 0:
+            return None
+        altitude = ratio.num / ratio.den
+    except (AttributeError, IndexError, TypeError):
+        return None
+    try:
+        if altitude_ref_tag is not None and int(altitude_ref_tag.values[0]) == 1:
+            altitude = -altitude
+    except (AttributeError, IndexError, TypeError, ValueError):
+        pass
+    return altitude
+
+
 def get_image_metadata(uploaded_file):
     tags = exifread.process_file(uploaded_file, details=False)
+    altitude = parse_exif_altitude(tags.get("GPS GPSAltitude"), tags.get("GPS GPSAltitudeRef"))
     metadata = {
         "gps_latitude_ref": str(tags.get("GPS GPSLatitudeRef", "")),
         "gps_latitude": str(tags.get("GPS GPSLatitude", "")),
         "gps_longitude_ref": str(tags.get("GPS GPSLongitudeRef", "")),
         "gps_longitude": str(tags.get("GPS GPSLongitude", "")),
-        "gps_altitude": extract_numeric_value(str(tags.get("GPS GPSAltitude", ""))),
+        "gps_altitude": str(altitude) if altitude is not None else None,
     }
     return metadata
 
@@ -74,4 +115,14 @@ def resize_image(original_image, target_size=(1024, 1024)):
         output = BytesIO()
         img.save(output, format='JPEG', quality=85)
         output.seek(0)
-        return ContentFile(output.read(), name=original_image.name)
\ No newline at end of file
+        return ContentFile(output.read(), name=original_image.name)
+
+
+def file_sha256(file, block_size=1024 * 1024):
+    """
+    SHA-256 hex digest of an open binary file, read in blocks from the current position.
+    """
+    sha256 = hashlib.sha256()
+    for block in iter(lambda: file.read(block_size), b''):
+        sha256.update(block)
+    return sha256.hexdigest()
@@ -1,21 +1,40 @@
-import time
 from rest_framework import views, status
 from rest_framework.response import Response
-from django_q.tasks import async_task
-from ..models import AnalysisJob, FieldImage, UAVFlight, ProcessingResult, User
-from ..serializers import AnalysisJobSerializer, ProcessingResultSerializer, UAVFlightSerializer
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
-import requests
+from django_q.tasks import async_task, schedule
+from django_q.models import Schedule
+from ..models import AnalysisJob, Field, FieldImage, FlightAnalysisSummary, UAVFlight, ProcessingResult, Season, User
+from ..serializers import AnalysisJobSerializer, FlightAnalysisSummarySerializer, ProcessingResultSerializer, UAVFlightSerializer
+from ..pagination import paginated_response
+from ..caching import CACHED_VIEWS, cache_metrics, cache_response_per_user
+from ..tiling import generate_pyramid
+from ..summaries import RESULT_CLASSES, latest_results, record_job_status_change, record_processing_result, result_statistics_aggregates
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from ..flask_client import CircuitOpenError, circuit_breaker, create_client, post_image
+from .views_flights import reap_stale_ingests
+from ..scheduling import claim_next_jobs, queue_metrics, reap_expired_jobs, release_job, renew_leases
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
+from datetime import timedelta
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.utils import timezone
 import base64
-from django.db.models import Exists, OuterRef
+from io import BytesIO
+import hashlib
+import threading
+import json
+import uuid
+from django.db.models import Count, Exists, F, Max, OuterRef, Q
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.contrib.gis.db.models import Union
 from django.conf import settings
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
-from django.db import transaction
+from django.db import IntegrityError, connection, transaction
 import logging
 
 logger = logging.getLogger(__name__)
@@ -51,6 +70,8 @@ def send_notification_email(job_status, recipient_email, uav_flight_date):
 def start_analysis(request):
     uav_flight_id = request.data.get('uav_flight_id', None)
     field_image_id = request.data.get('image_id', None)
+    # Only analyse the pixels inside the fields the flight is linked to
+    clip_to_field = str(request.data.get('clip_to_field', False)).lower() == 'true'
     user = request.user
     logger.warning(f"Starting analysis for uav_flight: {uav_flight_id} and field image: {field_image_id}")
     
@@ -62,128 +83,306 @@ def start_analysis(request):
     except UAVFlight.DoesNotExist:
         return Response({'error': 'UAV Flight not found'}, status=status.HTTP_404_NOT_FOUND)
     logger.warning(f"UAV Flight found: {uav_flight}")
-    images_to_process = []
+    if uav_flight.ingest_status in ['pending', 'processing']:
+        return Response({'error': 'The images of the UAV Flight are still being ingested'}, status=status.HTTP_409_CONFLICT)
+
+    if clip_to_field and Field.objects.filter(fieldseasonassociation__uav_flights=uav_flight, ground_elevation__isnull=True).exists():
+        # Without it the image footprints are computed from the height above sea level and clip the wrong pixels
+        return Response({'error': 'Set the ground elevation of the fields the UAV Flight is linked to before clipping the analysis to them'}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Check and filter for unprocessed or not in-process images
+    images = FieldImage.objects.filter(uav_flight=uav_flight)
     if field_image_id:
-        try:
-            field_image = FieldImage.objects.get(id=field_image_id, uav_flight=uav_flight)
-            if ProcessingResult.objects.filter(image=field_image).exists() or \
-               AnalysisJob.objects.filter(field_image=field_image, status__in=['pending', 'processing', 'completed']).exists():
-                return Response({'error': 'Image is already processed or in the process'}, status=status.HTTP_400_BAD_REQUEST)
-            images_to_process = [field_image]
-        except FieldImage.DoesNotExist:
+        images = images.filter(id=field_image_id)
+        if not images.exists():
             return Response({'error': 'Field Image not found'}, status=status.HTTP_404_NOT_FOUND)
-    else:
-        # Fetch all images for the UAV flight
-        all_images = FieldImage.objects.filter(uav_flight=uav_flight)
-
-        # Determine which images have not been processed or are not currently being processed
-        images_already_processed_or_processing = set(
-            ProcessingResult.objects.filter(image__uav_flight=uav_flight).values_list('image', flat=True)
-        ).union(
-            AnalysisJob.objects.filter(
-                field_image__uav_flight=uav_flight,
-                status__in=['pending', 'processing', 'completed']
-            ).values_list('field_image', flat=True)
-        )
-        logger.warning(f"Images already processed or processing: {images_already_processed_or_processing}")
-        # Filter out the images that have been processed or are being processed
-        images_to_process = [image for image in all_images if image.id not in images_already_processed_or_processing]
-        logger.warning(f"Images to process: {images_to_process}")
-        if not images_to_process:
-            return Response({'error': 'All images are already processed or being processed'}, status=status.HTTP_400_BAD_REQUEST)
-
-    job_ids = []  
-
-    # Create analysis jobs for unprocessed images and collect their IDs
-    for image in images_to_process:
-        # Create the job if no pending/processing job for the same image exists
-        if not AnalysisJob.objects.filter(field_image=image, status__in=['pending', 'processing']).exists():
-            job = AnalysisJob.objects.create(owner=user, uav_flight=uav_flight, field_image=image, status='pending')
-            job_ids.append(job.id)  # Collect the newly created job's ID
-            logger.warning(f"Created job {job.id} for image {image.id}")
-        else:
-            logger.warning(f"Job already exists for image {image.id}")
-    # Trigger analysis task and send an email at the end of processing
-    if job_ids:  # Ensure we have job IDs to process
-        for job_id in job_ids:
-            logger.warning(f"Starting async_task for job ID: {job_id}")
-            task_id = async_task(analysis_function, job_id=job_id)
-            time.sleep(1)  # Throttle task submission to avoid flooding
-            logger.warning(f"Enqueuing analysis for job ID: {job_id} with unique task ID: {task_id}")
-    else:
-        return Response({'error': 'No images to process'}, status=status.HTTP_400_BAD_REQUEST)
-    return Response({'message': 'Analysis started successfully'}, status=status.HTTP_201_CREATED)
 
+    # Unprocessed images without an active or completed job, determined in a single query
+    image_ids = list(
+        images.exclude(
+            Exists(ProcessingResult.objects.filter(image=OuterRef('pk')))
+        ).exclude(
+            Exists(AnalysisJob.objects.filter(field_image=OuterRef('pk'), status__in=['pending', 'processing', 'completed']))
+        ).values_list('id', flat=True)
+    )
+    if not image_ids:
+        if field_image_id:
+            return Response({'error': 'Image is already processed or in the process'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'error': 'All images are already processed or being processed'}, status=status.HTTP_400_BAD_REQUEST)
 
-def process_image(image_id):
+    # Create all jobs at once, the dispatcher task works through the pending jobs of all users
+    priority = AnalysisJob.PRIORITY_SINGLE_IMAGE if field_image_id else AnalysisJob.PRIORITY_BULK
+    try:
+        with transaction.atomic():
+            jobs = AnalysisJob.objects.bulk_create([
+                AnalysisJob(owner=user, uav_flight=uav_flight, field_image_id=image_id, status='pending', priority=priority, clip_to_field=clip_to_field)
+                for image_id in image_ids
+            ])
+    except IntegrityError:
+        # A concurrent request created an active job for one of the images first
+        return Response({'error': 'Images are already being processed'}, status=status.HTTP_409_CONFLICT)
+    job_ids = [job.id for job in jobs]
+    record_job_status_change(uav_flight.id, new_status='pending', count=len(job_ids))
+    task_id = async_task(dispatch_analysis_jobs)
+    logger.warning(f"Enqueued {len(job_ids)} analysis jobs for UAV Flight {uav_flight.id} with task ID: {task_id}")
+
+    return Response({'message': 'Analysis started successfully', 'job_ids': job_ids}, status=status.HTTP_201_CREATED)
+
+
+def get_field_clip_data(field_image):
     """
-    Function to process an individual image. Extracted for clarity and reusability.
+    Form data asking the Flask service to clip the analysis of an image to the polygons
+    of the fields its UAV flight is linked to. Returns an empty dict if the image cannot
+    be georeferenced, the flight is not linked to any field or the ground elevation of
+    the fields is unknown.
     """
-    try:
-        field_image = FieldImage.objects.get(id=image_id)
-        with field_image.image.open('rb') as img:
-            image_content = img.read()
-        files = {'image': (field_image.image.name, image_content, 'image/png')}
-        response = requests.post(f"{settings.FLASK_SERVICE_URL}/process_images", files=files)
-        if response.status_code == 200:
-            data = response.json()
-            image_data = base64.b64decode(data['image_base64'])
-            processed_image_content = ContentFile(image_data, name=f"generated_image_{image_id}.png")
-            ProcessingResult.objects.create(
-                image=field_image,
-                result_data=data['result_data'],
-                date_processed=timezone.now(),
-                generated_image=processed_image_content
-            )
-            return True
-    except FieldImage.DoesNotExist:
-        logger.error(f"Field Image with ID {image_id} not found")
-    except Exception as e:
-        logger.error(f"Failed to process image {image_id}: {e}")
-    return False
+    if not (field_image.gps_latitude and field_image.gps_longitude and field_image.altitude is not None):
+        logger.warning(f"Field Image {field_image.id} has no GPS position. Analysing the full image.")
+        return {}
+
+    linked_fields = Field.objects.filter(fieldseasonassociation__uav_flights=field_image.uav_flight_id)
+    field_area = linked_fields.aggregate(area=Union('location'))['area']
+    if field_area is None:
+        logger.warning(f"UAV Flight {field_image.uav_flight_id} is not linked to a field. Analysing the full image.")
+        return {}
+
+    # The GPS altitude is above sea level, the footprint needs the height above the field the image was taken over
+    ground_elevation = None
+    if field_image.location is not None:
+        ground_elevation = linked_fields.filter(location__contains=field_image.location).values_list('ground_elevation', flat=True).first()
+    if ground_elevation is None:
+        elevations = list(linked_fields.values_list('ground_elevation', flat=True))
+        if None in elevations:
+            logger.warning(f"Ground elevation of the fields of UAV Flight {field_image.uav_flight_id} unknown. Analysing the full image.")
+            return {}
+        ground_elevation = sum(elevations) / len(elevations)
+
+    return {
+        'field_polygon': field_area.json,
+        'gps_latitude': field_image.gps_latitude,
+        'gps_longitude': field_image.gps_longitude,
+        'gps_altitude': field_image.altitude - ground_elevation,
+        'camera_hfov': settings.UAV_CAMERA_HFOV,
+    }
+
+def prepare_image_request(field_image, clip_to_field=False):
+    """
+    File name, content and form data of the Flask request analysing a field image.
+    """
+    with field_image.image.open('rb') as img:
+        image_content = img.read()
+    data = get_field_clip_data(field_image) if clip_to_field else {}
+    return field_image.image.name, image_content, data
+
+def save_processing_result(field_image, image_data, result_data):
+    """
+    Store the Flask service's analysis of an image.
+    """
+    processed_image_content = ContentFile(image_data, name=f"generated_image_{field_image.id}.png")
+    return ProcessingResult.objects.create(
+        image=field_image,
+        result_data=result_data,
+        date_processed=timezone.now(),
+        generated_image=processed_image_content
+    )
+
+def dispatch_analysis_jobs():
+    """
+    django-q task working through the pending analysis jobs of all users.
+
+    Jobs are claimed under a lease by scheduling.claim_next_jobs whenever a slot becomes free, so a single
+    image queued behind a large flight is started with the next free slot, and owners take turns
+    within ANALYSIS_MAX_JOBS_PER_USER. The images are sent to the Flask service from an event
+    loop, keeping up to ANALYSIS_MAX_CONCURRENCY inference requests in flight. Once
+    ANALYSIS_TASK_TIME_BUDGET is used up no new jobs are claimed, Flask requests still running after
+    ANALYSIS_TASK_DEADLINE are cancelled and their jobs put back into the queue, and the task re-enqueues
+    itself instead of running into the django-q timeout. While the Flask service is unavailable the task
+    is retried once the circuit breaker lets requests through again.
+    """
+    started = time.monotonic()
+    deadline = started + settings.ANALYSIS_TASK_TIME_BUDGET
+    asyncio.run(run_dispatcher(deadline, started + settings.ANALYSIS_TASK_DEADLINE))
+
+    if not AnalysisJob.objects.filter(status='pending').exists():
+        return
+    if circuit_breaker.is_open:
+        next_run = timezone.now() + timedelta(seconds=settings.FLASK_CIRCUIT_RESET_TIMEOUT)
+        schedule('api.views.views_analysis.dispatch_analysis_jobs', schedule_type=Schedule.ONCE, next_run=next_run)
+        logger.warning(f"Flask service unavailable, retrying the analysis jobs at {next_run}")
+    elif time.monotonic() > deadline:
+        task_id = async_task(dispatch_analysis_jobs)
+        logger.warning(f"Time budget used up, continuing the analysis jobs in task {task_id}")
+    # Otherwise the remaining jobs belong to owners at their limit, the tasks running their jobs pick them up
+
+async def run_dispatcher(deadline, hard_deadline):
+    """
+    Keep up to ANALYSIS_MAX_CONCURRENCY jobs running, claiming new ones as running ones finish until
+    deadline, and renew the leases of the running jobs every ANALYSIS_LEASE_HEARTBEAT seconds.
+    The Flask requests still running at hard_deadline are cancelled.
+    The Flask requests share one pooled AsyncClient, the database and file work runs on a small
+    thread pool since the ORM is synchronous.
+    """
+    max_concurrency = settings.ANALYSIS_MAX_CONCURRENCY
+    lease_token = uuid.uuid4().hex
+    running = {}  # Future of every running job mapped to the job's id
+
+    with ThreadPoolExecutor(max_workers=settings.ANALYSIS_DB_WORKERS) as executor:
+        async def heartbeat():
+            while True:
+                await asyncio.sleep(settings.ANALYSIS_LEASE_HEARTBEAT)
+                try:
+                    await run_in_thread(executor, renew_leases, list(running.values()), lease_token)
+                except Exception as e:
+                    logger.error(f"Failed to renew the leases of the running analysis jobs: {e}")
+
+        heartbeat_task = asyncio.ensure_future(heartbeat())
+        try:
+            async with create_client(max_concurrency) as client:
+                while True:
+                    if len(running) < max_concurrency and time.monotonic() <= deadline and not circuit_breaker.is_open:
+                        job_ids = await run_in_thread(executor, claim_next_jobs, max_concurrency - len(running), lease_token)
+                        for job_id in job_ids:
+                            running[asyncio.ensure_future(analyse_job(job_id, lease_token, client, executor, hard_deadline))] = job_id
+                    if not running:
+                        return
+                    done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for future in done:
+                        del running[future]
+        finally:
+            heartbeat_task.cancel()
 
-def analysis_function(job_id):
-    job_status = ''
+def run_in_thread(executor, function, *args):
+    def call():
+        try:
+            return function(*args)
+        finally:
+            # Every pool thread opens its own database connection
+            connection.close()
+    return asyncio.get_running_loop().run_in_executor(executor, call)
+
+async def analyse_job(job_id, lease_token, client, executor, hard_deadline):
+    """
+    Process the image of a claimed analysis job. Returns the final status, or None if the job was put back into the queue.
+    """
     try:
-        with transaction.atomic():
-            # Lock the job row for update to prevent concurrent modifications
-            job = AnalysisJob.objects.select_for_update().get(id=job_id)
-            if job.status in ['completed', 'processing']:
-                logger.warning(f"Job {job_id} already processed or processing. Skipping.")
-                return
-
-            job.status = 'processing'
-            job.save()
-
-            success = True
-
-            if job.field_image:
-                success &= process_image(job.field_image.id)
-            else:
-                logger.error(f"No field image specified for job {job_id}")
-                success = False 
-            
-            job.status = 'completed' if success else 'failed'
-            job_status = job.status
-            job.save()
+        job, image_request = await run_in_thread(executor, load_analysis_job, job_id)
     except AnalysisJob.DoesNotExist:
         logger.error(f"AnalysisJob with ID {job_id} not found")
-    except Exception as e:
-        logger.error(f"Error processing job {job_id}: {e}")
-        job.status = 'failed'
-        job_status = job.status
-        job.save()
-    
-    # Send email notification
+        return None
+
+    response_data = None
+    if image_request is not None:
+        try:
+            response_data = await asyncio.wait_for(post_image(client, *image_request), timeout=max(hard_deadline - time.monotonic(), 0))
+        except CircuitOpenError:
+            # Not the image's fault, the job is picked up again by the next task
+            await run_in_thread(executor, release_job, job_id, lease_token)
+            return None
+        except asyncio.TimeoutError:
+            # The task would run into the django-q timeout, the job is picked up again by the next task
+            logger.warning(f"Task deadline reached, put job {job_id} back into the queue")
+            await run_in_thread(executor, release_job, job_id, lease_token)
+            return None
+        except Exception as e:
+            logger.error(f"Failed to process image of job {job_id}: {e}")
+
+    job_status = await run_in_thread(executor, finish_analysis_job, job, response_data, lease_token)
+    if job_status is not None and job.uav_flight_id is not None:
+        await run_in_thread(executor, notify_flight_analysis_finished, job.uav_flight_id)
+    return job_status
+
+def load_analysis_job(job_id):
+    """
+    Load a claimed job and the Flask request of its image (None if it cannot be built).
+    """
+    job = AnalysisJob.objects.select_related('field_image').get(id=job_id)
+    image_request = None
+    if job.field_image:
+        try:
+            image_request = prepare_image_request(job.field_image, clip_to_field=job.clip_to_field)
+        except Exception as e:
+            logger.error(f"Failed to load image of job {job_id}: {e}")
+    else:
+        logger.error(f"No field image specified for job {job_id}")
+    return job, image_request
+
+def finish_analysis_job(job, response_data, lease_token):
+    """
+    Store the result of a claimed job and record the job's final status.
+    Returns the final status, or None if the worker lost the job's lease and the result was discarded.
+    """
+    processing_result, image_data = None, None
+    # Short transaction around local work only, the row lock makes the lease check and the result one step
+    with transaction.atomic():
+        if not AnalysisJob.objects.select_for_update().filter(id=job.id, status='processing', lease_token=lease_token).values_list('id', flat=True):
+            logger.warning(f"Lease on job {job.id} expired, discarding its result")
+            return None
+
+        if response_data is not None:
+            try:
+                image_data = base64.b64decode(response_data['image_base64'])
+                with transaction.atomic():
+                    processing_result = save_processing_result(job.field_image, image_data, response_data['result_data'])
+            except Exception as e:
+                logger.error(f"Failed to store the result of job {job.id}: {e}")
+
+        job.status = 'completed' if processing_result is not None else 'failed'
+        AnalysisJob.objects.filter(id=job.id).update(status=job.status, lease_token='', lease_expires_at=None, updated_at=timezone.now())
+
+    if processing_result is not None:
+        # Tiles for the viewer, they are generated on demand if this fails
+        try:
+            generate_pyramid('generated-image', processing_result.id, BytesIO(image_data))
+        except Exception as e:
+            logger.warning(f"Failed to generate tiles for ProcessingResult {processing_result.id}: {e}")
+
+    if job.uav_flight_id is not None:
+        try:
+            record_job_status_change(job.uav_flight_id, 'processing', job.status)
+            if processing_result is not None:
+                record_processing_result(job.uav_flight_id, processing_result)
+        except Exception as e:
+            logger.error(f"Failed to update the analysis summary of UAV Flight {job.uav_flight_id}: {e}")
+
+    return job.status
+
+def notify_flight_analysis_finished(uav_flight_id):
+    """
+    Send one notification per flight once none of its jobs are pending or processing anymore.
+    """
+    if AnalysisJob.objects.filter(uav_flight_id=uav_flight_id, status__in=['pending', 'processing']).exists():
+        return
+    # Workers finishing the last jobs of a flight at the same time race here, only the one marking the jobs as notified sends the email
+    if not AnalysisJob.objects.filter(uav_flight_id=uav_flight_id, status__in=['completed', 'failed'], notified=False).update(notified=True):
+        return
     try:
-        user_email = job.owner.email
-        uav_flight_date = job.uav_flight.flight_date
-        # send_notification_email(job_status, user_email, uav_flight_date)
+        uav_flight = UAVFlight.objects.select_related('owner').get(id=uav_flight_id)
+        any_failed = AnalysisJob.objects.filter(uav_flight=uav_flight, status='failed').exists()
+        send_notification_email('failed' if any_failed else 'completed', uav_flight.owner.email, uav_flight.flight_date)
     except Exception as e:
         logger.error(f"Failed to send email: {e}")
 
+def reap_analysis_jobs():
+    """
+    django-q task recovering the jobs and image ingests of workers that died or hung,
+    see scheduling.reap_expired_jobs and views_flights.reap_stale_ingests. Starts a dispatcher
+    whenever jobs are pending, so the queue never stalls without a running task.
+    Scheduled every ANALYSIS_REAPER_INTERVAL minutes by the reap_analysis_jobs management command.
+    """
+    reap_stale_ingests()
+    requeued, failed = reap_expired_jobs()
+    for job_id, _ in failed:
+        logger.warning(f"AnalysisJob {job_id} failed, its lease expired {settings.ANALYSIS_MAX_ATTEMPTS} times")
+    for uav_flight_id in {uav_flight_id for _, uav_flight_id in failed if uav_flight_id is not None}:
+        notify_flight_analysis_finished(uav_flight_id)
+
+    if requeued:
+        logger.warning(f"Re-queued {len(requeued)} analysis jobs with expired leases")
+    # Also covers pending jobs whose dispatcher task was lost, e.g. when the qcluster restarted
+    if AnalysisJob.objects.filter(status='pending').exists():
+        task_id = async_task(dispatch_analysis_jobs)
+        logger.warning(f"Dispatching the pending analysis jobs in task {task_id}")
+    return len(requeued), len(failed)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_generated_images_for_uav_flight(request):
@@ -195,24 +394,17 @@ def get_generated_images_for_uav_flight(request):
     except UAVFlight.DoesNotExist:
         return Response({'error': f'UAVFlight not found {uav_flight_id}'}, status=status.HTTP_404_NOT_FOUND)
 
-    # Fetch all FieldImages related to the UAV flight
-    field_images = FieldImage.objects.filter(uav_flight=uav_flight)
-
-    # Initialize a list to hold all processing results
-    processing_results = []
-
-    # For each field image, fetch its processing results
-    for image in field_images:
-        results = ProcessingResult.objects.filter(image=image, generated_image__isnull=False)
-        processing_results.extend(results)
-
-    # Serialize the processing results to send back to the client
-    serializer = ProcessingResultSerializer(processing_results, many=True)
+    # Fetch the processing results of all images of the flight together with their images in a single query
+    processing_results = ProcessingResult.objects.filter(
+        image__uav_flight=uav_flight,
+        generated_image__isnull=False
+    ).select_related('image').order_by('id')
 
-    return Response(serializer.data)
+    return paginated_response(request, processing_results, ProcessingResultSerializer)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response_per_user
 def uav_flights_with_completed_analysis(request):
     user = request.user
 
@@ -231,8 +423,253 @@ def uav_flights_with_completed_analysis(request):
     uav_flights = UAVFlight.objects.filter(
         images__in=field_images_with_results,
         owner=user
-    ).distinct()
+    ).distinct().prefetch_related('images')
 
     serializer = UAVFlightSerializer(uav_flights, many=True)
 
-    return Response(serializer.data)
\ No newline at end of file
+    return Response(serializer.data)
+
+def get_analysis_status(user, uav_flight_id=None):
+    """
+    Per-flight job counts by status, computed with a single grouped aggregate query.
+    """
+    jobs = AnalysisJob.objects.filter(owner=user, uav_flight__isnull=False)
+    if uav_flight_id is not None:
+        jobs = jobs.filter(uav_flight_id=uav_flight_id)
+
+    status_counts = {job_status: Count('id', filter=Q(status=job_status)) for job_status, _ in AnalysisJob.STATUS_CHOICES}
+    rows = jobs.values('uav_flight').annotate(total=Count('id'), last_updated=Max('updated_at'), **status_counts).order_by('uav_flight')
+
+    return [{
+        'uav_flight_id': row['uav_flight'],
+        'total': row['total'],
+        **{job_status: row[job_status] for job_status in status_counts},
+        'finished': row['pending'] + row['processing'] == 0,
+        'last_updated': row['last_updated'].isoformat() if row['last_updated'] else None,
+    } for row in rows]
+
+def parse_uav_flight_id(request):
+    """
+    Optional ?uav_flight_id= of the status endpoints, raises ValueError if it is not an integer.
+    """
+    uav_flight_id = request.query_params.get('uav_flight_id', None)
+    return int(uav_flight_id) if uav_flight_id not in (None, '') else None
+
+def analysis_status_etag(flight_statuses):
+    return '"' + hashlib.md5(json.dumps(flight_statuses, sort_keys=True).encode()).hexdigest() + '"'
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def analysis_status(request):
+    """
+    Analysis progress of the user's flights, optionally restricted to one flight with ?uav_flight_id=.
+    Clients polling with If-None-Match get an empty 304 while the progress is unchanged.
+    """
+    try:
+        uav_flight_id = parse_uav_flight_id(request)
+    except ValueError:
+        return Response({'error': 'uav_flight_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    flight_statuses = get_analysis_status(request.user, uav_flight_id)
+    etag = analysis_status_etag(flight_statuses)
+
+    if_none_match = request.headers.get('If-None-Match', '')
+    if etag in [tag.strip().replace('W/', '', 1) for tag in if_none_match.split(',')]:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+    return Response(flight_statuses, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+# Every open stream holds a server thread, so only a few per process may be open at once
+status_stream_slots = threading.BoundedSemaphore(settings.ANALYSIS_STATUS_MAX_STREAMS)
+
+class StatusStream:
+    """
+    Iterator over the events of a stream that gives its slot back once the response is closed.
+    """
+
+    def __init__(self, events):
+        self.events = events
+        self.released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.events)
+
+    def close(self):
+        self.events.close()
+        if not self.released:
+            self.released = True
+            status_stream_slots.release()
+
+class EventStreamRenderer(BaseRenderer):
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only used for error responses, the stream itself is written by the view
+        return f"event: error\ndata: {json.dumps(data)}\n\n".encode()
+
+def analysis_status_events(user, uav_flight_id):
+    """
+    Server-sent events with the analysis progress: an event whenever the progress changes, a comment
+    as keep-alive otherwise, and a final 'done' event once no job of the flights is pending or processing.
+    """
+    deadline = time.monotonic() + settings.ANALYSIS_STATUS_STREAM_MAX_SECONDS
+    last_etag = None
+    while True:
+        flight_statuses = get_analysis_status(user, uav_flight_id)
+        etag = analysis_status_etag(flight_statuses)
+        if etag != last_etag:
+            last_etag = etag
+            event_id = etag.strip('"')
+            yield f"id: {event_id}\nevent: status\ndata: {json.dumps(flight_statuses)}\n\n"
+        else:
+            yield ": keep-alive\n\n"
+
+        if all(flight['finished'] for flight in flight_statuses):
+            yield "event: done\ndata: {}\n\n"
+            return
+        if time.monotonic() > deadline:
+            # The client reconnects and receives the current progress right away
+            return
+        time.sleep(settings.ANALYSIS_STATUS_STREAM_INTERVAL)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def analysis_status_stream(request):
+    """
+    Streaming variant of analysis_status, so the UI does not have to poll while a flight is processing.
+    Once ANALYSIS_STATUS_MAX_STREAMS streams are open, clients get a 503 and fall back to polling analysis_status.
+    """
+    try:
+        uav_flight_id = parse_uav_flight_id(request)
+    except ValueError:
+        return Response({'error': 'uav_flight_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    if not status_stream_slots.acquire(blocking=False):
+        return Response({'error': 'Too many open status streams, poll analysis-status instead'},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': str(settings.ANALYSIS_STATUS_STREAM_MAX_SECONDS)})
+    response = StreamingHttpResponse(StatusStream(analysis_status_events(request.user, uav_flight_id)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the events
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def combine_class_statistics(groups):
+    """
+    Combine per-group sums (as returned by season_analytics' aggregate query) into
+    mean, pixel-weighted mean, min and max per class.
+    """
+    image_count = sum(group['image_count'] for group in groups)
+    weight_sum = sum(group['weight_sum'] or 0 for group in groups)
+    classes = {}
+    for name in RESULT_CLASSES:
+        values_sum = sum(group[f'{name}_sum'] or 0 for group in groups)
+        weighted_sum = sum(group[f'{name}_weighted_sum'] or 0 for group in groups)
+        minimums = [group[f'{name}_min'] for group in groups if group[f'{name}_min'] is not None]
+        maximums = [group[f'{name}_max'] for group in groups if group[f'{name}_max'] is not None]
+        mean = values_sum / image_count if image_count else None
+        classes[name] = {
+            'mean': mean,
+            # Results without pixel counts fall back to the plain mean
+            'weighted_mean': weighted_sum / weight_sum if weight_sum else mean,
+            'min': min(minimums) if minimums else None,
+            'max': max(maximums) if maximums else None,
+        }
+    return {'image_count': image_count, 'classes': classes}
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def season_analytics(request):
+    """
+    Weed, sorghum and background statistics of a season per field and flight, computed in a single
+    grouped query over the JSON result data. Only the latest result of every image is counted, and
+    only for the fields whose polygon contains the image, so a flight linked to several fields does not
+    count its images in all of them. The season total counts every such image once.
+    Optionally restricted to one field with ?field_id=.
+    """
+    try:
+        season_id = int(request.query_params['season_id'])
+        field_id = request.query_params.get('field_id', None)
+        field_id = int(field_id) if field_id not in (None, '') else None
+    except (KeyError, ValueError):
+        return Response({'error': 'season_id and field_id must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    season = get_object_or_404(Season, id=season_id, owner=request.user)
+
+    # All conditions go into one filter() call so they apply to the same field season link
+    field_season_path = 'image__uav_flight__uavflightfieldseasonassociation__field_season'
+    field_filter = {
+        f'{field_season_path}__season': season,
+        'image__location__within': F(f'{field_season_path}__field__location'),
+    }
+    if field_id:
+        field_filter[f'{field_season_path}__field_id'] = field_id
+    results = latest_results(ProcessingResult.objects.filter(**field_filter))
+
+    # Percentages and pixel counts read from the JSONB column as numbers
+    aliases, aggregates = result_statistics_aggregates()
+    groups = list(results.alias(**aliases).values(
+        field_id=F(f'{field_season_path}__field_id'),
+        field_name=F(f'{field_season_path}__field__name'),
+        uav_flight_id=F('image__uav_flight_id'),
+        flight_date=F('image__uav_flight__flight_date'),
+    ).annotate(**aggregates).order_by('field_id', 'flight_date'))
+    # Overlapping fields can share images, the season total is aggregated over the distinct results
+    season_totals = ProcessingResult.objects.filter(id__in=results.values('id')).alias(**aliases).aggregate(**aggregates)
+
+    # Per-flight rows become the time series of their field, field and season totals are combined from them
+    fields = {}
+    for group in groups:
+        fields.setdefault(group['field_id'], {'field_id': group['field_id'], 'field_name': group['field_name'], 'groups': []})['groups'].append(group)
+
+    return Response({
+        'season_id': season.id,
+        'season': combine_class_statistics([season_totals]),
+        'fields': [{
+            'field_id': field['field_id'],
+            'field_name': field['field_name'],
+            **combine_class_statistics(field['groups']),
+            'series': [{
+                'uav_flight_id': group['uav_flight_id'],
+                'flight_date': group['flight_date'],
+                **combine_class_statistics([group]),
+            } for group in field['groups']],
+        } for field in fields.values()],
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_flight_analysis_summaries(request):
+    """
+    Dashboard figures of the user's flights, one precomputed row per flight (optionally ?uav_flight_id=).
+    """
+    try:
+        uav_flight_id = parse_uav_flight_id(request)
+    except ValueError:
+        return Response({'error': 'uav_flight_id must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    summaries = FlightAnalysisSummary.objects.filter(uav_flight__owner=request.user).select_related('uav_flight')
+    if uav_flight_id is not None:
+        summaries = summaries.filter(uav_flight_id=uav_flight_id)
+    return paginated_response(request, summaries, FlightAnalysisSummarySerializer)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def response_cache_metrics(request):
+    """
+    Hit and miss counts and hit rate of every view using the per-user response cache.
+    """
+    return Response(cache_metrics(CACHED_VIEWS))
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def analysis_queue_metrics(request):
+    """
+    Queued and running analysis jobs per user and the wait times (in seconds) of the jobs
+    started within the last ?hours= (default 24).
+    """
+    try:
+        hours = float(request.query_params.get('hours', 24))
+    except ValueError:
+        return Response({'error': 'hours must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(queue_metrics(timezone.now() - timedelta(hours=hours)))
@@ -5,8 +5,10 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.contrib.gis.geos import GEOSGeometry, Polygon
-from ..models import Field, User
+from ..models import Field
 from ..serializers import FieldSerializer
+from ..pagination import paginated_response, requested_fields
+from ..caching import cache_response_per_user
 
 
 @api_view(['POST'])
@@ -38,17 +40,15 @@ def add_field(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response_per_user
 def my_fields(request):
-    # Get the user ID from the request
-    user_id = request.user.id
-    # Retrieve the user object from the database
-    user = get_object_or_404(User, id=user_id)
-
-    # Get fields for the user
-    fields = Field.objects.filter(owner=user)
-    serializer = FieldSerializer(fields, many=True)
-    
-    return Response(serializer.data)
+    # Get fields for the user, skipping the polygons unless they are requested
+    fields = Field.objects.filter(owner=request.user)
+    selected_fields = requested_fields(request)
+    if selected_fields is not None and 'location' not in selected_fields:
+        fields = fields.defer('location')
+
+    return paginated_response(request, fields, FieldSerializer)
 
 
 # Update a Field
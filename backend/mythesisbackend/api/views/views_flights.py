@@ -1,13 +1,44 @@
+import logging
+import math
+import os
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+from django.contrib.gis.geos import Polygon
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django_q.tasks import async_task
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
-from ..serializers import FieldSeasonAssociationSerializer, UAVFlightFieldSeasonAssociationSerializer, UAVFlightSerializer
-from ..models import FieldSeasonAssociation, UAVFlight, FieldImage, UAVFlightFieldSeasonAssociation
-from ..utils import get_image_metadata, convert_gps_to_decimal, resize_image
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce, NullIf
+from ..serializers import FieldImageSerializer, FieldSeasonAssociationSerializer, FieldSeasonAssociationSummarySerializer, UAVFlightFieldSeasonAssociationSerializer, UAVFlightSerializer, UAVFlightSummarySerializer
+from ..models import Field, FieldSeasonAssociation, Season, UAVFlight, FieldImage, UAVFlightFieldSeasonAssociation
+from ..pagination import paginated_response, requested_fields
+from ..tiling import generate_pyramid
+from ..weed_tiles import invalidate_weed_tiles
+from ..caching import invalidate_user_responses
+from ..utils import get_image_metadata, convert_gps_to_decimal, resize_image, file_sha256, gps_point, parse_altitude
+
+logger = logging.getLogger(__name__)
+
+
+def annotate_image_summary(uav_flights):
+    """
+    Annotate a UAVFlight queryset with the number of images and the thumbnail of the first image,
+    as used by UAVFlightSummarySerializer.
+    """
+    first_thumbnail = FieldImage.objects.filter(uav_flight=OuterRef('pk')).order_by('upload_date', 'id').values(
+        thumbnail=Coalesce(NullIf('resized_image', Value('')), 'image')
+    )[:1]
+    return uav_flights.annotate(image_count=Count('images'), first_thumbnail=Subquery(first_thumbnail))
+
+def wants_summary(request):
+    return request.query_params.get('view') == 'summary'
 
-    
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def create_uav_flight(request):
@@ -15,26 +46,103 @@ def create_uav_flight(request):
     user = request.user
     uav_flight_serializer = UAVFlightSerializer(data=flight_data)
     if uav_flight_serializer.is_valid():
-        uav_flight = uav_flight_serializer.save(owner=user)
-
-        # Handle Image Uploads
         images = request.FILES.getlist('images')
-        for image in images:
+        uav_flight = uav_flight_serializer.save(owner=user, ingest_status='pending' if images else 'completed')
 
-            metadata = get_image_metadata(image)
-            # Convert GPS coordinates to decimal
-            gps_latitude_decimal = convert_gps_to_decimal(metadata['gps_latitude'], metadata['gps_latitude_ref'])
-            gps_longitude_decimal = convert_gps_to_decimal(metadata['gps_longitude'], metadata['gps_longitude_ref'])
+        # Only store the originals here, saving the files happens while the rows are inserted
+        FieldImage.objects.bulk_create([FieldImage(uav_flight=uav_flight, image=image) for image in images])
+        # bulk_create sends no post_save
+        invalidate_user_responses(user.id)
 
-            # Re-open the stream for PIL processing
-            resized_image = resize_image(image)
-            field_image_instance = FieldImage.objects.create(uav_flight=uav_flight, image=image,  gps_latitude=gps_latitude_decimal, gps_longitude=gps_longitude_decimal, gps_altitude=metadata['gps_altitude'])
-            field_image_instance.resized_image.save(image.name, resized_image, save=True)
+        # EXIF extraction and thumbnails are generated in the background
+        if images:
+            task_id = async_task(ingest_uav_flight_images, uav_flight.id)
+            logger.warning(f"Enqueued ingest of {len(images)} images for UAV Flight {uav_flight.id} with task ID: {task_id}")
 
         return Response(uav_flight_serializer.data, status=status.HTTP_201_CREATED)
-    uav_flight.delete()
     return Response(uav_flight_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def ingest_field_image(field_image):
+    """
+    Read the GPS metadata, hash the content and generate the thumbnail and tile pyramid of a stored FieldImage.
+    The instance is updated in memory, the caller persists the rows in bulk.
+    """
+    try:
+        with field_image.image.open('rb') as image_file:
+            if not field_image.content_hash:
+                field_image.content_hash = file_sha256(image_file)
+                image_file.seek(0)
+            metadata = get_image_metadata(image_file)
+            image_file.seek(0)
+            resized_image = resize_image(image_file)
+            image_file.seek(0)
+            generate_pyramid('field-image', field_image.id, image_file)
+
+        # Convert GPS coordinates to decimal
+        field_image.gps_latitude = convert_gps_to_decimal(metadata['gps_latitude'], metadata['gps_latitude_ref'])
+        field_image.gps_longitude = convert_gps_to_decimal(metadata['gps_longitude'], metadata['gps_longitude_ref'])
+        field_image.gps_altitude = metadata['gps_altitude']
+        field_image.location = gps_point(field_image.gps_latitude, field_image.gps_longitude)
+        field_image.altitude = parse_altitude(field_image.gps_altitude)
+        field_image.resized_image.save(os.path.basename(field_image.image.name), resized_image, save=False)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to ingest FieldImage {field_image.id}: {e}")
+        return False
+
+def update_ingest_status(uav_flights, ingest_status):
+    """
+    Set the ingest status of a UAVFlight queryset. update() sends no post_save, so the cached
+    responses of the owners are invalidated here.
+    """
+    owner_ids = set(uav_flights.values_list('owner_id', flat=True))
+    uav_flights.update(ingest_status=ingest_status, ingest_updated_at=timezone.now())
+    for owner_id in owner_ids:
+        invalidate_user_responses(owner_id)
+
+def ingest_uav_flight_images(uav_flight_id):
+    """
+    django-q task extracting the metadata and generating the thumbnails of the images of a UAV flight.
+
+    The work is spread over a thread pool, decoding, resizing and encoding in PIL release the GIL.
+    A process pool is not an option since django-q workers are daemonic processes and cannot have children.
+    """
+    update_ingest_status(UAVFlight.objects.filter(id=uav_flight_id), 'processing')
+    ingest_status = 'failed'
+    try:
+        field_images = list(FieldImage.objects.filter(Q(resized_image='') | Q(resized_image__isnull=True), uav_flight_id=uav_flight_id))
+
+        with ThreadPoolExecutor(max_workers=settings.INGEST_MAX_WORKERS) as executor:
+            results = list(executor.map(ingest_field_image, field_images))
+
+        FieldImage.objects.bulk_update(field_images, ['gps_latitude', 'gps_longitude', 'gps_altitude', 'location', 'altitude', 'resized_image', 'content_hash'], batch_size=100)
+        ingest_status = 'completed' if all(results) else 'failed'
+        logger.warning(f"Ingest of {len(field_images)} images for UAV Flight {uav_flight_id} {ingest_status}")
+
+        # With the image positions known the flight can be linked to its fields, unless it was deleted in the meantime
+        owner_id = UAVFlight.objects.filter(id=uav_flight_id).values_list('owner_id', flat=True).first()
+        if owner_id is not None:
+            links = auto_link_uav_flights(owner_id, [uav_flight_id])
+            logger.warning(f"UAV Flight {uav_flight_id} linked to {len(links)} field seasons")
+    finally:
+        # Also on errors, a flight left pending or processing could never be analysed.
+        # This also invalidates the cached responses showing the images updated in bulk above
+        update_ingest_status(UAVFlight.objects.filter(id=uav_flight_id), ingest_status)
+
+def reap_stale_ingests():
+    """
+    Fail the ingests of flights that have been pending or processing for longer than INGEST_STALE_SECONDS,
+    their task was lost or its worker killed. Returns the ids of the failed flights.
+    """
+    stale = UAVFlight.objects.filter(
+        ingest_status__in=['pending', 'processing'], ingest_updated_at__lt=timezone.now() - timedelta(seconds=settings.INGEST_STALE_SECONDS)
+    )
+    uav_flight_ids = list(stale.values_list('id', flat=True))
+    if uav_flight_ids:
+        update_ingest_status(UAVFlight.objects.filter(id__in=uav_flight_ids, ingest_status__in=['pending', 'processing']), 'failed')
+        logger.warning(f"Failed the stale ingests of UAV Flights {uav_flight_ids}")
+    return uav_flight_ids
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_uav_flight(request):
@@ -44,35 +152,119 @@ def delete_uav_flight(request):
     return Response({'message': 'UAV Flight deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 
+def parse_uav_flight_ids(uav_flight_ids):
+    """
+    The uav_flight_ids of a request body, raises ValueError unless they are a list of integers.
+    """
+    if not isinstance(uav_flight_ids, list) or not all(isinstance(uav_flight_id, int) and not isinstance(uav_flight_id, bool) for uav_flight_id in uav_flight_ids):
+        raise ValueError('uav_flight_ids must be a list of integers')
+    return uav_flight_ids
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def link_uav_flight_to_field_season(request):
     user = request.user
     field_id = request.data.get('field_id')
     season_id = request.data.get('season_id')
-    uav_flight_ids = request.data.get('uav_flight_ids', []) 
+    try:
+        uav_flight_ids = parse_uav_flight_ids(request.data.get('uav_flight_ids', []))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
     # Check if FieldSeasonAssociation exists for given field and season
     field_season_association = get_object_or_404(FieldSeasonAssociation, field_id=field_id, season_id=season_id, field__owner=user)
 
-    # Link each UAV Flight to the FieldSeasonAssociation
-    for uav_flight_id in uav_flight_ids:
-        uav_flight = get_object_or_404(UAVFlight, id=uav_flight_id)
-        UAVFlightFieldSeasonAssociation.objects.create(uav_flight=uav_flight, field_season=field_season_association)
+    owned_flight_ids = set(UAVFlight.objects.filter(id__in=uav_flight_ids, owner=user).values_list('id', flat=True))
+    if len(owned_flight_ids) != len(set(uav_flight_ids)):
+        return Response({'error': 'UAV Flight not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    return Response({'message': f'{len(uav_flight_ids)} UAV Flights linked successfully'}, status=status.HTTP_201_CREATED)
+    # Link all UAV Flights at once, existing links are left untouched
+    create_flight_links(user.id, [(uav_flight_id, field_season_association.id, field_season_association.season_id) for uav_flight_id in owned_flight_ids])
+
+    return Response({'message': f'{len(owned_flight_ids)} UAV Flights linked successfully'}, status=status.HTTP_201_CREATED)
+
+def create_flight_links(owner_id, links):
+    """
+    Create UAVFlightFieldSeasonAssociations for (uav_flight_id, field_season_id, season_id) tuples of
+    the owner's flights, skipping existing ones. bulk_create sends no post_save, so the weed tiles and
+    the owner's cached responses are invalidated here.
+    """
+    UAVFlightFieldSeasonAssociation.objects.bulk_create(
+        [UAVFlightFieldSeasonAssociation(uav_flight_id=uav_flight_id, field_season_id=field_season_id) for uav_flight_id, field_season_id, _ in links],
+        ignore_conflicts=True
+    )
+    for uav_flight_id, _, season_id in links:
+        invalidate_weed_tiles(season_id, uav_flight_id)
+    if links:
+        invalidate_user_responses(owner_id)
+
+def auto_link_uav_flights(owner_id, uav_flight_ids=None):
+    """
+    Link flights to the field seasons of the owner whose field polygon contains at least one of the
+    flight's images and whose season covers the flight date. The matching is a single spatial join
+    using the GiST index on FieldImage.location.
+
+    Returns the (uav_flight_id, field_season_id, season_id) tuples that were matched.
+    """
+    sql = f"""
+        SELECT DISTINCT flight.id, field_season.id, season.id
+        FROM {FieldImage._meta.db_table} image
+        JOIN {UAVFlight._meta.db_table} flight ON flight.id = image.uav_flight_id
+        JOIN {Field._meta.db_table} field ON field.owner_id = flight.owner_id AND ST_Within(image.location, field.location)
+        JOIN {FieldSeasonAssociation._meta.db_table} field_season ON field_season.field_id = field.id
+        JOIN {Season._meta.db_table} season ON season.id = field_season.season_id
+        WHERE flight.owner_id = %s
+          AND flight.flight_date::date BETWEEN season.start_date AND season.end_date
+    """
+    params = [owner_id]
+    if uav_flight_ids is not None:
+        sql += " AND flight.id = ANY(%s)"
+        params.append(list(uav_flight_ids))
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        links = cursor.fetchall()
+
+    create_flight_links(owner_id, links)
+    return links
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def auto_link_uav_flights_to_field_seasons(request):
+    """
+    Link the user's flights (or the given uav_flight_ids) to the matching field seasons based on image GPS positions.
+    """
+    uav_flight_ids = request.data.get('uav_flight_ids', None)
+    if uav_flight_ids is not None:
+        try:
+            uav_flight_ids = parse_uav_flight_ids(uav_flight_ids)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    links = auto_link_uav_flights(request.user.id, uav_flight_ids)
+    return Response({'message': f'{len(links)} UAV Flight links matched', 'links': [
+        {'uav_flight': uav_flight_id, 'field_season': field_season_id} for uav_flight_id, field_season_id, _ in links
+    ]}, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_uav_flights_for_field_season(request):
     season_id = request.query_params.get('season_id')
     field_id = request.query_params.get('field_id')
+    # Load the flights (and their images unless a summary is requested) together with the association
+    if wants_summary(request):
+        field_season_associations = FieldSeasonAssociation.objects.prefetch_related(
+            Prefetch('uav_flights', queryset=annotate_image_summary(UAVFlight.objects.all()))
+        )
+        serializer_class = FieldSeasonAssociationSummarySerializer
+    else:
+        field_season_associations = FieldSeasonAssociation.objects.prefetch_related('uav_flights__images')
+        serializer_class = FieldSeasonAssociationSerializer
     try:
-        field_season_association = FieldSeasonAssociation.objects.get(field=field_id, season=season_id)
+        field_season_association = field_season_associations.get(field=field_id, season=season_id)
     except FieldSeasonAssociation.DoesNotExist:
         return Response({'error': 'FieldSeasonAssociation not found {}, {}'.format(season_id, field_id)}, status=status.HTTP_404_NOT_FOUND)
 
-    serializer = FieldSeasonAssociationSerializer(field_season_association)
+    serializer = serializer_class(field_season_association)
     return Response(serializer.data)
 
 @api_view(['GET'])
@@ -93,5 +285,48 @@ def get_images_for_uav_flight(request):
 def get_uav_flights_by_owner(request):
     user = request.user
     uav_flights = UAVFlight.objects.filter(owner=user)
-    serializer = UAVFlightSerializer(uav_flights, many=True)
-    return Response(serializer.data)
+    if wants_summary(request):
+        return paginated_response(request, annotate_image_summary(uav_flights), UAVFlightSummarySerializer)
+
+    # Only load the images when they are part of the response
+    selected_fields = requested_fields(request)
+    if selected_fields is None or 'images' in selected_fields:
+        uav_flights = uav_flights.prefetch_related('images')
+    return paginated_response(request, uav_flights, UAVFlightSerializer)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_images_in_area(request):
+    """
+    Images of the user's flights inside a field polygon (?field_id=, ST_Within) or overlapping a
+    bounding box (?bbox=min_lon,min_lat,max_lon,max_lat, the && operator), optionally of one flight.
+    """
+    try:
+        field_id, uav_flight_id = (
+            int(value) if value not in (None, '') else None
+            for value in (request.query_params.get('field_id'), request.query_params.get('uav_flight_id'))
+        )
+    except ValueError:
+        return Response({'error': 'field_id and uav_flight_id must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    bbox = request.query_params.get('bbox')
+
+    field_images = FieldImage.objects.filter(uav_flight__owner=request.user)
+    if uav_flight_id is not None:
+        field_images = field_images.filter(uav_flight_id=uav_flight_id)
+
+    if field_id is not None:
+        field = get_object_or_404(Field, id=field_id, owner=request.user)
+        field_images = field_images.filter(location__within=field.location)
+    elif bbox:
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(value) for value in bbox.split(','))
+            if not all(math.isfinite(value) for value in (min_lon, min_lat, max_lon, max_lat)) or min_lon > max_lon or min_lat > max_lat:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'bbox must be min_lon,min_lat,max_lon,max_lat'}, status=status.HTTP_400_BAD_REQUEST)
+        field_images = field_images.filter(location__bboverlaps=Polygon.from_bbox((min_lon, min_lat, max_lon, max_lat)))
+    else:
+        return Response({'error': 'field_id or bbox not provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return paginated_response(request, field_images, FieldImageSerializer)
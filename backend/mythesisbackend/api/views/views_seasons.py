@@ -4,6 +4,8 @@ from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from ..models import Field, FieldImage, FieldSeasonAssociation, ProcessingResult, Season, User
 from ..serializers import FieldSerializer, SeasonSerializer 
+from ..pagination import paginated_response, requested_fields
+from ..caching import cache_response_per_user
 from rest_framework import status
 from django.utils import timezone
 
@@ -22,11 +24,11 @@ def create_season(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response_per_user
 def list_seasons(request):
     user_id = request.user.id
     seasons = Season.objects.filter(owner_id=user_id)
-    serializer = SeasonSerializer(seasons, many=True)
-    return Response(serializer.data)
+    return paginated_response(request, seasons, SeasonSerializer)
 
 
 @api_view(['GET'])
@@ -87,6 +89,7 @@ def add_fields_to_season(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cache_response_per_user
 def list_fields_in_season(request):
     user = request.user
     season_id = request.query_params.get('season_id')
@@ -94,16 +97,13 @@ def list_fields_in_season(request):
     # Check if season exists and belongs to the user
     season = get_object_or_404(Season, id=season_id, owner=user)
 
-     # Get FieldSeasonAssociation objects related to the season
-    field_season_associations = FieldSeasonAssociation.objects.filter(season=season)
-
-    # Get fields from the associations
-    fields = [association.field for association in field_season_associations]
+    # Get the fields associated with the season in a single query
+    fields = Field.objects.filter(fieldseasonassociation__season=season)
+    selected_fields = requested_fields(request)
+    if selected_fields is not None and 'location' not in selected_fields:
+        fields = fields.defer('location')
 
-    # Serialize fields
-    serializer = FieldSerializer(fields, many=True)
-
-    return Response(serializer.data)
+    return paginated_response(request, fields, FieldSerializer)
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
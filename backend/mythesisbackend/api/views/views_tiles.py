@@ -0,0 +1,193 @@
+import logging
+import os
+import time
+from django.conf import settings
+from django.core import signing
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django_q.tasks import async_task
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from ..models import FieldImage, ProcessingResult, Season, UAVFlight
+from ..tiling import TILE_KINDS, claim_pyramid_build, generate_pyramid, load_pyramid_metadata, release_pyramid_build, tile_path
+from ..weed_tiles import get_weed_tile
+
+logger = logging.getLogger(__name__)
+
+class TileSigner(signing.TimestampSigner):
+    """
+    Timestamps are rounded down to TILE_URL_ROTATION seconds, so the tile URLs handed out within
+    that period are the same and the tiles remain cacheable by the client.
+    """
+
+    def timestamp(self):
+        now = int(time.time())
+        return signing.b62_encode(now - now % settings.TILE_URL_ROTATION)
+
+
+# Tiles are loaded by <img> elements and map libraries, which cannot send the Token header.
+# The authenticated metadata endpoints hand out tile URLs carrying a signature of the tiled
+# object and its owner instead, valid for TILE_URL_MAX_AGE seconds
+tile_signer = TileSigner(salt='api.tiles')
+
+
+def tile_signature(scope, owner_id):
+    """
+    The ?signature= of the tiles of scope, the signed value is the scope and the owner and is not part of it.
+    """
+    value = f'{scope}:{owner_id}'
+    return tile_signer.sign(value)[len(value) + 1:]
+
+
+def has_tile_access(request, scope, owner_id):
+    """
+    Tiles are served for a valid, unexpired ?signature= of their scope and current owner or to the
+    authenticated owner. Deleting the object, or re-creating its id for another owner, voids the signature.
+    """
+    if owner_id is None:
+        return False
+    signature = request.query_params.get('signature')
+    if signature:
+        try:
+            tile_signer.unsign(f'{scope}:{owner_id}:{signature}', max_age=settings.TILE_URL_MAX_AGE)
+        except signing.BadSignature:
+            return False
+        return True
+    return request.user.is_authenticated and request.user.id == owner_id
+
+
+def get_stored_image(kind, image_id):
+    """
+    The stored image behind a tile pyramid, None if there is none.
+    """
+    if kind == 'field-image':
+        return FieldImage.objects.filter(id=image_id).first()
+    if kind == 'generated-image':
+        return ProcessingResult.objects.filter(id=image_id, generated_image__isnull=False).exclude(generated_image='').first()
+    return None
+
+
+def image_owner_id(kind, image_id):
+    """
+    Id of the owner of a field image or generated mask, None if the image does not exist.
+    """
+    if kind == 'field-image':
+        return FieldImage.objects.filter(id=image_id).values_list('uav_flight__owner_id', flat=True).first()
+    return ProcessingResult.objects.filter(id=image_id).values_list('image__uav_flight__owner_id', flat=True).first()
+
+
+def weed_tiles_owner_id(season_id, uav_flight_id):
+    """
+    Id of the owner of a season's weed overlay, None if the season does not exist or the flight
+    (unless uav_flight_id is 0) belongs to someone else.
+    """
+    owner_id = Season.objects.filter(id=season_id).values_list('owner_id', flat=True).first()
+    if uav_flight_id and not UAVFlight.objects.filter(id=uav_flight_id, owner_id=owner_id).exists():
+        return None
+    return owner_id
+
+
+def build_pyramid(kind, image_id):
+    """
+    django-q task generating the pyramid of an image stored before tiling existed.
+    """
+    try:
+        stored = get_stored_image(kind, image_id)
+        if stored is None:
+            return
+        field_file = stored.image if kind == 'field-image' else stored.generated_image
+        with field_file.open('rb') as image_file:
+            generate_pyramid(kind, image_id, image_file)
+    except Exception as e:
+        logger.warning(f"Failed to generate tiles for {kind} {image_id}: {e}")
+    finally:
+        release_pyramid_build(kind, image_id)
+
+
+def request_pyramid(kind, image_id):
+    """
+    Metadata of an image's pyramid, or None after making sure a build task is enqueued.
+    """
+    metadata = load_pyramid_metadata(kind, image_id)
+    if metadata is None and claim_pyramid_build(kind, image_id):
+        async_task(build_pyramid, kind, image_id)
+    return metadata
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def image_tile_metadata(request, kind, image_id):
+    """
+    Size and zoom levels of the tile pyramid of a field image or generated mask, with the tile URL
+    signed for TILE_URL_MAX_AGE seconds.
+    Pyramids missing for images stored before tiling existed are generated in the background,
+    until then 202 is returned.
+    """
+    if kind not in TILE_KINDS:
+        return Response({'error': f'Unknown image kind {kind}'}, status=status.HTTP_404_NOT_FOUND)
+    owner_id = image_owner_id(kind, image_id)
+    if owner_id is None or owner_id != request.user.id:
+        return Response({'error': 'Image not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    metadata = request_pyramid(kind, image_id)
+    if metadata is None:
+        return Response({'status': 'generating'}, status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '5'})
+
+    tile_url = reverse('image_tile_metadata', args=[kind, image_id]) + '{z}/{x}/{y}/?signature=' + tile_signature(f'{kind}:{image_id}', owner_id)
+    return Response({**metadata, 'tile_url': tile_url}, headers={'Cache-Control': f'private, max-age={settings.IMAGE_TILE_MAX_AGE}'})
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def image_tile(request, kind, image_id, z, x, y):
+    """
+    A single tile of the pyramid. Tiles never change for a given image, so they are cached by the
+    client for IMAGE_TILE_MAX_AGE. While a missing pyramid is generated the tiles answer 404.
+    """
+    if kind not in TILE_KINDS or not has_tile_access(request, f'{kind}:{image_id}', image_owner_id(kind, image_id)):
+        return Response({'error': 'Tile not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    metadata = request_pyramid(kind, image_id)
+    if metadata is None:
+        return Response({'error': 'Tiles are being generated'}, status=status.HTTP_404_NOT_FOUND, headers={'Retry-After': '5'})
+    path = tile_path(kind, image_id, z, x, y)
+    if z > metadata['max_zoom'] or not os.path.exists(path):
+        return Response({'error': 'Tile not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = FileResponse(open(path, 'rb'), content_type=f"image/{metadata['format'].lower()}")
+    response['Cache-Control'] = f'private, max-age={settings.IMAGE_TILE_MAX_AGE}, immutable'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def weed_tile_metadata(request, season_id, uav_flight_id):
+    """
+    Signed XYZ URL template, valid for TILE_URL_MAX_AGE seconds, of the weed density overlay of a flight in a season (all flights for uav_flight_id 0).
+    """
+    get_object_or_404(Season, id=season_id, owner=request.user)
+    if uav_flight_id:
+        get_object_or_404(UAVFlight, id=uav_flight_id, owner=request.user)
+    tile_url = reverse('weed_tile_metadata', args=[season_id, uav_flight_id]) + '{z}/{x}/{y}/?signature=' + tile_signature(f'weed:{season_id}:{uav_flight_id}', request.user.id)
+    return Response({'tile_url': tile_url, 'max_zoom': settings.WEED_TILE_MAX_ZOOM})
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def weed_tile(request, season_id, uav_flight_id, z, x, y):
+    """
+    XYZ map tile of the weed density of a flight in a season, or of all flights of the season
+    when uav_flight_id is 0, to be overlaid on the OpenStreetMap base map.
+    """
+    if not has_tile_access(request, f'weed:{season_id}:{uav_flight_id}', weed_tiles_owner_id(season_id, uav_flight_id)):
+        return Response({'error': 'Tile not found'}, status=status.HTTP_404_NOT_FOUND)
+    if z > settings.WEED_TILE_MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return Response({'error': 'Tile not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    response = FileResponse(open(get_weed_tile(season_id, uav_flight_id, z, x, y), 'rb'), content_type='image/png')
+    # Cached tiles are invalidated on the server, so clients only keep them briefly
+    response['Cache-Control'] = f'private, max-age={settings.WEED_TILE_MAX_AGE}'
+    return response
@@ -0,0 +1,231 @@
+import logging
+import os
+import shutil
+import tempfile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django_q.tasks import async_task
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from ..caching import invalidate_user_responses
+from ..models import FieldImage, UAVFlight, UploadSession, UploadedFile
+from ..serializers import UAVFlightSerializer, UploadSessionSerializer, UploadedFileSerializer
+from ..utils import file_sha256
+from .views_flights import ingest_uav_flight_images
+
+logger = logging.getLogger(__name__)
+
+# Size of the blocks a chunk is copied from the request to disk with
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def upload_part_path(uploaded_file):
+    return os.path.join(settings.UPLOAD_DIR, str(uploaded_file.session_id), f'{uploaded_file.id}.part')
+
+def existing_images_by_hash(user, content_hashes):
+    """
+    FieldImages of the user with one of the given content hashes, keyed by hash.
+    """
+    content_hashes = [content_hash for content_hash in content_hashes if content_hash]
+    if not content_hashes:
+        return {}
+    field_images = FieldImage.objects.filter(uav_flight__owner=user, content_hash__in=content_hashes).order_by('id')
+    existing = {}
+    for field_image in field_images:
+        existing.setdefault(field_image.content_hash, field_image)
+    return existing
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_upload_session(request):
+    """
+    Start a resumable upload for a new UAV flight. Besides the flight data the body lists the files
+    as {'name', 'size', 'sha256'}, the hash being optional. Files the user has uploaded before are
+    marked complete right away and don't have to be sent again.
+    """
+    files = request.data.get('files', [])
+    try:
+        files = [{'name': os.path.basename(file['name']), 'size': int(file['size']), 'sha256': file.get('sha256') or None} for file in files]
+    except (KeyError, TypeError, ValueError):
+        return Response({'error': 'Every file needs a name and a size'}, status=status.HTTP_400_BAD_REQUEST)
+    # Empty files are rejected, no chunk could ever be sent for them
+    if not files or any(file['size'] <= 0 for file in files):
+        return Response({'error': 'No valid files provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = UploadSessionSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    existing = existing_images_by_hash(request.user, [file['sha256'] for file in files])
+    with transaction.atomic():
+        upload_session = serializer.save(owner=request.user)
+        UploadedFile.objects.bulk_create([
+            UploadedFile(session=upload_session, name=file['name'], size=file['size'], content_hash=file['sha256'], duplicate_of=existing.get(file['sha256']))
+            for file in files
+        ])
+
+    return Response(UploadSessionSerializer(upload_session).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_upload_session(request):
+    """
+    State of an upload session, clients resume every file at its received_bytes.
+    """
+    session_id = request.query_params.get('session_id')
+    upload_session = get_object_or_404(UploadSession.objects.prefetch_related('files'), id=session_id, owner=request.user)
+    return Response(UploadSessionSerializer(upload_session).data)
+
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request):
+    """
+    Append a chunk to a file of an open upload session. The raw request body is the chunk,
+    file_id and offset are passed as query parameters. The offset has to match the bytes
+    received so far, otherwise 409 is returned together with the offset to continue from.
+    """
+    file_id = request.query_params.get('file_id')
+    try:
+        offset = int(request.query_params.get('offset'))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except (TypeError, ValueError):
+        return Response({'error': 'offset and Content-Length must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    uploaded_file = get_object_or_404(UploadedFile, id=file_id, session__owner=request.user, session__status='open')
+    if uploaded_file.duplicate_of_id is not None:
+        return Response(UploadedFileSerializer(uploaded_file).data)
+    if offset != uploaded_file.received_bytes:
+        return Response({'error': 'Offset does not match the received bytes', 'received_bytes': uploaded_file.received_bytes}, status=status.HTTP_409_CONFLICT)
+    if length <= 0 or length > settings.UPLOAD_CHUNK_MAX_SIZE or offset + length > uploaded_file.size:
+        return Response({'error': f'Chunks must be between 1 and {settings.UPLOAD_CHUNK_MAX_SIZE} bytes and end within the file'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Receive the chunk before taking the row lock, reading the body from the network can take long.
+    # It is streamed to a temporary file instead of letting Django buffer it
+    path = upload_part_path(uploaded_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.TemporaryFile(dir=os.path.dirname(path)) as chunk_file:
+        received = 0
+        while received < length:
+            block = request.stream.read(min(STREAM_BLOCK_SIZE, length - received))
+            if not block:
+                break
+            chunk_file.write(block)
+            received += len(block)
+
+        with transaction.atomic():
+            # The row lock keeps concurrent requests from writing the same file
+            uploaded_file = get_object_or_404(UploadedFile.objects.select_for_update(), id=file_id, session__owner=request.user, session__status='open')
+            if offset != uploaded_file.received_bytes:
+                return Response({'error': 'Offset does not match the received bytes', 'received_bytes': uploaded_file.received_bytes}, status=status.HTTP_409_CONFLICT)
+
+            chunk_file.seek(0)
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as part_file:
+                part_file.seek(offset)
+                part_file.truncate()
+                shutil.copyfileobj(chunk_file, part_file, STREAM_BLOCK_SIZE)
+
+            # An interrupted chunk is kept, the client continues from the new offset
+            uploaded_file.received_bytes = offset + received
+            uploaded_file.save(update_fields=['received_bytes'])
+
+    return Response(UploadedFileSerializer(uploaded_file).data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finalize_upload_session(request):
+    """
+    Create the UAV flight of a completely uploaded session and start the ingest of its images.
+    Uploaded files are verified against the hash given when the session was created and moved into
+    the media storage, files whose content already exists reuse the stored image.
+    """
+    session_id = request.data.get('session_id')
+    upload_session = get_object_or_404(UploadSession, id=session_id, owner=request.user)
+    if upload_session.status != 'open':
+        return Response({'error': 'Upload session is already finalized'}, status=status.HTTP_400_BAD_REQUEST)
+
+    uploaded_files = list(upload_session.files.select_related('duplicate_of').order_by('id'))
+    incomplete = [uploaded_file.id for uploaded_file in uploaded_files if uploaded_file.duplicate_of_id is None and uploaded_file.received_bytes != uploaded_file.size]
+    if incomplete:
+        return Response({'error': 'Not all files are uploaded completely', 'incomplete_files': incomplete}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Verify the received content before taking the session lock, hashing a large flight takes a while.
+    # Complete files cannot change anymore, upload_chunk rejects chunks beyond the file size
+    corrupted = []
+    for uploaded_file in uploaded_files:
+        if uploaded_file.duplicate_of_id is not None:
+            continue
+        with open(upload_part_path(uploaded_file), 'rb') as part_file:
+            content_hash = file_sha256(part_file)
+        if uploaded_file.content_hash and uploaded_file.content_hash != content_hash:
+            corrupted.append(uploaded_file)
+        uploaded_file.content_hash = content_hash
+    if corrupted:
+        # Corrupted files have to be uploaded again
+        UploadedFile.objects.filter(id__in=[uploaded_file.id for uploaded_file in corrupted]).update(received_bytes=0)
+        for uploaded_file in corrupted:
+            os.remove(upload_part_path(uploaded_file))
+        return Response({'error': 'Uploaded content does not match the hash', 'corrupted_files': [uploaded_file.id for uploaded_file in corrupted]}, status=status.HTTP_400_BAD_REQUEST)
+
+    moved = []  # (part path, stored path) of the files moved into the media storage
+    try:
+        with transaction.atomic():
+            upload_session = get_object_or_404(UploadSession.objects.select_for_update(), id=session_id, owner=request.user)
+            if upload_session.status != 'open':
+                return Response({'error': 'Upload session is already finalized'}, status=status.HTTP_400_BAD_REQUEST)
+
+            existing = existing_images_by_hash(request.user, [uploaded_file.content_hash for uploaded_file in uploaded_files if uploaded_file.duplicate_of_id is None])
+            uav_flight = UAVFlight.objects.create(owner=request.user, flight_date=upload_session.flight_date, description=upload_session.description, ingest_status='pending')
+
+            field_images = []
+            for uploaded_file in uploaded_files:
+                original = uploaded_file.duplicate_of or existing.get(uploaded_file.content_hash)
+                if original is not None:
+                    # Reuse the stored files and the metadata of the identical image
+                    field_images.append(FieldImage(
+                        uav_flight=uav_flight, image=original.image.name, resized_image=original.resized_image.name or None,
+                        gps_latitude=original.gps_latitude, gps_longitude=original.gps_longitude, gps_altitude=original.gps_altitude,
+                        location=original.location, altitude=original.altitude,
+                        content_hash=original.content_hash
+                    ))
+                    continue
+
+                # The chunks were written inside MEDIA_ROOT, so the file only has to be moved into place
+                name = default_storage.get_available_name(os.path.join('field_images', uploaded_file.name))
+                os.makedirs(os.path.dirname(default_storage.path(name)), exist_ok=True)
+                os.replace(upload_part_path(uploaded_file), default_storage.path(name))
+                moved.append((upload_part_path(uploaded_file), default_storage.path(name)))
+                field_images.append(FieldImage(uav_flight=uav_flight, image=name, content_hash=uploaded_file.content_hash))
+
+            FieldImage.objects.bulk_create(field_images)
+            # bulk_create sends no post_save
+            invalidate_user_responses(request.user.id)
+
+            upload_session.status = 'finalized'
+            upload_session.uav_flight = uav_flight
+            upload_session.save(update_fields=['status', 'uav_flight'])
+
+            if any(not field_image.resized_image for field_image in field_images):
+                transaction.on_commit(lambda: async_task(ingest_uav_flight_images, uav_flight.id))
+            else:
+                uav_flight.ingest_status = 'completed'
+                uav_flight.ingest_updated_at = timezone.now()
+                uav_flight.save(update_fields=['ingest_status', 'ingest_updated_at'])
+    except Exception:
+        # The rows were rolled back, the files go back to the session so it can be finalized again
+        for part_path, stored_path in moved:
+            os.replace(stored_path, part_path)
+        raise
+
+    shutil.rmtree(os.path.join(settings.UPLOAD_DIR, str(upload_session.id)), ignore_errors=True)
+    logger.warning(f"Upload session {upload_session.id} finalized as UAV Flight {uav_flight.id} with {len(field_images)} images")
+
+    return Response(UAVFlightSerializer(uav_flight).data, status=status.HTTP_201_CREATED)
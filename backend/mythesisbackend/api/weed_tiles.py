@@ -0,0 +1,187 @@
+import math
+import os
+import uuid
+from io import BytesIO
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.db.models import OuterRef, Subquery
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+from PIL import Image, ImageDraw
+from .models import Field, ProcessingResult
+
+TILE_SIZE = 256
+
+# Approximate length of one degree, accurate enough for the footprint of a single UAV image
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LON = 111320.0
+
+
+def weed_tile_path(season_id, uav_flight_id, z, x, y):
+    return os.path.join(settings.WEED_TILE_ROOT, str(season_id), str(uav_flight_id), str(z), str(x), f'{y}.png')
+
+
+def weed_tiles_stamp_path(season_id, uav_flight_id):
+    return os.path.join(settings.WEED_TILE_ROOT, str(season_id), f'{uav_flight_id}.stamp')
+
+
+def invalidate_weed_tiles(season_id, uav_flight_id):
+    """
+    Mark the cached tiles of a flight and of the season-wide overlay (flight 0) of a season as stale.
+    Only a stamp file is touched, so this stays cheap when called for every result of an analysis run;
+    tiles older than the stamp are rendered again when they are requested.
+    """
+    os.makedirs(os.path.join(settings.WEED_TILE_ROOT, str(season_id)), exist_ok=True)
+    for flight_key in (uav_flight_id, 0):
+        with open(weed_tiles_stamp_path(season_id, flight_key), 'a'):
+            os.utime(weed_tiles_stamp_path(season_id, flight_key))
+
+
+def is_weed_tile_fresh(path, season_id, uav_flight_id):
+    try:
+        tile_mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    try:
+        return tile_mtime > os.stat(weed_tiles_stamp_path(season_id, uav_flight_id)).st_mtime_ns
+    except FileNotFoundError:
+        return True
+
+
+def lat_lon_to_pixel(lat, lon, z):
+    """
+    Global Web Mercator pixel coordinates of a point at zoom level z.
+    """
+    scale = TILE_SIZE * 2 ** z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = (lon + 180.0) / 360.0 * scale
+    y = (1 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi) / 2 * scale
+    return x, y
+
+
+def tile_bounds(z, x, y):
+    """
+    (south, west, north, east) of a slippy map tile in degrees.
+    """
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return south, west, north, east
+
+
+def density_color(density):
+    """
+    RGBA colour of a weed percentage, from transparent yellow for little weed to opaque red.
+    """
+    t = min(density / settings.WEED_TILE_MAX_DENSITY, 1.0)
+    return (255, int(255 * (1 - t)), 0, int(80 + 150 * t))
+
+
+def image_footprints(season_id, uav_flight_id, bounds):
+    """
+    Latest weed statistics of the georeferenced images of a flight, or of all flights of the
+    season when uav_flight_id is 0, with only the JSON keys needed to render the overlay.
+    Only images whose position lies close enough to bounds (south, west, north, east) for their
+    footprint to reach into it are loaded, using the spatial index on FieldImage.location.
+    """
+    south, west, north, east = bounds
+    # Half the diagonal of the largest footprint, WEED_TILE_MAX_FLIGHT_HEIGHT being the highest flight expected
+    margin = settings.WEED_TILE_MAX_FLIGHT_HEIGHT * math.tan(math.radians(settings.UAV_CAMERA_HFOV) / 2) * math.sqrt(2)
+    margin_lat = margin / METERS_PER_DEGREE_LAT
+    margin_lon = margin / (METERS_PER_DEGREE_LON * max(math.cos(math.radians(max(abs(south), abs(north)))), 0.01))
+    search_area = Polygon.from_bbox((west - margin_lon, south - margin_lat, east + margin_lon, north + margin_lat))
+    search_area.srid = 4326
+
+    # Ground elevation of the season's field below the image, EXIF altitudes are above sea level
+    ground_elevation = Field.objects.filter(
+        fieldseasonassociation__season_id=season_id, location__contains=OuterRef('image__location')
+    ).values('ground_elevation')[:1]
+
+    results = ProcessingResult.objects.filter(
+        image__uav_flight__uavflightfieldseasonassociation__field_season__season_id=season_id,
+        image__location__bboverlaps=search_area, image__altitude__isnull=False,
+    )
+    if uav_flight_id:
+        results = results.filter(image__uav_flight_id=uav_flight_id)
+
+    rows = results.order_by('image_id', '-date_processed').distinct('image_id').values(
+        'image__gps_latitude', 'image__gps_longitude', 'image__altitude',
+        ground_elevation=Subquery(ground_elevation),
+        weeds=KeyTextTransform('weeds', 'result_data'),
+        tile_weed_density=KeyTransform('tile_weed_density', 'result_data'),
+    )
+
+    footprints = []
+    for row in rows:
+        if row['ground_elevation'] is None:
+            continue
+        try:
+            lat, lon = float(row['image__gps_latitude']), float(row['image__gps_longitude'])
+        except (TypeError, ValueError):
+            continue
+        height_above_ground = row['image__altitude'] - row['ground_elevation']
+        if height_above_ground <= 0:
+            continue
+
+        # Per-tile densities of the analysis, or the image-wide percentage as a single cell
+        density_grid = row['tile_weed_density'] or [[float(row['weeds'] or 0)]]
+        footprints.append({'lat': lat, 'lon': lon, 'height': height_above_ground, 'density_grid': density_grid})
+    return footprints
+
+
+def footprint_cells(footprint):
+    """
+    Corners (lat, lon) and weed density of every analysis tile of an image footprint.
+    Images are assumed to be taken nadir with the top of the image facing north.
+    """
+    grid = footprint['density_grid']
+    num_rows, num_cols = len(grid), len(grid[0])
+    width = 2 * footprint['height'] * math.tan(math.radians(settings.UAV_CAMERA_HFOV) / 2)
+    height = width * num_rows / num_cols
+    meters_per_degree_lon = METERS_PER_DEGREE_LON * math.cos(math.radians(footprint['lat']))
+
+    cell_width, cell_height = width / num_cols, height / num_rows
+    for row, densities in enumerate(grid):
+        for col, density in enumerate(densities):
+            west = footprint['lon'] + (col * cell_width - width / 2) / meters_per_degree_lon
+            east = footprint['lon'] + ((col + 1) * cell_width - width / 2) / meters_per_degree_lon
+            north = footprint['lat'] + (height / 2 - row * cell_height) / METERS_PER_DEGREE_LAT
+            south = footprint['lat'] + (height / 2 - (row + 1) * cell_height) / METERS_PER_DEGREE_LAT
+            yield (south, west, north, east), density
+
+
+def render_weed_tile(footprints, z, x, y):
+    """
+    Render the weed density of the image footprints overlapping a tile into a transparent PNG.
+    """
+    tile = Image.new('RGBA', (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(tile)
+    tile_south, tile_west, tile_north, tile_east = tile_bounds(z, x, y)
+
+    for footprint in footprints:
+        for (south, west, north, east), density in footprint_cells(footprint):
+            if density <= 0 or south > tile_north or north < tile_south or west > tile_east or east < tile_west:
+                continue
+            left, top = lat_lon_to_pixel(north, west, z)
+            right, bottom = lat_lon_to_pixel(south, east, z)
+            draw.rectangle([left - x * TILE_SIZE, top - y * TILE_SIZE, right - x * TILE_SIZE, bottom - y * TILE_SIZE], fill=density_color(density))
+
+    output = BytesIO()
+    tile.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def get_weed_tile(season_id, uav_flight_id, z, x, y):
+    """
+    Path of the cached weed density tile, rendering it first if it is not cached or stale.
+    """
+    path = weed_tile_path(season_id, uav_flight_id, z, x, y)
+    if not is_weed_tile_fresh(path, season_id, uav_flight_id):
+        tile = render_weed_tile(image_footprints(season_id, uav_flight_id, tile_bounds(z, x, y)), z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.tmp-{uuid.uuid4().hex}'
+        with open(temp_path, 'wb') as tile_file:
+            tile_file.write(tile)
+        os.replace(temp_path, path)
+    return path
@@ -0,0 +1,119 @@
+"""
+Load test for the backend API: N concurrent clients repeatedly request a set of endpoints and the
+latency percentiles, throughput and error rate are reported per concurrency level.
+
+Run it once before and once after a configuration change, saving the results with --output, and
+compare the runs with --compare:
+
+    python load_test.py --token <token> --concurrency 1 10 50 --output before.json
+    python load_test.py --token <token> --concurrency 1 10 50 --output after.json --compare before.json
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DEFAULT_ENDPOINTS = ['my-fields/', 'list-seasons/', 'get-uav-flights-by-owner/?view=summary', 'uav-flights-with-completed-analysis/', 'analysis-status/']
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run_client(base_url, token, endpoints, requests_per_client):
+    """
+    One client with its own keep-alive session, requesting the endpoints in turn.
+    Returns a list of (latency in ms, success) tuples.
+    """
+    samples = []
+    with requests.Session() as session:
+        session.headers['Authorization'] = f'Token {token}'
+        for i in range(requests_per_client):
+            url = base_url + endpoints[i % len(endpoints)]
+            start = time.perf_counter()
+            try:
+                success = session.get(url, timeout=60).status_code < 400
+            except requests.RequestException:
+                success = False
+            samples.append(((time.perf_counter() - start) * 1000, success))
+    return samples
+
+
+def run_level(base_url, token, endpoints, concurrency, requests_per_client):
+    barrier = threading.Barrier(concurrency)
+
+    def client():
+        barrier.wait()  # All clients start at the same time
+        return run_client(base_url, token, endpoints, requests_per_client)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = [sample for result in executor.map(lambda _: client(), range(concurrency)) for sample in result]
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, success in samples if success]
+    errors = sum(1 for _, success in samples if not success)
+    return {
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': errors,
+        'throughput': len(samples) / elapsed,
+        'mean_ms': statistics.mean(latencies) if latencies else None,
+        'p50_ms': percentile(latencies, 0.5),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+    }
+
+
+def format_ms(value):
+    return f'{value:9.1f}' if value is not None else '        -'
+
+
+def print_results(results, baseline=None):
+    baseline = {result['concurrency']: result for result in baseline or []}
+    print(f"{'clients':>7} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for result in results:
+        print(f"{result['concurrency']:>7} {result['requests']:>8} {result['errors']:>6} {result['throughput']:>8.1f} "
+              f"{format_ms(result['p50_ms'])} {format_ms(result['p95_ms'])} {format_ms(result['p99_ms'])}")
+        before = baseline.get(result['concurrency'])
+        if before:
+            print(f"{'before':>7} {before['requests']:>8} {before['errors']:>6} {before['throughput']:>8.1f} "
+                  f"{format_ms(before['p50_ms'])} {format_ms(before['p95_ms'])} {format_ms(before['p99_ms'])}")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Measure backend API latency under concurrent clients.")
+    parser.add_argument("--url", default="http://localhost:8000/api/", help="Base URL of the API.")
+    parser.add_argument("--token", required=True, help="Auth token of the user the requests are made for.")
+    parser.add_argument("--endpoints", nargs='+', default=DEFAULT_ENDPOINTS, help="Endpoints requested in turn, relative to --url.")
+    parser.add_argument("--concurrency", type=int, nargs='+', default=[1, 10, 50], help="Numbers of concurrent clients to test.")
+    parser.add_argument("--requests-per-client", type=int, default=50, help="Requests made by every client per level.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="JSON results of an earlier run to show next to the new ones.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    results = [run_level(args.url, args.token, args.endpoints, concurrency, args.requests_per_client) for concurrency in args.concurrency]
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as compare_file:
+            baseline = json.load(compare_file)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -52,6 +52,10 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Default and maximum page size of the list endpoints when the client requests pagination
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', 100))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 1000))
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -98,6 +102,11 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD', '123456789'),
         'HOST': os.getenv('DB_HOST', 'db'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Keep connections open between requests and django-q tasks instead of reconnecting every time.
+        # Every gunicorn thread and qcluster worker thread holds its own connection, so
+        # GUNICORN_WORKERS * GUNICORN_THREADS + Q_WORKERS * ANALYSIS_DB_WORKERS must stay below max_connections of PostgreSQL
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
 
@@ -162,9 +171,63 @@ Q_CLUSTER = {
     'attempt_count': int(os.getenv('Q_ATTEMPT_COUNT', 1))
 }
 
+# Per-user response cache of the read-heavy list endpoints. The database backend is shared by the web
+# and qcluster processes, so invalidations from analysis tasks are seen everywhere (run createcachetable)
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'True') == 'True'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+# Hit and miss counts are kept per process and added to the shared counters at this interval (seconds)
+RESPONSE_CACHE_METRICS_FLUSH_INTERVAL = int(os.getenv('RESPONSE_CACHE_METRICS_FLUSH_INTERVAL', 60))
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    RESPONSE_CACHE_ALIAS: {
+        'BACKEND': os.getenv('RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.db.DatabaseCache'),
+        'LOCATION': os.getenv('RESPONSE_CACHE_LOCATION', 'response_cache'),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 10000))},
+    },
+}
+
 # Flask AI Service URL
 FLASK_SERVICE_URL = os.getenv('FLASK_SERVICE_URL', 'http://flask_ai:5000')
 
+# Timeouts in seconds of the Flask requests, retries of failed requests with the base of their exponential backoff
+FLASK_CONNECT_TIMEOUT = float(os.getenv('FLASK_CONNECT_TIMEOUT', 5))
+FLASK_REQUEST_TIMEOUT = float(os.getenv('FLASK_REQUEST_TIMEOUT', 300))
+FLASK_MAX_RETRIES = int(os.getenv('FLASK_MAX_RETRIES', 3))
+FLASK_RETRY_BACKOFF = float(os.getenv('FLASK_RETRY_BACKOFF', 1))
+# Consecutive failures after which no more requests are sent to the Flask service, and for how many seconds
+FLASK_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('FLASK_CIRCUIT_FAILURE_THRESHOLD', 5))
+FLASK_CIRCUIT_RESET_TIMEOUT = int(os.getenv('FLASK_CIRCUIT_RESET_TIMEOUT', 60))
+
+# Number of images in flight to the Flask service at once per analysis task
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv('ANALYSIS_MAX_CONCURRENCY', 4))
+# Analysis jobs of one user running at the same time, the others wait so every user gets a turn
+ANALYSIS_MAX_JOBS_PER_USER = int(os.getenv('ANALYSIS_MAX_JOBS_PER_USER', 4))
+# Seconds a claimed analysis job stays leased to its worker without a heartbeat, how often running
+# jobs renew their lease, and how often a job may lose its lease before the reaper fails it
+ANALYSIS_LEASE_SECONDS = int(os.getenv('ANALYSIS_LEASE_SECONDS', 120))
+ANALYSIS_LEASE_HEARTBEAT = int(os.getenv('ANALYSIS_LEASE_HEARTBEAT', 30))
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv('ANALYSIS_MAX_ATTEMPTS', 3))
+# Minutes between two runs of the reaper recovering jobs with expired leases
+ANALYSIS_REAPER_INTERVAL = int(os.getenv('ANALYSIS_REAPER_INTERVAL', 1))
+# Threads of an analysis task loading images and storing results
+ANALYSIS_DB_WORKERS = int(os.getenv('ANALYSIS_DB_WORKERS', 4))
+# Seconds a flight analysis task keeps starting new images before it re-enqueues itself, must stay below Q_TIMEOUT
+ANALYSIS_TASK_TIME_BUDGET = int(os.getenv('ANALYSIS_TASK_TIME_BUDGET', Q_CLUSTER['timeout'] * 0.75))
+# Seconds after which a flight analysis task cancels the images still running and puts their jobs back into
+# the queue, a Flask request may take up to (FLASK_MAX_RETRIES + 1) * FLASK_REQUEST_TIMEOUT. Must stay below Q_TIMEOUT
+ANALYSIS_TASK_DEADLINE = int(os.getenv('ANALYSIS_TASK_DEADLINE', Q_CLUSTER['timeout'] * 0.9))
+# Seconds between two progress checks of the analysis status stream and how long one stream stays open
+ANALYSIS_STATUS_STREAM_INTERVAL = float(os.getenv('ANALYSIS_STATUS_STREAM_INTERVAL', 2))
+ANALYSIS_STATUS_STREAM_MAX_SECONDS = int(os.getenv('ANALYSIS_STATUS_STREAM_MAX_SECONDS', 60))
+# Status streams open at once per server process, each holds one of the GUNICORN_THREADS threads
+ANALYSIS_STATUS_MAX_STREAMS = int(os.getenv('ANALYSIS_STATUS_MAX_STREAMS', 2))
+
+# UAV camera model used to project field polygons into image pixels for field-clipped analysis
+UAV_CAMERA_HFOV = float(os.getenv('UAV_CAMERA_HFOV', 73.7))  # Horizontal field of view in degrees
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.sendgrid.net')
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', 'apikey')
@@ -200,3 +263,31 @@ LOGGING = {
 }
 
 DATA_UPLOAD_MAX_NUMBER_FILES = int(os.getenv('DATA_UPLOAD_MAX_NUMBER_FILES', 250))
+
+# Number of images whose metadata and thumbnail are processed concurrently after an upload
+INGEST_MAX_WORKERS = int(os.getenv('INGEST_MAX_WORKERS', 4))
+# Seconds after which the reaper fails an ingest that is still pending or processing, it may wait in the queue behind other tasks
+INGEST_STALE_SECONDS = int(os.getenv('INGEST_STALE_SECONDS', Q_CLUSTER['timeout'] * 2))
+
+# Resumable uploads: chunks are written straight to UPLOAD_DIR inside MEDIA_ROOT
+UPLOAD_DIR = os.path.join(MEDIA_ROOT, 'uploads')
+UPLOAD_CHUNK_MAX_SIZE = int(os.getenv('UPLOAD_CHUNK_MAX_SIZE', 16 * 1024 * 1024))
+
+# Tile pyramids of field images and generated masks
+TILE_ROOT = os.path.join(MEDIA_ROOT, 'tiles')
+IMAGE_TILE_FORMAT = os.getenv('IMAGE_TILE_FORMAT', 'WEBP').upper()
+IMAGE_TILE_QUALITY = int(os.getenv('IMAGE_TILE_QUALITY', 80))
+IMAGE_TILE_MAX_AGE = int(os.getenv('IMAGE_TILE_MAX_AGE', 60 * 60 * 24 * 365))
+# Seconds the signed tile URLs stay valid, and the period within which the same URL is handed out
+TILE_URL_MAX_AGE = int(os.getenv('TILE_URL_MAX_AGE', 60 * 60 * 24))
+TILE_URL_ROTATION = int(os.getenv('TILE_URL_ROTATION', 60 * 60))
+# Seconds after which the lock of a pyramid build counts as left over from a killed worker
+IMAGE_TILE_BUILD_TIMEOUT = int(os.getenv('IMAGE_TILE_BUILD_TIMEOUT', 600))
+
+# Weed density map overlay, cached tiles are dropped whenever a new analysis result arrives
+WEED_TILE_ROOT = os.path.join(MEDIA_ROOT, 'weed_tiles')
+WEED_TILE_MAX_ZOOM = int(os.getenv('WEED_TILE_MAX_ZOOM', 24))
+WEED_TILE_MAX_DENSITY = float(os.getenv('WEED_TILE_MAX_DENSITY', 20))  # Weed percentage rendered fully red
+WEED_TILE_MAX_AGE = int(os.getenv('WEED_TILE_MAX_AGE', 60))
+# Highest flight above the field in meters, bounds the search for images whose footprint reaches into a tile
+WEED_TILE_MAX_FLIGHT_HEIGHT = float(os.getenv('WEED_TILE_MAX_FLIGHT_HEIGHT', 150))
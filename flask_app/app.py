@@ -1,11 +1,11 @@
+import logging
 import os
 import numpy as np
 from PIL import Image
 from model_components.data_prep_run import get_run_data_loaders
 from model_components.model import ResNetUNet 
-from model_components.test import save_segmentation
-from model_components.utils import calculate_metrics, cleanup_patch_files, determine_max_row_col, extract_image_identifier, map_color, stitch_patches_to_full_image_by_identifier
-from model_components.utils_run_model import calculate_pixel_ratio
+from model_components.utils_run_model import OUTSIDE_CLASS, calculate_class_statistics, colorize_class_map, vegetation_tile_mask
+from model_components.georeference import field_mask_for_image, tile_coverage
 import tempfile
 from flask import Flask, request, jsonify
 import torch
@@ -15,6 +15,12 @@ import re
 import shutil
 import uuid
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
+
+# Tiles without green vegetation are marked as background without running the model (set VEGETATION_PREFILTER=False to disable)
+VEGETATION_PREFILTER = os.getenv('VEGETATION_PREFILTER', 'True') == 'True'
+EXG_THRESHOLD = float(os.getenv('EXG_THRESHOLD', 0.05))
+VEGETATION_MIN_FRACTION = float(os.getenv('VEGETATION_MIN_FRACTION', 0.001))
 
 def secure_filename(filename):
     """
@@ -24,36 +30,31 @@ def secure_filename(filename):
     filename = re.sub(r'[^a-zA-Z0-9_.-]', '_', filename)
     return filename
 
-def save_segmentation_run(images, outputs, image_names, save_dir, n_images=1):
-    # Ensure the save directory exists
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir, exist_ok=True)  # Creates the directory if it doesn't exist
-    with torch.no_grad():
-        images = images.cpu()
-        outputs = torch.argmax(outputs, dim=1).cpu()
-
-        color_map = {
-            0: [195, 195, 195],  # Background
-            1: [31, 119, 189],   # Sorghum
-            2: [255, 127, 14]    # Weeds
-        }
+def predict_selected_tiles(model, images, keep):
+    """
+    Run the model only on the tiles selected by keep, the remaining tiles get background logits.
+    """
+    if keep.all():
+        return model(images)
 
-        for i in range(n_images):
-            # Correctly extracting base name, row index, and column index
-            parts = image_names[i].split('_')
-            base_name = '_'.join(parts[:-4])  # Everything except the last four elements
-            row_index = parts[-3]  # Third last element
-            col_index = parts[-2]  # Second last element
+    # Background gets the highest logit so argmax yields class 0 for skipped tiles
+    outputs = torch.zeros((images.size(0), 3, images.size(2), images.size(3)), device=images.device)
+    outputs[:, 0] = 1
+    if keep.any():
+        outputs[keep] = model(images[keep]).to(outputs.dtype)
+    return outputs
 
-            # Construct filenames for saving using both row and column indices
-            pred_filename = f'{base_name}_patch_{row_index}_{col_index}_predicted.png'
+def process_single_image_with_model(image_path, model_path, resnet_model, vegetation_prefilter=VEGETATION_PREFILTER, exg_threshold=EXG_THRESHOLD, min_vegetation_fraction=VEGETATION_MIN_FRACTION, field_mask=None, patch_size=256):
+    """
+    Segment the image in image_path and return the color mask together with its class statistics.
 
-            # Save predicted mask with color mapping
-            pred_mask_colored = map_color(outputs[i].unsqueeze(0), color_map)
-            pred_mask_image = Image.fromarray(pred_mask_colored)
-            pred_mask_image.save(os.path.join(save_dir, pred_filename))
+    The predicted tiles are assembled into a class-index map in memory, which is used both for
+    the statistics (see calculate_class_statistics) and for the colored generated image.
 
-def process_single_image_with_model(image_path, model_path, save_dir, resnet_model):
+    When field_mask (boolean mask of the image pixels inside the field) is given, tiles fully
+    outside the field are not run through the model, pixels outside the field are blanked in
+    the generated image and the class ratios are computed over in-field pixels only.
+    """
     # Load Model
     model = ResNetUNet(n_classes=3, resnet_model_path=resnet_model)
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
@@ -62,49 +63,85 @@ def process_single_image_with_model(image_path, model_path, save_dir, resnet_mod
     # Load saved model weights
     model.load_state_dict(torch.load(model_path, map_location=device))
     model.eval()
-    run_loader = get_run_data_loaders(image_path= image_path) 
-    result_data = None  # Initialize result_data
-    full_image = None  # Initialize full_image to handle the case where no images are processed
+    run_loader = get_run_data_loaders(image_path= image_path, patch_size=patch_size) 
+    coverage = tile_coverage(field_mask, patch_size=patch_size) if field_mask is not None else None
+    tiles_total, tiles_skipped, tiles_outside_field = 0, 0, 0
+    tile_predictions = {}  # Image identifier -> list of (row, col, class tile)
     with torch.no_grad():
-        for batch, (images, image_names, _) in enumerate(run_loader):
+        for batch, (images, image_names, coords) in enumerate(run_loader):
             images = images.to(device)
-            outputs = model(images)
-            save_segmentation_run(images, outputs, image_names, save_dir, n_images=images.size(0))
+            keep = torch.ones(images.size(0), dtype=torch.bool, device=device)
+            if coverage is not None:
+                rows, cols = coords
+                in_field = torch.from_numpy(coverage[rows.numpy(), cols.numpy()] > 0).to(device)
+                tiles_outside_field += int((~in_field).sum().item())
+                keep &= in_field
+            if vegetation_prefilter:
+                keep &= vegetation_tile_mask(images, exg_threshold, min_vegetation_fraction)
+            outputs = predict_selected_tiles(model, images, keep)
+            tiles_total += images.size(0)
+            tiles_skipped += int((~keep).sum().item())
+
+            predictions = torch.argmax(outputs, dim=1).to(torch.uint8).cpu().numpy()
+            rows, cols = coords
+            for image_name, row, col, prediction in zip(image_names, rows.tolist(), cols.tolist(), predictions):
+                # Patch names are '<image>_<row>_<col>_patch.png'
+                identifier = image_name.rsplit('_', 3)[0]
+                tile_predictions.setdefault(identifier, []).append((row, col, prediction))
             del images, outputs
-    
-        # Extract unique identifiers for all processed images based on saved patches
-    image_identifiers = set(extract_image_identifier(f) for f in os.listdir(save_dir) if f.endswith('_predicted.png'))
-
-    for identifier in image_identifiers:
-        # Filter patch files for the current image based on the unique identifier
-        patch_files = [f for f in os.listdir(save_dir) if f.startswith(identifier) and f.endswith('_predicted.png')]
-        
-        if not patch_files:
-            print(f"No patch files found for stitching for image {identifier}.")
-            continue
-        
-        # Determine the full image size from the patch files
-        max_row, max_col = determine_max_row_col(patch_files)
-        image_size = ((max_row + 1) * 256, (max_col + 1) * 256)
-        
-        # Stitch the patches together for the current image
-        full_image = stitch_patches_to_full_image_by_identifier(save_dir, patch_files, image_size, patch_size=256)
-        
-        # Save the stitched image with a unique name to ensure no overwrites
-        full_image_path = os.path.join(save_dir, f"{identifier}_generated.png")
-        Image.fromarray(full_image).save(full_image_path)
-
-        result_data = calculate_pixel_ratio(full_image_path)        
-    # Cleanup: Remove the saved patches for the current image
-    cleanup_patch_files(save_dir)
-
-    if full_image is None:
+
+    if not tile_predictions:
         raise ValueError("No images were processed.")
-    if result_data is None:
-        raise ValueError("No result data was generated.")
+
+    full_image, result_data = None, None
+    for identifier, tiles in tile_predictions.items():
+        # Assemble the class-index map, padding and pixels outside the field are marked OUTSIDE_CLASS
+        num_rows = max(row for row, _, _ in tiles) + 1
+        num_cols = max(col for _, col, _ in tiles) + 1
+        class_map = np.full((num_rows * patch_size, num_cols * patch_size), OUTSIDE_CLASS, dtype=np.uint8)
+        for row, col, prediction in tiles:
+            class_map[row * patch_size:(row + 1) * patch_size, col * patch_size:(col + 1) * patch_size] = prediction
+
+        height, width = run_loader.dataset.image_sizes.get(identifier, class_map.shape)
+        class_map[height:, :] = OUTSIDE_CLASS
+        class_map[:, width:] = OUTSIDE_CLASS
+        if field_mask is not None:
+            class_map[:field_mask.shape[0], :field_mask.shape[1]][~field_mask] = OUTSIDE_CLASS
+
+        result_data = calculate_class_statistics(class_map, patch_size=patch_size)
+        full_image = colorize_class_map(class_map[:height, :width])
+
+    logger.info(f"Skipped {tiles_skipped} of {tiles_total} tiles ({tiles_outside_field} outside the field).")
+    result_data['tiles_total'] = tiles_total
+    result_data['tiles_skipped'] = tiles_skipped
+    if field_mask is not None:
+        result_data['tiles_outside_field'] = tiles_outside_field
+        result_data['field_fraction'] = float(field_mask.mean()) * 100
 
     return full_image, result_data
 
+def get_field_mask(form, image_path):
+    """
+    Build the in-field pixel mask for a field-clipped analysis request.
+
+    Expects the form fields field_polygon (GeoJSON), gps_latitude, gps_longitude, gps_altitude
+    (height above ground in meters) and camera_hfov (degrees), optionally heading (degrees).
+    Returns None when the request does not ask for clipping.
+    """
+    if not form.get('field_polygon'):
+        return None
+    with Image.open(image_path) as img:
+        width, height = img.size
+    return field_mask_for_image(
+        form['field_polygon'],
+        center_lat=float(form['gps_latitude']),
+        center_lon=float(form['gps_longitude']),
+        altitude=float(form['gps_altitude']),
+        image_size=(height, width),
+        horizontal_fov=float(form['camera_hfov']),
+        heading=float(form.get('heading', 0)),
+    )
+
 @app.route('/process_images', methods=['POST'])
 def process_images():
     if 'image' not in request.files:
@@ -126,13 +163,18 @@ def process_images():
         model_path = os.path.join(models, 'best_model.pth')
         resnet_model = os.path.join(models, 'resnet34.pth')
         if not os.path.exists(model_path):
-            raise FileNotFoundError("Model file not found")
-        save_dir = os.path.join(base_path, f'generated_masks_{str(uuid.uuid4())}')
-        if not os.path.exists(save_dir):
-            os.makedirs(save_dir)
+            # Not the image's fault, clients retry 503 responses later
+            return jsonify({"error": "Model file not found"}), 503
 
-        # Process the image
-        generated_image, result_data = process_single_image_with_model(temp_dir, model_path, save_dir, resnet_model)
+        # Process the image, clipped to the field polygon if one was sent along
+        try:
+            with Image.open(image_path) as img:
+                img.verify()
+            field_mask = get_field_mask(request.form, image_path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # The image or its form fields are invalid, sending it again will not help
+            return jsonify({"error": str(e)}), 422
+        generated_image, result_data = process_single_image_with_model(temp_dir, model_path, resnet_model, field_mask=field_mask)
 
         # Convert the processed numpy.ndarray back to a PIL.Image object
         generated_image_pil = Image.fromarray(generated_image.astype('uint8'), 'RGB')
@@ -156,8 +198,6 @@ def process_images():
     finally:
         # Cleanup: remove the temporary file and directory
         try:
-            if os.path.exists(save_dir):
-                shutil.rmtree(save_dir)
             if os.path.exists(temp_dir):
                 shutil.rmtree(temp_dir)
         except Exception as e:
@@ -1,17 +1,29 @@
+import csv
 import os
+import sys
 from skimage.io import imread, imsave
 from skimage.transform import resize
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, WeightedRandomSampler
 from torchvision import transforms
 import torch
 from PIL import Image
 import numpy as np  
+sys.path.append(os.path.dirname(__file__))
+from loader_settings import LoaderSettings
 
 # Set a seed for torch operations
 torch.manual_seed(42)  
 
+# Relative sampling weight of a training patch, a patch gets the highest weight of the classes it contains
+# (0: background only, 1: contains sorghum, 2: contains weeds)
+DEFAULT_CLASS_SAMPLING_WEIGHTS = {
+    0: 0.1,  # Background
+    1: 1.0,  # Sorghum
+    2: 4.0   # Weeds
+}
+
 class SorghumDataset(Dataset):
-    def __init__(self, image_dir, mask_dir=None, patch_size=256, transform=None, mask_transform=None, is_train=True, is_test=False, use_preprocessed_patches=False, preprocessed_dir=None):
+    def __init__(self, image_dir, mask_dir=None, patch_size=256, transform=None, mask_transform=None, is_train=True, is_test=False, use_preprocessed_patches=False, preprocessed_dir=None, histogram_file='patch_histograms.csv'):
         self.image_dir = image_dir
         self.mask_dir = mask_dir
         self.patch_size = patch_size
@@ -21,6 +33,9 @@ class SorghumDataset(Dataset):
         self.is_test = is_test
         self.use_preprocessed_patches = use_preprocessed_patches
         self.preprocessed_dir = preprocessed_dir
+        self.histogram_file = histogram_file
+        # Per-patch class pixel counts, aligned with self.patches (None when no masks are available)
+        self.histograms = []
 
         if self.use_preprocessed_patches and self.preprocessed_dir:
             self.patches = self.load_preprocessed_patches()
@@ -47,6 +62,10 @@ class SorghumDataset(Dataset):
         # For both training and testing, we expect a tuple of (img_patch, mask_patch, img_name, coords)
         img_patch, mask_patch, img_name, coords = patch_data
 
+        # Preprocessed patches are indexed by path and only decoded once they are sampled
+        if isinstance(img_patch, str):
+            img_patch, mask_patch = imread(img_patch), imread(mask_patch)
+
         # Convert numpy arrays to PIL Images
         image = Image.fromarray(img_patch)
         
@@ -60,7 +79,7 @@ class SorghumDataset(Dataset):
         # Handle the mask
         if self.mask_dir:
             # Convert mask to class indices and then to tensor for training/validation
-            mask = self.rgb_to_index(np.array(mask))
+            mask = self.rgb_to_index(np.array(mask_patch)[:, :, :3].astype(np.int16))
             mask = torch.from_numpy(mask).long()
 
             # Apply mask transformations if specified and required
@@ -106,12 +125,11 @@ class SorghumDataset(Dataset):
                         else:  # For grayscale masks without depth
                             mask_patch = np.pad(mask_patch, ((0, pad_height), (0, pad_width)), mode='constant', constant_values=0)
 
-                    # Check if this is a training image and if the patch is relevant
-                    if self.is_train and not self.is_patch_relevant(mask_patch):
-                        continue
+                    # Background-only patches are kept; the training sampler down-weights them instead
                     img_name_wo_ext = os.path.splitext(img_name)[0]  # Changed to handle any image format, not just .png
                     patch_img_name = f'{img_name_wo_ext}_{i}_{j}_patch.png'
                     patches.append((img_patch, mask_patch, patch_img_name, (i, j)))
+                    self.histograms.append(self.class_histogram(mask_patch) if self.mask_dir else None)
 
         return patches
 
@@ -146,10 +164,32 @@ class SorghumDataset(Dataset):
     
         return index_mask
 
+    def class_histogram(self, mask_patch, n_classes=3):
+        """Count the pixels of each class in a mask patch, see utils.compute_class_histogram."""
+        # Imported here, utils imports this module through hyperparameter_tuning
+        from utils import compute_class_histogram
+        return compute_class_histogram(mask_patch, n_classes)
+
+    def load_patch_histograms(self):
+        """Read the per-patch class histograms written by preprocess_data.py, if present."""
+        histogram_path = os.path.join(self.preprocessed_dir, self.histogram_file)
+        histograms = {}
+        if not os.path.exists(histogram_path):
+            print(f"No patch histograms found at {histogram_path}, computing them from the masks.")
+            return histograms
+
+        with open(histogram_path, newline='') as file:
+            reader = csv.reader(file)
+            next(reader, None)  # Skip header
+            for row in reader:
+                histograms[row[0]] = np.array([int(count) for count in row[1:]])
+        return histograms
+
     def load_preprocessed_patches(self):
         patches = []
         img_patch_dir = os.path.join(self.preprocessed_dir, 'img_patches')
         mask_patch_dir = os.path.join(self.preprocessed_dir, 'gt_patches')
+        histograms = self.load_patch_histograms()
 
         # Verify that each image patch has a corresponding mask patch
         for img_patch_name in os.listdir(img_patch_dir):
@@ -163,16 +203,16 @@ class SorghumDataset(Dataset):
                 continue 
 
             try:
-                img_patch = imread(img_patch_path)
-                mask_patch = imread(mask_patch_path)
-
-                # Ensure both image and mask patches are successfully loaded (not None and have content)
-                if img_patch is not None and mask_patch is not None:
-                    components = img_patch_name.split("_")
-                    i, j = int(components[-3]), int(components[-2])  
-                    patches.append((img_patch, mask_patch, img_patch_name, (i, j)))
-                else:
-                    print(f"Failed to load image or mask for {img_patch_name}. One of them is None.")
+                # Only patches without a precomputed histogram have to be decoded here,
+                # all others are decoded lazily in __getitem__ when they are sampled
+                histogram = histograms.get(img_patch_name)
+                if histogram is None:
+                    histogram = self.class_histogram(imread(mask_patch_path))
+
+                components = img_patch_name.split("_")
+                i, j = int(components[-3]), int(components[-2])
+                patches.append((img_patch_path, mask_patch_path, img_patch_name, (i, j)))
+                self.histograms.append(histogram)
             except Exception as e:
                 print(f"Error loading {img_patch_name}: {e}")
 
@@ -193,7 +233,46 @@ test_transform = transforms.Compose([
 
 # No resizing needed as patches are already handled in the dataset class
 
-def get_data_loaders(image_path, mask_path, test_image_path, test_mask_path, batch_size=2, patch_size=256, preprocessed_dir=None, use_preprocessed_patches=False):
+def get_patch_sampling_weights(histograms, class_weights=DEFAULT_CLASS_SAMPLING_WEIGHTS, min_pixels=1):
+    """
+    Compute a sampling weight for every patch from its class histogram.
+
+    Each patch gets the weight of the highest-weighted class it contains at least
+    min_pixels pixels of, so weed-rich patches are oversampled and background-only
+    patches are drawn at a low rate.
+
+    Parameters:
+    - histograms: Sequence of per-patch class pixel counts.
+    - class_weights: Dict mapping class index to its sampling weight.
+    - min_pixels: Minimum number of pixels for a class to count as present in a patch.
+
+    Returns:
+    - A list with one weight per patch.
+    """
+    weights = []
+    for histogram in histograms:
+        present = [cls for cls, count in enumerate(histogram) if count >= min_pixels and cls in class_weights]
+        weights.append(max((class_weights[cls] for cls in present), default=class_weights[0]))
+    return weights
+
+def default_samples_per_epoch(histograms):
+    """
+    Number of patches drawn per training epoch by default: the patches that are not background only,
+    the patches an epoch covered before background patches were kept (all patches if there are none).
+    """
+    return sum(1 for histogram in histograms if any(count > 0 for count in histogram[1:])) or len(histograms)
+
+def get_data_loaders(image_path, mask_path, test_image_path, test_mask_path, batch_size=2, patch_size=256, preprocessed_dir=None, use_preprocessed_patches=False, class_weights=DEFAULT_CLASS_SAMPLING_WEIGHTS, samples_per_epoch=None, loader_settings=None):
+    """
+    Create the train, validation and test DataLoaders.
+
+    Training patches are drawn with a WeightedRandomSampler based on their class histograms
+    (see get_patch_sampling_weights). Pass class_weights=None to shuffle uniformly instead.
+    samples_per_epoch limits the number of patches drawn per epoch (defaults to default_samples_per_epoch).
+    Worker, pinned memory and prefetch options come from loader_settings (defaults to LoaderSettings.from_env()).
+    """
+    loader_settings = loader_settings or LoaderSettings.from_env()
+
     # Determine if preprocessed patches should be used
     if use_preprocessed_patches:
         # Assuming preprocessed patches are stored in a specific structure
@@ -216,14 +295,24 @@ def get_data_loaders(image_path, mask_path, test_image_path, test_mask_path, bat
     # Initialize the test dataset
     test_dataset = SorghumDataset(image_dir=test_image_path, mask_dir=test_mask_path, patch_size=patch_size, transform=test_transform, is_train=False, is_test=True, use_preprocessed_patches=use_preprocessed_patches, preprocessed_dir=preprocessed_dir)
 
+    # Weight training patches by the classes they contain instead of dropping background-only patches
+    train_sampler = None
+    if class_weights is not None:
+        train_histograms = [combined_dataset.histograms[idx] for idx in train_dataset.indices]
+        train_weights = get_patch_sampling_weights(train_histograms, class_weights)
+        if samples_per_epoch is None:
+            samples_per_epoch = default_samples_per_epoch(train_histograms)
+        train_sampler = WeightedRandomSampler(train_weights, num_samples=samples_per_epoch, replacement=True)
+
     # Data loaders for each set
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=4)
-    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, num_workers=4)
-    test_loader = DataLoader(test_dataset, batch_size=1, shuffle=False, num_workers=2)  # Adjust if test set also uses patches
+    loader_kwargs = loader_settings.loader_kwargs()
+    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=train_sampler is None, sampler=train_sampler, **loader_kwargs)
+    val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, **loader_kwargs)
+    test_loader = DataLoader(test_dataset, batch_size=1, shuffle=False, **loader_kwargs)  # Adjust if test set also uses patches
 
     return train_loader, val_loader, test_loader
 
-def get_run_loader(test_image_dir, batch_size=1, patch_size=256, transform=None):
+def get_run_loader(test_image_dir, batch_size=1, patch_size=256, transform=None, loader_settings=None):
     """
     Create a DataLoader for test images.
 
@@ -232,6 +321,7 @@ def get_run_loader(test_image_dir, batch_size=1, patch_size=256, transform=None)
     - batch_size: Number of images per batch.
     - patch_size: Size of patches the images are divided into (if applicable).
     - transform: Transformations to be applied on test images.
+    - loader_settings: LoaderSettings for the loader, small inputs are loaded in-process.
 
     Returns:
     - A DataLoader for the test images.
@@ -240,7 +330,8 @@ def get_run_loader(test_image_dir, batch_size=1, patch_size=256, transform=None)
     run_dataset = SorghumDataset(image_dir=test_image_dir, mask_dir=None, patch_size=patch_size, transform=transform, is_train=False, is_test=True, use_preprocessed_patches=False, preprocessed_dir=None)
 
     # Data loader for the test set
-    run_loader = DataLoader(run_dataset, batch_size=batch_size, shuffle=False, num_workers=2)
+    loader_settings = loader_settings or LoaderSettings.from_env()
+    run_loader = DataLoader(run_dataset, batch_size=batch_size, shuffle=False, **loader_settings.loader_kwargs(num_patches=len(run_dataset)))
 
     return run_loader
 
@@ -1,9 +1,12 @@
 import os
+import sys
 from skimage.io import imread
 from torch.utils.data import Dataset, DataLoader
 from torchvision import transforms
 from PIL import Image
 import numpy as np  
+sys.path.append(os.path.dirname(__file__))
+from loader_settings import LoaderSettings
 
 class SorghumRunDataset(Dataset):
     def __init__(self, image_dir, patch_size=256, transform=None, is_test=False, use_preprocessed_patches=False, preprocessed_dir=None):
@@ -15,6 +18,8 @@ class SorghumRunDataset(Dataset):
         self.preprocessed_dir = preprocessed_dir
 
         self.images = [file for file in os.listdir(image_dir)]
+        # Original (height, width) of each image, keyed by the image name used in the patch names
+        self.image_sizes = {}
         self.patches = self.create_patches()
 
     def __len__(self):
@@ -36,6 +41,7 @@ class SorghumRunDataset(Dataset):
         for img_name in self.images:
             img_path = os.path.join(self.image_dir, img_name)
             image = imread(img_path)
+            self.image_sizes[img_name.split('.png')[0]] = image.shape[:2]
 
             num_patches_x, num_patches_y = np.ceil(image.shape[1] / self.patch_size).astype(int), np.ceil(image.shape[0] / self.patch_size).astype(int)
             for i in range(num_patches_y):
@@ -63,12 +69,14 @@ test_transform = transforms.Compose([
 ])
 
 # Function to get data loaders for running (without masks)
-def get_run_data_loaders(image_path, batch_size=1, patch_size=256, preprocessed_dir=None, use_preprocessed_patches=False):
+def get_run_data_loaders(image_path, batch_size=1, patch_size=256, preprocessed_dir=None, use_preprocessed_patches=False, loader_settings=None):
     if use_preprocessed_patches:
         image_path = os.path.join(preprocessed_dir, 'img_patches')
 
     run_dataset = SorghumRunDataset(image_dir=image_path, patch_size=patch_size, transform=test_transform, is_test=True, use_preprocessed_patches=use_preprocessed_patches, preprocessed_dir=preprocessed_dir)
 
-    run_loader = DataLoader(run_dataset, batch_size=batch_size, shuffle=False, num_workers=2)
+    # Patches are already decoded in memory, so small inputs (e.g. a single uploaded image) are loaded in-process
+    loader_settings = loader_settings or LoaderSettings.from_env()
+    run_loader = DataLoader(run_dataset, batch_size=batch_size, shuffle=False, **loader_settings.loader_kwargs(num_patches=len(run_dataset)))
 
     return run_loader
@@ -0,0 +1,121 @@
+import json
+import math
+import numpy as np
+from skimage.draw import polygon as draw_polygon
+
+# Approximate length of one degree on the WGS84 ellipsoid, accurate enough for a single UAV image footprint
+METERS_PER_DEGREE_LAT = 110540.0
+METERS_PER_DEGREE_LON = 111320.0
+
+
+def parse_polygons(geometry):
+    """
+    Parse a GeoJSON Polygon or MultiPolygon (as dict or JSON string) into a list of polygons.
+
+    Args:
+        geometry (dict or str): GeoJSON geometry with (lon, lat) coordinates.
+
+    Returns:
+        list: One list of rings per polygon, the first ring being the exterior and the others holes.
+    """
+    if isinstance(geometry, str):
+        geometry = json.loads(geometry)
+
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+
+
+def ground_sample_distance(altitude, image_width, horizontal_fov):
+    """
+    Size of one image pixel on the ground in meters for a nadir camera.
+
+    Args:
+        altitude (float): Height of the camera above the ground in meters.
+        image_width (int): Image width in pixels.
+        horizontal_fov (float): Horizontal field of view of the camera in degrees.
+    """
+    footprint_width = 2 * altitude * math.tan(math.radians(horizontal_fov) / 2)
+    return footprint_width / image_width
+
+
+def project_ring_to_pixels(ring, center_lat, center_lon, gsd, image_size, heading=0.0):
+    """
+    Project a ring of (lon, lat) coordinates into (row, col) pixel coordinates of a nadir image
+    centered on (center_lat, center_lon).
+
+    Args:
+        ring (list): Ring of (lon, lat) coordinates.
+        center_lat (float): Latitude of the image center.
+        center_lon (float): Longitude of the image center.
+        gsd (float): Ground sample distance in meters per pixel.
+        image_size (tuple): (height, width) of the image.
+        heading (float): Direction the top of the image points to, in degrees clockwise from north.
+
+    Returns:
+        tuple: Arrays of row and column coordinates.
+    """
+    coords = np.asarray(ring, dtype=np.float64)
+    east = (coords[:, 0] - center_lon) * METERS_PER_DEGREE_LON * math.cos(math.radians(center_lat))
+    north = (coords[:, 1] - center_lat) * METERS_PER_DEGREE_LAT
+
+    # Rotate the ground offsets into the image frame
+    heading_rad = math.radians(heading)
+    right = east * math.cos(heading_rad) - north * math.sin(heading_rad)
+    up = east * math.sin(heading_rad) + north * math.cos(heading_rad)
+
+    rows = image_size[0] / 2 - up / gsd
+    cols = image_size[1] / 2 + right / gsd
+    return rows, cols
+
+
+def field_mask_for_image(geometry, center_lat, center_lon, altitude, image_size, horizontal_fov, heading=0.0):
+    """
+    Rasterize a field polygon into a boolean mask of the pixels of an image that lie inside the field.
+
+    Args:
+        geometry (dict or str): GeoJSON Polygon or MultiPolygon of the field.
+        center_lat (float): Latitude of the image center (image GPS position).
+        center_lon (float): Longitude of the image center.
+        altitude (float): Height of the camera above the ground in meters.
+        image_size (tuple): (height, width) of the image.
+        horizontal_fov (float): Horizontal field of view of the camera in degrees.
+        heading (float): Direction the top of the image points to, in degrees clockwise from north.
+
+    Returns:
+        np.array: Boolean mask with shape image_size, True inside the field.
+    """
+    if altitude <= 0:
+        raise ValueError(f"Altitude above ground must be positive, got {altitude}")
+
+    gsd = ground_sample_distance(altitude, image_size[1], horizontal_fov)
+    mask = np.zeros(image_size, dtype=bool)
+
+    for rings in parse_polygons(geometry):
+        for ring_index, ring in enumerate(rings):
+            rows, cols = project_ring_to_pixels(ring, center_lat, center_lon, gsd, image_size, heading)
+            rr, cc = draw_polygon(rows, cols, shape=image_size)
+            # The first ring is the field boundary, the following rings are holes
+            mask[rr, cc] = ring_index == 0
+
+    return mask
+
+
+def tile_coverage(field_mask, patch_size=256):
+    """
+    Fraction of each tile's pixels that lie inside the field.
+
+    Args:
+        field_mask (np.array): Boolean field mask of the image.
+        patch_size (int): Size of the square tiles.
+
+    Returns:
+        np.array: Array of shape (num_tile_rows, num_tile_cols) with values in [0, 1].
+    """
+    height, width = field_mask.shape
+    num_rows, num_cols = math.ceil(height / patch_size), math.ceil(width / patch_size)
+    padded = np.zeros((num_rows * patch_size, num_cols * patch_size), dtype=bool)
+    padded[:height, :width] = field_mask
+    return padded.reshape(num_rows, patch_size, num_cols, patch_size).mean(axis=(1, 3))
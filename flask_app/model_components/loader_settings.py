@@ -0,0 +1,127 @@
+import argparse
+import os
+import time
+import torch
+from torch.utils.data import DataLoader
+
+
+class LoaderSettings:
+    """
+    DataLoader options shared by the training, test and inference loaders.
+
+    Parameters:
+    - num_workers: Number of worker processes per loader (0 loads in the main process).
+    - pin_memory: Use pinned host memory for faster host to GPU copies (defaults to True when CUDA is available).
+    - persistent_workers: Keep worker processes alive between epochs instead of re-spawning them.
+    - prefetch_factor: Number of batches each worker loads in advance.
+    - in_process_max_patches: Inference loaders with at most this many patches are loaded in-process,
+      since forking workers costs more than it saves for a handful of images.
+    """
+
+    def __init__(self, num_workers=4, pin_memory=None, persistent_workers=True, prefetch_factor=2, in_process_max_patches=512):
+        self.num_workers = num_workers
+        self.pin_memory = torch.cuda.is_available() if pin_memory is None else pin_memory
+        self.persistent_workers = persistent_workers
+        self.prefetch_factor = prefetch_factor
+        self.in_process_max_patches = in_process_max_patches
+
+    @classmethod
+    def from_env(cls):
+        """Build the settings from LOADER_* environment variables, falling back to the defaults."""
+        pin_memory = os.getenv('LOADER_PIN_MEMORY')
+        return cls(
+            num_workers=int(os.getenv('LOADER_NUM_WORKERS', 4)),
+            pin_memory=None if pin_memory is None else pin_memory == 'True',
+            persistent_workers=os.getenv('LOADER_PERSISTENT_WORKERS', 'True') == 'True',
+            prefetch_factor=int(os.getenv('LOADER_PREFETCH_FACTOR', 2)),
+            in_process_max_patches=int(os.getenv('LOADER_IN_PROCESS_MAX_PATCHES', 512)),
+        )
+
+    def loader_kwargs(self, num_patches=None, num_workers=None):
+        """
+        Keyword arguments for torch.utils.data.DataLoader.
+
+        Parameters:
+        - num_patches: Size of an inference dataset; small ones fall back to in-process loading.
+        - num_workers: Override the configured number of workers (used by the autotuner).
+
+        Returns:
+        - A dict of DataLoader keyword arguments.
+        """
+        num_workers = self.num_workers if num_workers is None else num_workers
+        if num_patches is not None and num_patches <= self.in_process_max_patches:
+            num_workers = 0
+
+        kwargs = {'num_workers': num_workers, 'pin_memory': self.pin_memory}
+        # persistent_workers and prefetch_factor are only valid with worker processes
+        if num_workers > 0:
+            kwargs['persistent_workers'] = self.persistent_workers
+            kwargs['prefetch_factor'] = self.prefetch_factor
+        return kwargs
+
+
+def autotune_num_workers(dataset, batch_size=4, candidates=(0, 2, 4, 8), num_batches=20, settings=None):
+    """
+    Measure loading throughput for several worker counts on the current machine.
+
+    The first batch of every candidate is excluded from the timing, so worker start-up
+    (paid only once with persistent workers) does not skew the comparison.
+
+    Parameters:
+    - dataset: Dataset to load from.
+    - batch_size: Batch size used for the measurement.
+    - candidates: Worker counts to try.
+    - num_batches: Number of batches timed per candidate.
+    - settings: LoaderSettings providing the remaining loader options.
+
+    Returns:
+    - tuple: The best worker count and a dict mapping each candidate to batches per second.
+    """
+    settings = settings or LoaderSettings.from_env()
+    results = {}
+
+    for num_workers in candidates:
+        loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, **settings.loader_kwargs(num_workers=num_workers))
+        iterator = iter(loader)
+        timed_batches = 0
+        start_time = time.perf_counter()
+        try:
+            next(iterator)  # Warm-up: starts the workers
+            start_time = time.perf_counter()
+            for _ in range(num_batches):
+                next(iterator)
+                timed_batches += 1
+        except StopIteration:
+            pass
+        elapsed = time.perf_counter() - start_time if timed_batches else 0
+        results[num_workers] = timed_batches / elapsed if elapsed > 0 else 0.0
+        print(f"num_workers={num_workers}: {results[num_workers]:.2f} batches/sec")
+        del iterator, loader
+
+    best_num_workers = max(results, key=results.get)
+    return best_num_workers, results
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Find the fastest DataLoader worker count for the training patches.")
+    parser.add_argument("--batch_size", type=int, default=16, help="Batch size used for the measurement.")
+    parser.add_argument("--num_batches", type=int, default=20, help="Number of batches timed per worker count.")
+    parser.add_argument("--candidates", type=int, nargs='+', default=[0, 2, 4, 8], help="Worker counts to try.")
+    return parser.parse_args()
+
+
+def main():
+    from data_prep import SorghumDataset, train_val_transform
+
+    base_path = os.getcwd()
+    preprocessed_path = os.path.join(base_path, '2024_01_15_initial_set_of_drone_images/patches')
+
+    args = parse_arguments()
+    dataset = SorghumDataset(image_dir=os.path.join(preprocessed_path, 'img_patches'), mask_dir=os.path.join(preprocessed_path, 'gt_patches'),
+                             transform=train_val_transform, use_preprocessed_patches=True, preprocessed_dir=preprocessed_path)
+    best_num_workers, _ = autotune_num_workers(dataset, batch_size=args.batch_size, candidates=args.candidates, num_batches=args.num_batches)
+    print(f"Best worker count: {best_num_workers} (set LOADER_NUM_WORKERS={best_num_workers})")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,15 @@ import numpy as np
 from skimage.io import imread, imsave
 from tqdm import tqdm
 import argparse
-from utils import pad_array, is_patch_relevant, safe_imsave
+from utils import compute_class_histogram, pad_array, safe_imsave, save_patch_histograms
 
-def preprocess_and_save_patches(image_dir, mask_dir, output_dir, patch_size=256):
+def preprocess_and_save_patches(image_dir, mask_dir, output_dir, patch_size=256, histogram_file='patch_histograms.csv'):
     images = [f for f in os.listdir(image_dir) if os.path.isfile(os.path.join(image_dir, f))]
     os.makedirs(os.path.join(output_dir, 'img_patches'), exist_ok=True)
     os.makedirs(os.path.join(output_dir, 'gt_patches'), exist_ok=True)
 
-    saved_patches, skipped_patches = 0, 0
+    saved_patches, background_patches = 0, 0
+    histograms = {}
 
     for img_name in tqdm(images, desc="Processing"):
         base_img_name = img_name.split('.png')[0]
@@ -34,20 +35,24 @@ def preprocess_and_save_patches(image_dir, mask_dir, output_dir, patch_size=256)
                 pad_width = patch_size - img_patch.shape[1]     
                 if pad_height > 0 or pad_width > 0:        
                     img_patch, mask_patch = pad_array(img_patch, patch_size), pad_array(mask_patch, patch_size)
-                if is_patch_relevant(mask_patch):
-                    patch_img_name = f'{base_img_name}_{i}_{j}_patch.png'
-                    img_patch_path = os.path.join(output_dir, 'img_patches', patch_img_name)
-                    mask_patch_path = os.path.join(output_dir, 'gt_patches', patch_img_name)
+                # Background-only patches are kept as well; the training sampler decides how often
+                # they are drawn based on the class histogram recorded here
+                histogram = compute_class_histogram(mask_patch)
+                if not histogram[1:].any():
+                    background_patches += 1
+                patch_img_name = f'{base_img_name}_{i}_{j}_patch.png'
+                img_patch_path = os.path.join(output_dir, 'img_patches', patch_img_name)
+                mask_patch_path = os.path.join(output_dir, 'gt_patches', patch_img_name)
 
-                    # img_patch_path = os.path.join(output_dir, 'img_patches', f'{img_name[:-4]}_patch_{i}_{j}{img_name[-4:]}')
-                    # mask_patch_path = os.path.join(output_dir, 'gt_patches', f'{mask_name[:-4]}_patch_{i}_{j}{mask_name[-4:]}')
-                    safe_imsave(img_patch_path, img_patch)
-                    safe_imsave(mask_patch_path, mask_patch)
-                    saved_patches += 1
-                else:
-                    skipped_patches += 1
+                # img_patch_path = os.path.join(output_dir, 'img_patches', f'{img_name[:-4]}_patch_{i}_{j}{img_name[-4:]}')
+                # mask_patch_path = os.path.join(output_dir, 'gt_patches', f'{mask_name[:-4]}_patch_{i}_{j}{mask_name[-4:]}')
+                safe_imsave(img_patch_path, img_patch)
+                safe_imsave(mask_patch_path, mask_patch)
+                histograms[patch_img_name] = histogram
+                saved_patches += 1
 
-    print(f"Processing completed: {saved_patches} patches saved, {skipped_patches} patches skipped due to irrelevance.")
+    save_patch_histograms(os.path.join(output_dir, histogram_file), histograms)
+    print(f"Processing completed: {saved_patches} patches saved, {background_patches} of them background only.")
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Preprocess images and masks into patches.")
@@ -10,6 +10,7 @@ sys.path.append(os.path.dirname(__file__))
 from model import ResNetUNet
 from data_prep import get_data_loaders
 from utils import calculate_metrics, cleanup_patch_files, cleanup_patch_files_by_identifier, determine_max_row_col, extract_image_identifier, map_color, extract_coordinates, stitch_patches_to_full_image_by_identifier
+from utils_run_model import vegetation_tile_mask
 
 def stitch_patches_to_full_image(patch_dir, image_size, patch_size=256):
     """
@@ -80,6 +81,54 @@ def save_segmentation(images, masks, outputs, image_names, save_dir, n_images=1)
             pred_mask_image.save(os.path.join(save_dir, pred_filename))
 
 
+def evaluate_vegetation_prefilter(model, test_loader, device, exg_threshold=0.05, min_vegetation_fraction=0.001, n_classes=3):
+    """
+    Measure how many test tiles the ExG vegetation pre-filter skips and how it changes the IoU.
+
+    The model is run on every tile; the filtered prediction marks skipped tiles as background,
+    which is what the inference service returns for them. IoU is accumulated over the whole split.
+
+    Returns:
+        dict: Skipped tile counts and the per-class IoU with and without the pre-filter.
+    """
+    intersection = {'full': np.zeros(n_classes), 'filtered': np.zeros(n_classes)}
+    union = {'full': np.zeros(n_classes), 'filtered': np.zeros(n_classes)}
+    tiles_total, tiles_skipped = 0, 0
+
+    with torch.no_grad():
+        for images, masks, _, _ in test_loader:
+            images = images.to(device)
+            masks = masks.to(device)
+
+            keep = vegetation_tile_mask(images, exg_threshold, min_vegetation_fraction)
+            preds = {'full': torch.argmax(model(images), dim=1)}
+            preds['filtered'] = preds['full'].clone()
+            preds['filtered'][~keep] = 0
+            tiles_total += images.size(0)
+            tiles_skipped += int((~keep).sum().item())
+
+            for variant, pred in preds.items():
+                for cls in range(n_classes):
+                    pred_cls, mask_cls = pred == cls, masks == cls
+                    intersection[variant][cls] += (pred_cls & mask_cls).sum().item()
+                    union[variant][cls] += (pred_cls | mask_cls).sum().item()
+
+    iou = {variant: (intersection[variant] + 1e-6) / (union[variant] + 1e-6) for variant in intersection}
+    report = {
+        'tiles_total': tiles_total,
+        'tiles_skipped': tiles_skipped,
+        'iou_full': iou['full'].tolist(),
+        'iou_filtered': iou['filtered'].tolist(),
+    }
+
+    print(f"Vegetation pre-filter (ExG > {exg_threshold}, min fraction {min_vegetation_fraction}): "
+          f"skipped {tiles_skipped} of {tiles_total} tiles ({100 * tiles_skipped / max(tiles_total, 1):.1f}%)")
+    for cls, class_name in enumerate(['Background', 'Sorghum', 'Weeds'][:n_classes]):
+        print(f"  {class_name} IoU: {iou['full'][cls]:.4f} -> {iou['filtered'][cls]:.4f} ({iou['filtered'][cls] - iou['full'][cls]:+.4f})")
+
+    return report
+
+
 def main():
     # Define the base path relative to the current working directory
     base_path = os.getcwd()
@@ -147,6 +196,9 @@ def main():
     for key in all_metrics:
         average_metric = np.mean(all_metrics[key])
         print(f'Average {key}: {average_metric}')
+
+    # Report the tiles skipped by the inference pre-filter and its IoU impact on the test split
+    evaluate_vegetation_prefilter(model, test_loader, device)
     
     # Extract unique identifiers for all processed images based on saved patches
     image_identifiers = set(extract_image_identifier(f) for f in os.listdir(save_dir) if f.endswith('_predicted.png'))
@@ -1,3 +1,4 @@
+import csv
 import gc
 import os
 import numpy as np
@@ -61,6 +62,39 @@ def rgb_to_index(mask, tolerance=10):
 
     return index_mask
 
+def compute_class_histogram(mask_patch, n_classes=3):
+    """
+    Count the pixels of each class in a mask patch.
+
+    Parameters:
+    - mask_patch: RGB(A) ground truth patch, or a 2-D mask that already holds class indices.
+    - n_classes: Number of segmentation classes.
+
+    Returns:
+    - Array of length n_classes with the pixel count of each class.
+    """
+    if mask_patch.ndim == 2:
+        index_mask = mask_patch.astype(np.int64)
+        index_mask = index_mask[(index_mask >= 0) & (index_mask < n_classes)]
+    else:
+        index_mask = rgb_to_index(mask_patch[:, :, :3].astype(np.int16))
+    return np.bincount(index_mask.ravel(), minlength=n_classes)[:n_classes]
+
+def save_patch_histograms(path, histograms):
+    """
+    Write the per-patch class histograms computed during preprocessing to a CSV file
+    so the training data loaders can weight patches without decoding the masks again.
+
+    Parameters:
+    - path: Destination CSV file.
+    - histograms: Dict mapping patch file name to its class histogram.
+    """
+    with open(path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["Patch", "Background", "Sorghum", "Weeds"])  # Header
+        for patch_name, histogram in histograms.items():
+            writer.writerow([patch_name, *(int(count) for count in histogram)])
+
 def calculate_metrics(outputs, masks, n_classes):
     # Convert outputs to binary format
     preds = torch.argmax(outputs, dim=1)
@@ -1,44 +1,92 @@
-from skimage.io import imread
 import numpy as np
+from scipy import ndimage
 
-def calculate_pixel_ratio(processed_image_path):
-    # Load the image using scikit-image
-    image_path = processed_image_path
-    image = imread(image_path)
+CLASS_NAMES = ['background', 'sorghum', 'weeds']
+WEED_CLASS = 2
+# Class index for pixels that are not part of the analysed area (image padding, outside the field)
+OUTSIDE_CLASS = 3
 
-    # Define the RGB color codes for the classes
-    colors = {
-        'background': np.array([195, 195, 195]),
-        'sorghum': np.array([31, 119, 189]),
-        'weeds': np.array([255, 127, 14]),
-    }
+# RGB colors of the generated image, indexed by class
+CLASS_COLORS = np.array([
+    [195, 195, 195],  # Background
+    [31, 119, 189],   # Sorghum
+    [255, 127, 14],   # Weeds
+    [0, 0, 0]         # Outside
+], dtype=np.uint8)
 
-    # Initialize a dictionary to hold the count of pixels for each class
-    class_pixel_count = {
-        'background': 0,
-        'sorghum': 0,
-        'weeds': 0,
-    }
+def colorize_class_map(class_map):
+    """Map a class-index map to the RGB colors of the generated image."""
+    return CLASS_COLORS[class_map]
+
+def calculate_class_statistics(class_map, patch_size=256, min_weed_patch_size=50, max_weed_patches=200):
+    """
+    Compute the class statistics of a stitched prediction directly from its class-index map.
+
+    Pixels with OUTSIDE_CLASS are ignored, so the percentages refer to the analysed area only.
 
-    # Let's first check the shape of the image to ensure it's in the expected format
-    image_shape = image.shape
+    Args:
+        class_map (np.array): uint8 class-index map whose sides are multiples of patch_size.
+        patch_size (int): Size of the inference tiles, used for the per-tile weed density.
+        min_weed_patch_size (int): Connected weed areas smaller than this (in pixels) are ignored.
+        max_weed_patches (int): Maximum number of weed patches listed, largest first.
 
-    # Display the shape of the image and also check if the image has an alpha channel
-    image_shape, image[0,0,:], np.unique(image.reshape(-1, image.shape[2]), axis=0)
+    Returns:
+        dict: Class percentages ('background', 'sorghum', 'weeds'), pixel counts, the weed
+        percentage of every tile and the sizes and bounding boxes of connected weed patches.
+    """
+    counts = np.bincount(class_map.ravel(), minlength=OUTSIDE_CLASS + 1)
+    total_pixels = int(counts[:OUTSIDE_CLASS].sum())
+
+    statistics = {name: float(counts[cls]) / max(total_pixels, 1) * 100 for cls, name in enumerate(CLASS_NAMES)}
+    statistics['pixel_counts'] = {name: int(counts[cls]) for cls, name in enumerate(CLASS_NAMES)}
+    statistics['total_pixels'] = total_pixels
+
+    # Weed percentage of every tile's analysed pixels, laid out as rows x columns of tiles
+    num_rows, num_cols = class_map.shape[0] // patch_size, class_map.shape[1] // patch_size
+    tiles = class_map.reshape(num_rows, patch_size, num_cols, patch_size)
+    weed_pixels = (tiles == WEED_CLASS).sum(axis=(1, 3))
+    valid_pixels = (tiles != OUTSIDE_CLASS).sum(axis=(1, 3))
+    tile_weed_density = np.divide(weed_pixels * 100.0, valid_pixels, out=np.zeros(weed_pixels.shape), where=valid_pixels > 0)
+    statistics['tile_weed_density'] = np.round(tile_weed_density, 2).tolist()
+
+    # Connected weed patches with their size and bounding box (min_row, min_col, max_row, max_col)
+    labels, _ = ndimage.label(class_map == WEED_CLASS)
+    sizes = np.bincount(labels.ravel())[1:]
+    weed_patches = [
+        {'size': int(size), 'bbox': [bbox[0].start, bbox[1].start, bbox[0].stop, bbox[1].stop]}
+        for size, bbox in zip(sizes, ndimage.find_objects(labels))
+        if size >= min_weed_patch_size
+    ]
+    weed_patches.sort(key=lambda weed_patch: weed_patch['size'], reverse=True)
+    statistics['weed_patches'] = {
+        'count': len(weed_patches),
+        'mean_size': float(np.mean([weed_patch['size'] for weed_patch in weed_patches])) if weed_patches else 0.0,
+        'max_size': weed_patches[0]['size'] if weed_patches else 0,
+        'patches': weed_patches[:max_weed_patches],
+    }
 
-    # Adjust the colors to ignore the alpha channel and account for slight variations in color
-    def count_pixels(image, color):
-        # Create a mask that matches the color within a tolerance
-        color_mask = np.all(np.abs(image[:, :, :3] - color[:3]) <= 10, axis=-1)
-        return np.sum(color_mask)
+    return statistics
 
-    # Recalculate the pixel counts for each class
-    class_pixel_count = {class_name: count_pixels(image, color) for class_name, color in colors.items()}
+def vegetation_tile_mask(images, exg_threshold=0.05, min_vegetation_fraction=0.001):
+    """
+    Flag the tiles of a batch that contain green vegetation, using the Excess Green index
+    (ExG = 2g - r - b on chromatic coordinates) computed for the whole batch at once.
 
-    # Calculate total number of pixels
-    total_pixels = image_shape[0] * image_shape[1]
+    Tiles without vegetation (plain soil, padding, areas outside the field) can be marked
+    as background without running the segmentation network.
 
-    # Calculate the percentage of each class in the image
-    class_percentage = {class_name: (pixel_count / total_pixels) * 100 for class_name, pixel_count in class_pixel_count.items()}
+    Args:
+        images (torch.Tensor): Batch of RGB tiles with shape (N, 3, H, W) and values in [0, 1].
+        exg_threshold (float): ExG value above which a pixel counts as vegetation.
+        min_vegetation_fraction (float): Fraction of vegetation pixels a tile needs to be processed.
 
-    return class_percentage
+    Returns:
+        torch.Tensor: Boolean tensor of shape (N,), True for tiles that need the network.
+    """
+    rgb = images[:, :3].float()
+    # Chromatic coordinates make the index independent of illumination; black padding stays at 0
+    chromatic = rgb / rgb.sum(dim=1, keepdim=True).clamp_min(1e-6)
+    r, g, b = chromatic.unbind(dim=1)
+    exg = 2 * g - r - b
+    vegetation_fraction = (exg > exg_threshold).float().mean(dim=(1, 2))
+    return vegetation_fraction >= min_vegetation_fraction
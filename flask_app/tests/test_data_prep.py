@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+from model_components.data_prep import SorghumDataset, default_samples_per_epoch, get_patch_sampling_weights
+from model_components.utils import compute_class_histogram
+
+BACKGROUND, SORGHUM, WEEDS = [195, 195, 195], [31, 119, 180], [255, 127, 14]
+
+
+class ClassHistogramTests(unittest.TestCase):
+
+    def test_rgb_mask(self):
+        mask = np.array([[BACKGROUND, SORGHUM], [WEEDS, WEEDS]], dtype=np.uint8)
+        self.assertEqual(compute_class_histogram(mask).tolist(), [1, 1, 2])
+
+    def test_index_mask(self):
+        # 2-D masks hold class indices, values outside the classes are not counted
+        mask = np.array([[0, 1], [2, 2], [2, 7]], dtype=np.uint8)
+        self.assertEqual(compute_class_histogram(mask).tolist(), [1, 1, 3])
+
+    def test_dataset_uses_the_shared_helper(self):
+        dataset = SorghumDataset.__new__(SorghumDataset)
+        mask = np.array([[0, 1], [2, 2]], dtype=np.uint8)
+        self.assertEqual(dataset.class_histogram(mask).tolist(), [1, 1, 2])
+
+
+class PatchSamplingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.histograms = [
+            np.array([100, 0, 0]),  # Background only
+            np.array([90, 10, 0]),  # Sorghum
+            np.array([50, 0, 3]),   # A few weed pixels
+            np.array([40, 30, 30]), # Sorghum and weeds
+        ]
+
+    def test_patches_get_the_weight_of_their_highest_weighted_class(self):
+        self.assertEqual(get_patch_sampling_weights(self.histograms), [0.1, 1.0, 4.0, 4.0])
+
+    def test_classes_below_min_pixels_are_ignored(self):
+        self.assertEqual(get_patch_sampling_weights(self.histograms, min_pixels=5), [0.1, 1.0, 0.1, 4.0])
+
+    def test_classes_without_weight_fall_back_to_background(self):
+        class_weights = {0: 0.5, 2: 2.0}
+        self.assertEqual(get_patch_sampling_weights(self.histograms, class_weights), [0.5, 0.5, 2.0, 2.0])
+
+    def test_samples_per_epoch_counts_patches_with_crops_or_weeds(self):
+        self.assertEqual(default_samples_per_epoch(self.histograms), 3)
+
+    def test_samples_per_epoch_of_background_only_patches(self):
+        self.assertEqual(default_samples_per_epoch([np.array([100, 0, 0])] * 2), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
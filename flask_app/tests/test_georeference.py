@@ -0,0 +1,118 @@
+import json
+import math
+import unittest
+import numpy as np
+from model_components.georeference import (
+    METERS_PER_DEGREE_LAT,
+    METERS_PER_DEGREE_LON,
+    field_mask_for_image,
+    ground_sample_distance,
+    parse_polygons,
+    project_ring_to_pixels,
+    tile_coverage,
+)
+
+# Image center on the equator, where a degree of longitude has its full length
+CENTER_LAT, CENTER_LON = 0.0, 10.0
+IMAGE_SIZE = (1000, 1000)
+# 50 m above ground with a 90 degree lens covers 100 m, 0.1 m per pixel
+ALTITUDE, HFOV = 50.0, 90.0
+
+
+def square_ring(half_size_m, east_m=0.0, north_m=0.0):
+    """Ring of (lon, lat) coordinates of a square on the ground around an offset from the image center."""
+    corners = [(-1, -1), (1, -1), (1, 1), (-1, 1), (-1, -1)]
+    return [
+        [CENTER_LON + (east_m + dx * half_size_m) / METERS_PER_DEGREE_LON, CENTER_LAT + (north_m + dy * half_size_m) / METERS_PER_DEGREE_LAT]
+        for dx, dy in corners
+    ]
+
+
+class GroundSampleDistanceTests(unittest.TestCase):
+
+    def test_footprint_width_divided_by_the_image_width(self):
+        self.assertAlmostEqual(ground_sample_distance(ALTITUDE, IMAGE_SIZE[1], HFOV), 0.1)
+        self.assertAlmostEqual(ground_sample_distance(100.0, 2000, 60.0), 2 * 100 * math.tan(math.radians(30)) / 2000)
+
+
+class ProjectRingTests(unittest.TestCase):
+
+    def test_north_up_projection(self):
+        rows, cols = project_ring_to_pixels(square_ring(10), CENTER_LAT, CENTER_LON, 0.1, IMAGE_SIZE)
+
+        # 10 m are 100 pixels, north is up (lower rows)
+        np.testing.assert_allclose(rows, [600, 600, 400, 400, 600], atol=1e-6)
+        np.testing.assert_allclose(cols, [400, 600, 600, 400, 400], atol=1e-6)
+
+    def test_heading_rotates_the_image_frame(self):
+        # With the top of the image pointing east, a point east of the center appears above it
+        rows, cols = project_ring_to_pixels([[CENTER_LON + 10 / METERS_PER_DEGREE_LON, CENTER_LAT]], CENTER_LAT, CENTER_LON, 0.1, IMAGE_SIZE, heading=90)
+        np.testing.assert_allclose(rows, [400], atol=1e-6)
+        np.testing.assert_allclose(cols, [500], atol=1e-6)
+
+
+class FieldMaskTests(unittest.TestCase):
+
+    def polygon(self, *rings):
+        return {'type': 'Polygon', 'coordinates': list(rings)}
+
+    def test_field_inside_the_footprint(self):
+        mask = field_mask_for_image(self.polygon(square_ring(10)), CENTER_LAT, CENTER_LON, ALTITUDE, IMAGE_SIZE, HFOV)
+
+        rows, cols = np.nonzero(mask)
+        self.assertEqual(mask.shape, IMAGE_SIZE)
+        self.assertEqual((rows.min(), rows.max()), (400, 600))
+        self.assertEqual((cols.min(), cols.max()), (400, 600))
+
+    def test_field_covering_the_footprint(self):
+        mask = field_mask_for_image(self.polygon(square_ring(100)), CENTER_LAT, CENTER_LON, ALTITUDE, IMAGE_SIZE, HFOV)
+        self.assertTrue(mask.all())
+
+    def test_field_outside_the_footprint(self):
+        # The image covers 50 m to each side of its center
+        mask = field_mask_for_image(self.polygon(square_ring(10, east_m=80)), CENTER_LAT, CENTER_LON, ALTITUDE, IMAGE_SIZE, HFOV)
+        self.assertFalse(mask.any())
+
+    def test_higher_flight_shrinks_the_field_in_the_image(self):
+        mask = field_mask_for_image(self.polygon(square_ring(10)), CENTER_LAT, CENTER_LON, 2 * ALTITUDE, IMAGE_SIZE, HFOV)
+
+        rows, cols = np.nonzero(mask)
+        self.assertEqual((rows.min(), rows.max()), (450, 550))
+        self.assertEqual((cols.min(), cols.max()), (450, 550))
+
+    def test_holes_are_excluded(self):
+        mask = field_mask_for_image(self.polygon(square_ring(20), square_ring(5)), CENTER_LAT, CENTER_LON, ALTITUDE, IMAGE_SIZE, HFOV)
+
+        self.assertTrue(mask[320, 500])
+        self.assertFalse(mask[500, 500])
+
+    def test_multipolygon_from_json(self):
+        geometry = json.dumps({'type': 'MultiPolygon', 'coordinates': [[square_ring(5, east_m=-20)], [square_ring(5, east_m=20)]]})
+        mask = field_mask_for_image(geometry, CENTER_LAT, CENTER_LON, ALTITUDE, IMAGE_SIZE, HFOV)
+
+        self.assertTrue(mask[500, 300])
+        self.assertTrue(mask[500, 700])
+        self.assertFalse(mask[500, 500])
+
+    def test_altitude_must_be_above_ground(self):
+        with self.assertRaises(ValueError):
+            field_mask_for_image(self.polygon(square_ring(10)), CENTER_LAT, CENTER_LON, 0.0, IMAGE_SIZE, HFOV)
+
+    def test_unsupported_geometry(self):
+        with self.assertRaises(ValueError):
+            parse_polygons({'type': 'Point', 'coordinates': [CENTER_LON, CENTER_LAT]})
+
+
+class TileCoverageTests(unittest.TestCase):
+
+    def test_partial_tiles_are_padded(self):
+        field_mask = np.zeros((3, 4), dtype=bool)
+        field_mask[:2, :2] = True
+        field_mask[2, 3] = True
+
+        # The last tile row only has one image row, the padding is outside the field
+        np.testing.assert_allclose(tile_coverage(field_mask, patch_size=2), [[1.0, 0.0], [0.0, 0.25]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+from model_components.utils_run_model import OUTSIDE_CLASS, calculate_class_statistics
+
+
+class CalculateClassStatisticsTests(unittest.TestCase):
+
+    def setUp(self):
+        # 2x2 tiles of 2x2 pixels: background/sorghum with one outside pixel, all weeds,
+        # all outside (padding) and a mixed tile with a single weed pixel
+        self.class_map = np.array([
+            [0, 0, 2, 2],
+            [1, 3, 2, 2],
+            [3, 3, 0, 1],
+            [3, 3, 1, 2],
+        ], dtype=np.uint8)
+
+    def test_percentages_ignore_outside_pixels(self):
+        statistics = calculate_class_statistics(self.class_map, patch_size=2, min_weed_patch_size=1)
+
+        self.assertEqual(statistics['total_pixels'], 11)
+        self.assertEqual(statistics['pixel_counts'], {'background': 3, 'sorghum': 3, 'weeds': 5})
+        self.assertAlmostEqual(statistics['background'], 3 / 11 * 100)
+        self.assertAlmostEqual(statistics['sorghum'], 3 / 11 * 100)
+        self.assertAlmostEqual(statistics['weeds'], 5 / 11 * 100)
+
+    def test_tile_weed_density(self):
+        statistics = calculate_class_statistics(self.class_map, patch_size=2, min_weed_patch_size=1)
+
+        # The padding tile has no analysed pixels and gets a density of 0
+        self.assertEqual(statistics['tile_weed_density'], [[0.0, 100.0], [0.0, 25.0]])
+
+    def test_connected_weed_patches(self):
+        statistics = calculate_class_statistics(self.class_map, patch_size=2, min_weed_patch_size=1)
+
+        weed_patches = statistics['weed_patches']
+        self.assertEqual(weed_patches['count'], 2)
+        self.assertEqual(weed_patches['max_size'], 4)
+        self.assertAlmostEqual(weed_patches['mean_size'], 2.5)
+        # Largest first, bounding boxes as min_row, min_col, max_row, max_col (exclusive)
+        self.assertEqual(weed_patches['patches'], [
+            {'size': 4, 'bbox': [0, 2, 2, 4]},
+            {'size': 1, 'bbox': [3, 3, 4, 4]},
+        ])
+
+    def test_small_and_surplus_weed_patches_are_dropped(self):
+        statistics = calculate_class_statistics(self.class_map, patch_size=2, min_weed_patch_size=2)
+        self.assertEqual(statistics['weed_patches']['count'], 1)
+
+        statistics = calculate_class_statistics(self.class_map, patch_size=2, min_weed_patch_size=1, max_weed_patches=1)
+        self.assertEqual(statistics['weed_patches']['count'], 2)
+        self.assertEqual([weed_patch['size'] for weed_patch in statistics['weed_patches']['patches']], [4])
+
+    def test_map_without_analysed_pixels(self):
+        statistics = calculate_class_statistics(np.full((4, 4), OUTSIDE_CLASS, dtype=np.uint8), patch_size=2)
+
+        self.assertEqual(statistics['total_pixels'], 0)
+        self.assertEqual(statistics['weeds'], 0.0)
+        self.assertEqual(statistics['weed_patches'], {'count': 0, 'mean_size': 0.0, 'max_size': 0, 'patches': []})
+
+
+if __name__ == '__main__':
+    unittest.main()